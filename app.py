@@ -1,171 +1,279 @@
-from flask import Flask, render_template, redirect, url_for, flash, abort, request, send_file
+from flask import Flask, render_template, redirect, url_for, flash, abort, request, Response, current_app, stream_with_context
 from flask_bootstrap import Bootstrap5
 from flask_ckeditor import CKEditor
-from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy.orm import relationship, DeclarativeBase, Mapped, mapped_column
-from sqlalchemy import Integer, String, Text, Float, Boolean
-from flask_login import UserMixin, login_user, LoginManager, current_user, logout_user
+from sqlalchemy.orm import selectinload, joinedload, contains_eager
+from sqlalchemy.exc import IntegrityError
+from flask_login import login_user, LoginManager, current_user, logout_user
 from forms import *
+from models import db, UserAccount, User, Course, Enrollment, CourseMaterial, Assignments, Grade, Submission, Job
+from migrations import upgrade_schema
+from database import database_url, engine_options, configure_engine
+from file_delivery import init_file_delivery, deliver_file
+from uploads import init_uploads, save_upload
+from upload_processing import is_quarantined
+import assets
+import exports
+import jobs
+import metrics
+import notifications
+import scheduler
+import search
+import site_statistics
+import submission_ingest
+from passwords import hash_password, hash_passwords, verify_password, is_hashed
+import identity_cache
+from pagination import paginate, page_size, search_filter
+import bulk_import
+import course_progress
+import gradebook
+import page_cache
+import rate_limits
+from page_cache import cached_page
+from routing import Routes
+import click
 from functools import wraps
+import hmac
+import json
 import os
+from urllib.parse import quote
+from werkzeug.middleware.proxy_fix import ProxyFix
 from werkzeug.utils import secure_filename
 
-app = Flask(__name__)
-app.config['SECRET_KEY'] = '8BYkEfBA6O6donzWlSihBXox7C0sKR6b'
-Bootstrap5(app)
+bootstrap = Bootstrap5()
 login_manager = LoginManager()
-login_manager.init_app(app)
-ckeditor = CKEditor(app)
-
-UPLOAD_COURSES_FOLDER = "static/uploads/courses"
-app.config['UPLOAD_COURSES_FOLDER'] = UPLOAD_COURSES_FOLDER
-
-
-# Create database
-class Base(DeclarativeBase):
-    pass
-
-
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///learning-system.db'
-db = SQLAlchemy(model_class=Base)
-db.init_app(app)
+ckeditor = CKEditor()
+routes = Routes()
+
+
+def create_app(config=None):
+    """Build the application; ``config`` overrides settings before the extensions read them.
+
+    WSGI servers load it from wsgi.py and ASGI servers from asgi.py, once per
+    worker process, and ``flask --app app`` calls it for the CLI commands.
+    """
+    app = Flask(__name__)
+    app.config['SECRET_KEY'] = '8BYkEfBA6O6donzWlSihBXox7C0sKR6b'
+    # Production databases are created and upgraded with `flask --app app upgrade-db`
+    app.config['CREATE_TABLES'] = os.environ.get("LMS_CREATE_TABLES", "on").lower() not in ("0", "false", "no", "off")
+    app.config.update(config or {})
+
+    # Behind a reverse proxy, rate limits need the client's address from X-Forwarded-For
+    proxies = int(os.environ.get("LMS_PROXY_COUNT", 0))
+    if proxies:
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=proxies, x_proto=proxies, x_host=proxies)
+
+    bootstrap.init_app(app)
+    login_manager.init_app(app)
+    ckeditor.init_app(app)
+    assets.init_assets(app)
+
+    metrics.init_metrics(app)
+    rate_limits.init_rate_limits(app)
+    init_file_delivery(app)
+    init_uploads(app)
+    identity_cache.init_identity_cache(app)
+    page_cache.init_page_cache(app)
+    exports.init_exports(app)
+
+    # Create database
+    app.config.setdefault('SQLALCHEMY_DATABASE_URI', database_url())
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', engine_options(app.config['SQLALCHEMY_DATABASE_URI']))
+    db.init_app(app)
+
+    with app.app_context():
+        configure_engine(db.engine)
+        metrics.instrument_engine(db.engine)
+        if app.config['CREATE_TABLES']:
+            db.create_all()
+
+    jobs.init_jobs(app)
+    submission_ingest.init_submission_ingest(app)
+    notifications.init_notifications(app)
+    scheduler.init_scheduler(app)
+    routes.init_app(app)
+    return app
 
 
 @login_manager.user_loader
 def load_user(user_id):
-    return db.get_or_404(User, user_id)
-
-
-class UserAccount(db.Model, UserMixin):
-    __tablename__ = "user_account"
-    user_id: Mapped[int] = mapped_column(Integer, db.ForeignKey("user.id"), primary_key=True)
-    username: Mapped[str] = mapped_column(String(100), nullable=False, unique=True)
-    password: Mapped[str] = mapped_column(String(100), nullable=False)
-
-    user = relationship("User", back_populates="account")
-
-
-class User(UserMixin, db.Model):
-    __tablename__ = "user"
-    id: Mapped[int] = mapped_column(Integer, primary_key=True)
-    name: Mapped[str] = mapped_column(String(100), nullable=False)
-    age: Mapped[int] = mapped_column(Integer)
-    phone_number: Mapped[str] = mapped_column(String(10), unique=True)
-    email: Mapped[str] = mapped_column(String(100), unique=True)
-    status: Mapped[str] = mapped_column(String(20), nullable=False)
-
-    account = relationship("UserAccount", back_populates="user", uselist=False, cascade="all, delete-orphan")
-    teaching_course = relationship("Course", back_populates="instructor", cascade="all, delete-orphan")
-    enrollment = relationship("Enrollment", back_populates="student", cascade="all, delete-orphan")
-    grade = relationship("Grade", back_populates="student", cascade="all, delete-orphan")
-    submissions = relationship("Submission", back_populates="student", cascade="all, delete-orphan")
-
-
-class Course(db.Model):
-    __tablename__ = "course"
-    id: Mapped[int] = mapped_column(Integer, primary_key=True)
-    name: Mapped[str] = mapped_column(String(250), unique=True, nullable=False)
-    instructor_id: Mapped[int] = mapped_column(Integer, db.ForeignKey("user.id"))
-
-    instructor = relationship("User", back_populates="teaching_course")
-    enrollment = relationship("Enrollment", back_populates="course", cascade="all, delete-orphan")
-    material = relationship("CourseMaterial", back_populates="course", cascade="all, delete-orphan")
-    assignment = relationship("Assignments", back_populates="course", cascade="all, delete-orphan")
-    grade = relationship("Grade", back_populates="course", cascade="all, delete-orphan")
+    return identity_cache.load_user(user_id)
 
 
-class Enrollment(db.Model):
-    __tablename__ = "enrollment"
-    id: Mapped[int] = mapped_column(Integer, primary_key=True)
-    course_id: Mapped[int] = mapped_column(Integer, db.ForeignKey("course.id"))
-    student_id: Mapped[int] = mapped_column(Integer, db.ForeignKey("user.id"))
-
-    course = relationship("Course", back_populates="enrollment")
-    student = relationship("User", back_populates="enrollment")
-
-
-class CourseMaterial(db.Model):
-    __tablename__ = "course_material"
-    id: Mapped[int] = mapped_column(Integer, primary_key=True)
-    course_id: Mapped[int] = mapped_column(Integer, db.ForeignKey("course.id"))
-    file_name: Mapped[str] = mapped_column(String(100), nullable=False)
-    file_path: Mapped[str] = mapped_column(String(250), nullable=False)
-    description: Mapped[str] = mapped_column(String(500), nullable=True)
-
-    course = relationship("Course", back_populates="material")
-
+@routes.command("upgrade-db")
+def upgrade_db():
+    """Create missing tables and apply pending schema migrations (indexes, columns)."""
+    db.create_all()
+    try:
+        applied = upgrade_schema(db.engine, db.metadata)
+    except IntegrityError as error:
+        raise click.ClickException(f"Migration failed, remove the duplicate rows first: {error.orig}")
 
-class Assignments(db.Model):
-    __tablename__ = "assignments"
-    id: Mapped[int] = mapped_column(Integer, primary_key=True)
-    course_id: Mapped[int] = mapped_column(Integer, db.ForeignKey("course.id"))
-    title: Mapped[str] = mapped_column(String(100), nullable=False)
-    text: Mapped[str] = mapped_column(String(1000), nullable=False)
-    file_name: Mapped[str] = mapped_column(String(100), nullable=True)
-    file_path: Mapped[str] = mapped_column(String(250), nullable=True)
-    assignment_type: Mapped[int] = mapped_column(Integer, nullable=False)
-    deadline: Mapped[str] = mapped_column(String(15), nullable=False)
+    if applied:
+        click.echo(f"Applied migrations: {', '.join(map(str, applied))}")
+    else:
+        click.echo("Database schema is up to date.")
+
+
+@routes.command("run-worker")
+@click.option("--concurrency", default=2, show_default=True, help="Number of worker threads.")
+@click.option("--burst", is_flag=True, help="Exit once the queue is empty instead of waiting for new jobs.")
+def run_worker(concurrency, burst):
+    """Run background jobs (upload post-processing) until interrupted."""
+    pool = jobs.WorkerPool(current_app._get_current_object(), concurrency, burst)
+    pool.start()
+    click.echo(f"Started {concurrency} job workers.")
+    try:
+        pool.join()
+    except KeyboardInterrupt:
+        click.echo("Stopping after the running jobs finish...")
+        pool.shutdown()
+
+    click.echo(f"Processed {pool.processed} jobs.")
+
+
+@routes.command("run-scheduler")
+@click.option("--once", is_flag=True, help="Run every task once, due or not, and exit (for cron).")
+def run_scheduler(once):
+    """Run the periodic tasks (deadline reminders) until interrupted."""
+    if once:
+        finished = scheduler.run_due_tasks(scheduler.scheduler_id(), force=True)
+        click.echo(f"Ran {', '.join(finished) or 'no tasks'}.")
+        return
+
+    periodic = scheduler.Scheduler(current_app._get_current_object())
+    periodic.start()
+    click.echo(f"Scheduler started with tasks: {', '.join(sorted(scheduler.TASKS))}.")
+    try:
+        periodic.join()
+    except KeyboardInterrupt:
+        click.echo("Stopping after the running task finishes...")
+        periodic.shutdown()
+
+
+@routes.command("build-assets")
+def build_assets():
+    """Compress the static files ahead of time, so no request has to."""
+    count = assets.build_assets(current_app._get_current_object())
+    click.echo(f"Compressed {count} static files.")
+
+
+@routes.command("reindex-search")
+def reindex_search():
+    """Rebuild the full-text search index from the materials, assignments and submissions."""
+    with db.engine.begin() as connection:
+        if not search.is_supported(connection):
+            raise click.ClickException("Full-text search needs an SQLite database.")
+        count = search.reindex(connection)
+
+    click.echo(f"Indexed {count} documents.")
+
+
+@routes.command("reconcile-stats")
+def reconcile_stats():
+    """Rebuild the admin statistics counters from the source tables."""
+    with db.engine.begin() as connection:
+        site_statistics.reconcile(connection)
+
+    click.echo("Statistics rebuilt.")
+
+
+@routes.command("rebuild-progress")
+def rebuild_progress():
+    """Recompute every student's course progress from the source tables."""
+    with db.engine.begin() as connection:
+        course_progress.rebuild(connection)
+
+    click.echo("Course progress rebuilt.")
+
+
+@routes.command("hash-passwords")
+@click.option("--batch-size", default=500, help="Accounts hashed and committed per batch.")
+def hash_plaintext_passwords(batch_size):
+    """Replace the plaintext passwords still stored in user_account with hashes."""
+    last_id = 0
+    upgraded = 0
+
+    while True:
+        accounts = db.session.execute(
+            db.select(UserAccount.user_id, UserAccount.password)
+            .where(UserAccount.user_id > last_id)
+            .order_by(UserAccount.user_id)
+            .limit(batch_size)
+        ).all()
+        if not accounts:
+            break
+        last_id = accounts[-1].user_id
+
+        plaintext = [account for account in accounts if not is_hashed(account.password)]
+        hashes = hash_passwords([account.password for account in plaintext])
+        if plaintext:
+            db.session.execute(
+                db.update(UserAccount),
+                [{"user_id": account.user_id, "password": hashed} for account, hashed in zip(plaintext, hashes)]
+            )
+            db.session.commit()
+            upgraded += len(plaintext)
 
-    course = relationship("Course", back_populates="assignment")
-    submissions = relationship("Submission", back_populates="assignment", cascade="all, delete-orphan")
-    grades = relationship("Grade", back_populates="assignment")
+    click.echo(f"Hashed {upgraded} plaintext passwords.")
 
 
-class Grade(db.Model):
-    __tablename__ = "grade"
-    id: Mapped[int] = mapped_column(Integer, primary_key=True)
-    student_id: Mapped[int] = mapped_column(Integer, db.ForeignKey("user.id"))
-    course_id: Mapped[int] = mapped_column(Integer, db.ForeignKey("course.id"))
-    assignment_id: Mapped[int] = mapped_column(Integer, db.ForeignKey("assignments.id"))  # Link to Assignments table
-    grade: Mapped[float] = mapped_column(Float, nullable=False)
+def echo_import_report(report):
+    click.echo(f"Imported {report.imported} rows, {len(report.errors)} errors.")
+    for line, message in report.errors:
+        click.echo(f"  line {line}: {message}")
 
-    student = relationship("User", back_populates="grade")
-    course = relationship("Course", back_populates="grade")
-    assignment = relationship("Assignments", back_populates="grades")
 
+@routes.command("import-users")
+@click.argument("csv_file", type=click.File("rb"))
+@click.option("--batch-size", default=bulk_import.DEFAULT_BATCH_SIZE)
+def import_users_command(csv_file, batch_size):
+    """Import users from a CSV file (username, password, name, email, phone_number, age, status)."""
+    echo_import_report(bulk_import.import_users(csv_file, batch_size))
 
-class Submission(db.Model):
-    __tablename__ = "submission"
-    id: Mapped[int] = mapped_column(Integer, primary_key=True)
-    assignment_id: Mapped[int] = mapped_column(Integer, db.ForeignKey("assignments.id"))
-    student_id: Mapped[int] = mapped_column(Integer, db.ForeignKey("user.id"))
-    content: Mapped[str] = mapped_column(Text, nullable=True)
-    file_name: Mapped[str] = mapped_column(String(100), nullable=True)
-    file_path: Mapped[str] = mapped_column(String(250), nullable=True)
-    is_graded: Mapped[bool] = mapped_column(Boolean, default=False)
 
-    assignment = relationship("Assignments", back_populates="submissions")
-    student = relationship("User", back_populates="submissions")
-
-
-with app.app_context():
-    db.create_all()
+@routes.command("import-enrollments")
+@click.argument("csv_file", type=click.File("rb"))
+@click.option("--batch-size", default=bulk_import.DEFAULT_BATCH_SIZE)
+def import_enrollments_command(csv_file, batch_size):
+    """Enroll students from a CSV file (course, username)."""
+    echo_import_report(bulk_import.import_enrollments(csv_file, batch_size))
 
 
-@app.route('/')
+@routes.route('/')
 def welcome():
     return render_template("welcome.html")
 
 
-@app.route('/login', methods=["GET", "POST"])
+@routes.route('/login', methods=["GET", "POST"])
 def log_in():
     form = LoginForm()
 
     if form.validate_on_submit():
         username = form.username.data
         password = form.password.data
-        result = db.session.execute(db.select(UserAccount).where(UserAccount.username == username))
-        user_details = result.scalar()
+        # Account and user in one round trip
+        result = db.session.execute(
+            db.select(UserAccount, User)
+            .join(User, User.id == UserAccount.user_id)
+            .where(UserAccount.username == username)
+        )
+        row = result.first()
 
-        if not user_details:
+        if not row:
             flash("Username does not exist. Please try again or register.", "error")
             return redirect(url_for('log_in'))
-        elif user_details.password != password:
+
+        user_details, user = row
+        matches, needs_rehash = verify_password(user_details.password, password)
+
+        if not matches:
             flash("Incorrect password. Please try again.", "error")
             return redirect(url_for('log_in'))
         else:
-            result_user = db.session.execute(db.select(User).where(User.id == user_details.user_id))
-            user = result_user.scalar()
+            if needs_rehash:
+                user_details.password = hash_password(password)
+                db.session.commit()
+
             login_user(user)
 
             if user.status == "admin":
@@ -178,7 +286,7 @@ def log_in():
     return render_template("login.html", form=form)
 
 
-@app.route('/register', methods=["GET", "POST"])
+@routes.route('/register', methods=["GET", "POST"])
 def register():
     form = RegisterForm()
 
@@ -219,7 +327,7 @@ def register():
         new_account = UserAccount(
             user_id=new_user.id,
             username=username,
-            password=password
+            password=hash_password(password)
         )
         db.session.add(new_account)
         db.session.commit()
@@ -262,28 +370,13 @@ def student_only(f):
     return decorated_function
 
 
-@app.route('/home')
+@routes.route('/home')
 def home():
     if not current_user.is_authenticated:
         return redirect(url_for('log_in'))
 
     if current_user.status == "admin":
-        # Extract statistics
-        total_students = db.session.execute(
-            db.select(db.func.count()).where(User.status == "student")
-        ).scalar()
-        total_instructors = db.session.execute(
-            db.select(db.func.count()).where(User.status == "instr")
-        ).scalar()
-        total_courses = db.session.execute(
-            db.select(db.func.count()).select_from(Course)
-        ).scalar()
-
-        stats = {
-            "students": total_students,
-            "instructors": total_instructors,
-            "courses": total_courses
-        }
+        stats = site_statistics.load_dashboard()
 
         return render_template("statistics.html", user=current_user, stats=stats)
     elif current_user.status == "instr":
@@ -294,14 +387,18 @@ def home():
         abort(403)
 
 
-@app.route('/profile', methods=["GET", "POST"])
+@routes.route('/profile', methods=["GET", "POST"])
 def profile():
-    user = db.get_or_404(User, current_user.id)
-    user_details = db.get_or_404(UserAccount, current_user.id)
-
     if not current_user.is_authenticated:
         abort(403)
 
+    row = db.session.execute(
+        db.select(User, UserAccount).join(UserAccount).where(User.id == current_user.id)
+    ).first()
+    if not row:
+        abort(404)
+    user, user_details = row
+
     if current_user.status in ["student", "instr"]:
         form = ProfileForm(
             name=user.name,
@@ -344,31 +441,101 @@ def profile():
         abort(403)
 
 
-@app.route('/students')
+def all_cache_stats():
+    return {
+        "identity": identity_cache.cache_stats(),
+        "gradebook": gradebook.gradebook_cache.stats(),
+        "pages": page_cache.cache_stats(),
+    }
+
+
+@routes.route('/cache_stats')
+@admin_only
+def cache_stats():
+    return all_cache_stats()
+
+
+@routes.route('/metrics')
+def metrics_page():
+    # Scrapers authenticate with LMS_METRICS_TOKEN, people with an admin session
+    token = os.environ.get("LMS_METRICS_TOKEN")
+    if not (token and hmac.compare_digest(request.headers.get("Authorization", ""), f"Bearer {token}")):
+        if not current_user.is_authenticated or current_user.status != "admin":
+            abort(403)
+
+    body = metrics.render(
+        caches=all_cache_stats(),
+        gauges={"lms_jobs": ("Background jobs by status.", "status", jobs.queue_stats())},
+    )
+    return Response(body, mimetype="text/plain; version=0.0.4")
+
+
+@routes.route('/slow_queries')
+@admin_only
+def slow_queries():
+    return {
+        "threshold_ms": metrics.SLOW_QUERY_SECONDS * 1000,
+        "statement_warning": metrics.QUERY_COUNT_WARNING,
+        "slow_statements": list(reversed(metrics.recent_slow_statements)),
+        "heavy_requests": list(reversed(metrics.recent_heavy_requests)),
+    }
+
+
+def people_page(status):
+    statement = db.select(User).where(User.status == status)
+
+    query = request.args.get("q", "").strip()
+    if query:
+        statement = statement.where(search_filter([User.name, User.email], query))
+
+    return paginate(statement, [User.name, User.id], request.args.get("after"), page_size())
+
+
+def person_json(person):
+    return {"id": person.id, "name": person.name, "email": person.email, "status": person.status}
+
+
+@routes.route('/students')
 @admin_only
 def see_all_students():
-    result = db.session.execute(db.select(User).where(User.status == "student"))
-    students = result.scalars().all()
+    page = people_page("student")
     return render_template(
         "people_list.html",
-        list=students,
+        list=page.items,
+        next_cursor=page.next_cursor,
+        query=request.args.get("q", ""),
         title="Students"
     )
 
 
-@app.route('/instructors')
+@routes.route('/api/students')
+@admin_only
+def students_json():
+    page = people_page("student")
+    return {"items": [person_json(student) for student in page.items], "next": page.next_cursor}
+
+
+@routes.route('/instructors')
 @admin_only
 def see_all_instructors():
-    result = db.session.execute(db.select(User).where(User.status == "instr"))
-    instructors = result.scalars().all()
+    page = people_page("instr")
     return render_template(
         "people_list.html",
-        list=instructors,
+        list=page.items,
+        next_cursor=page.next_cursor,
+        query=request.args.get("q", ""),
         title="Instructors"
     )
 
 
-@app.route('/change-password/<int:user_id>', methods=['GET', 'POST'])
+@routes.route('/api/instructors')
+@admin_only
+def instructors_json():
+    page = people_page("instr")
+    return {"items": [person_json(instructor) for instructor in page.items], "next": page.next_cursor}
+
+
+@routes.route('/change-password/<int:user_id>', methods=['GET', 'POST'])
 @admin_only
 def change_password(user_id):
     user_details = db.get_or_404(UserAccount, user_id)
@@ -377,7 +544,7 @@ def change_password(user_id):
 
     if form.validate_on_submit():
         new_password = form.newPassword.data
-        user_details.password = new_password
+        user_details.password = hash_password(new_password)
 
         db.session.commit()
 
@@ -389,7 +556,7 @@ def change_password(user_id):
     return render_template("change_password.html", form=form)
 
 
-@app.route('/view-profile/<int:user_id>')
+@routes.route('/view-profile/<int:user_id>')
 @admin_only
 def view_profile(user_id):
     user = db.get_or_404(User, user_id)
@@ -397,7 +564,7 @@ def view_profile(user_id):
     return render_template("view_profile.html", user=user)
 
 
-@app.route('/delete_user/<int:user_id>')
+@routes.route('/delete_user/<int:user_id>')
 @admin_only
 def delete_user(user_id):
     user = db.get_or_404(User, user_id)
@@ -410,7 +577,7 @@ def delete_user(user_id):
         return redirect(url_for('see_all_instructors'))
 
 
-@app.route('/courses', methods=["GET", "POST"])
+@routes.route('/courses', methods=["GET", "POST"])
 @admin_only
 def courses():
     form = CreateCourseForm()
@@ -419,7 +586,7 @@ def courses():
     instructors = [(instructor.id, instructor.name) for instructor in result]
     form.instructor.choices = instructors
 
-    course_list = db.session.execute(db.select(Course)).scalars().all()
+    page = course_page()
 
     if form.validate_on_submit():
         chosen_instructor = form.instructor.data
@@ -431,11 +598,59 @@ def courses():
 
         return redirect(url_for("courses"))
 
-    return render_template("courses.html", form=form, list=course_list)
+    return render_template(
+        "courses.html",
+        form=form,
+        list=page.items,
+        next_cursor=page.next_cursor,
+        query=request.args.get("q", "")
+    )
+
+
+def course_page():
+    statement = db.select(Course)
+
+    query = request.args.get("q", "").strip()
+    if query:
+        statement = statement.where(search_filter([Course.name], query))
+
+    return paginate(statement, [Course.name, Course.id], request.args.get("after"), page_size())
+
+
+@routes.route('/api/courses')
+@admin_only
+def courses_json():
+    page = course_page()
+    return {
+        "items": [
+            {"id": course.id, "name": course.name, "instructor_id": course.instructor_id}
+            for course in page.items
+        ],
+        "next": page.next_cursor
+    }
+
+
+@routes.route('/import', methods=["GET", "POST"])
+@admin_only
+def bulk_import_view():
+    form = BulkImportForm()
+    reports = {}
+
+    if form.validate_on_submit():
+        try:
+            if form.users_file.data:
+                reports["Users"] = bulk_import.import_users(form.users_file.data.stream)
+            if form.enrollments_file.data:
+                reports["Enrollments"] = bulk_import.import_enrollments(form.enrollments_file.data.stream)
+        except (ValueError, UnicodeDecodeError) as error:
+            flash(f"Could not read the CSV file: {error}", "error")
+
+    return render_template("bulk_import.html", form=form, reports=reports)
 
 
-@app.route('/details_course/<int:course_id>')
+@routes.route('/details_course/<int:course_id>')
 @admin_only
+@cached_page(page_cache.course_versions)
 def see_details_course(course_id):
     course = db.get_or_404(Course, course_id)
 
@@ -448,102 +663,150 @@ def see_details_course(course_id):
 
     instructor = db.get_or_404(User, course.instructor_id)
 
-    return render_template("see_details_course.html", title=course.name, students=students, instructor=instructor.name)
+    return render_template("see_details_course.html", title=course.name, course_id=course.id, students=students,
+                           instructor=instructor.name)
+
 
+def available_students(course_id):
+    """Students not yet enrolled in the course, as a single anti-join on the enrollment index."""
+    enrolled = db.select(Enrollment.id).where(Enrollment.course_id == course_id, Enrollment.student_id == User.id)
+    return db.select(User).where(User.status == "student", ~enrolled.exists())
 
-@app.route('/add_student_to_course/<int:course_id>', methods=["GET", "POST"])
+
+@routes.route('/api/courses/<int:course_id>/available_students')
+@admin_only
+def available_students_json(course_id):
+    statement = available_students(course_id)
+
+    query = request.args.get("q", "").strip()
+    if query:
+        statement = statement.where(search_filter([User.name, User.email], query))
+
+    page = paginate(statement, [User.name, User.id], request.args.get("after"), page_size())
+    return {"items": [person_json(student) for student in page.items], "next": page.next_cursor}
+
+
+@routes.route('/add_student_to_course/<int:course_id>', methods=["GET", "POST"])
 @admin_only
 def add_student_to_course(course_id):
     form = AddStudentToCourseForm()
     course = db.get_or_404(Course, course_id)
 
-    enrolled_students_ids = db.session.execute(db.select(Enrollment.student_id).where(Enrollment.course_id == course_id)).scalars().all()
-    available_students = db.session.execute(db.select(User).where(User.status == "student", User.id.not_in(enrolled_students_ids))).scalars().all()
-
-    form.student.choices = [(student.id, student.name) for student in available_students]
-
     if form.validate_on_submit():
-        chosen_student = form.student.data
-        new_enrollment = Enrollment(course_id=course_id, student_id=chosen_student)
-        db.session.add(new_enrollment)
-        db.session.commit()
+        chosen_student = db.session.execute(
+            available_students(course_id).where(User.id == form.student.data)
+        ).scalar_one_or_none()
 
-        return redirect(url_for("courses"))
+        if chosen_student is None:
+            flash("Choose a student who is not enrolled in this course yet.", "error")
+        else:
+            try:
+                db.session.add(Enrollment(course_id=course_id, student_id=chosen_student.id))
+                db.session.commit()
+            except IntegrityError:
+                db.session.rollback()
+                flash("This student is already enrolled in the course.", "error")
+            else:
+                return redirect(url_for("courses"))
 
-    return render_template("add_student_to_course.html", form=form, title=course.name)
+    return render_template("add_student_to_course.html", form=form, title=course.name, course_id=course_id)
 
 
-@app.route('/my_courses', methods=["GET"])
-@student_only
-def my_courses():
-    if not current_user.is_authenticated:
-        return redirect(url_for('log_in'))
+def load_student_dashboard(student_id):
+    """Load a student's courses with their materials, assignments and completion status.
 
+    The number of statements is fixed (courses, materials, assignments, one
+    submission lookup and the progress rows), no matter how many courses or
+    assignments the student has.
+    """
     enrolled_courses = db.session.execute(
-        db.select(Course).join(Enrollment).where(Enrollment.student_id == current_user.id)
+        db.select(Course)
+        .join(Enrollment)
+        .where(Enrollment.student_id == student_id)
+        .options(selectinload(Course.material), selectinload(Course.assignment))
     ).scalars().all()
 
+    submissions = {
+        assignment_id: (is_graded, is_late)
+        for assignment_id, is_graded, is_late in db.session.execute(
+            db.select(Submission.assignment_id, Submission.is_graded, Submission.is_late)
+            .where(Submission.student_id == student_id)
+        )
+    }
+
+    progress = course_progress.load_progress(student_id)
+
     courses_data = []
     for course in enrolled_courses:
-        materials = db.session.execute(
-            db.select(CourseMaterial).where(CourseMaterial.course_id == course.id)
-        ).scalars().all()
-
-        assignments = db.session.execute(
-            db.select(Assignments).where(Assignments.course_id == course.id)
-        ).scalars().all()
-
-        for assignment in assignments:
-            submission = db.session.execute(
-                db.select(Submission).where(
-                    Submission.assignment_id == assignment.id,
-                    Submission.student_id == current_user.id
-                )
-            ).scalar()
-            assignment.is_done = submission is not None
+        for assignment in course.assignment:
+            assignment.is_done = assignment.id in submissions
+            assignment.is_graded, assignment.is_late = submissions.get(assignment.id, (False, False))
 
         courses_data.append({
             "course": course,
-            "materials": materials,
-            "assignments": assignments
+            "materials": course.material,
+            "assignments": course.assignment,
+            "progress": progress.get(course.id),
         })
 
+    return courses_data
+
+
+@routes.route('/my_courses', methods=["GET"])
+@student_only
+@cached_page(page_cache.enrolled_course_versions)
+def my_courses():
+    if not current_user.is_authenticated:
+        return redirect(url_for('log_in'))
+
+    courses_data = load_student_dashboard(current_user.id)
+
     return render_template("my_courses.html", courses=courses_data)
 
 
-@app.route('/solve_assignment/<int:assignment_id>', methods=["GET", "POST"])
+@routes.route('/solve_assignment/<int:assignment_id>', methods=["GET", "POST"])
 @student_only
 def solve_assignment(assignment_id):
     assignment = db.get_or_404(Assignments, assignment_id)
+    current_submission = db.session.execute(
+        db.select(Submission).where(Submission.assignment_id == assignment_id, Submission.student_id == current_user.id)
+    ).scalar()
 
     if request.method == "POST":
+        # Taken before the upload is read or queued, so neither can make the submission late
+        submitted_at = submission_ingest.now()
+
+        if current_submission and current_submission.is_graded:
+            flash("This assignment has already been graded, so it cannot be submitted again.", "error")
+            return redirect(url_for('my_courses'))
+
         content = request.form.get("content")
         file = request.files.get("file")
 
         file_name = secure_filename(file.filename) if file else None
-        file_path = None
-        if file_name:
-            upload_path = os.path.join(app.config['UPLOAD_COURSES_FOLDER'], str(assignment.course_id), "submissions")
-            os.makedirs(upload_path, exist_ok=True)
-            file_path = os.path.join(upload_path, file_name)
-            file.save(file_path)
-
-        new_submission = Submission(
-            assignment_id=assignment_id,
-            student_id=current_user.id,
-            content=content,
-            file_name=file_name,
-            file_path=file_path
-        )
-        db.session.add(new_submission)
-        db.session.commit()
+        # The StoredFile row is written with the submission, in its batch
+        stored_upload = save_upload(file, record=False) if file_name else None
+
+        outcome = submission_ingest.submit(submission_ingest.new_record(
+            assignment_id, current_user.id, content, file_name, stored_upload, submitted_at
+        ))
+        if outcome == "graded":
+            flash("This assignment has already been graded, so it cannot be submitted again.", "error")
+        elif outcome in ("late", "replaced_late"):
+            flash("Your submission was received after the deadline and is marked as late.", "error")
+        elif outcome == "updated":
+            flash("Your submission was replaced.", "success")
+        elif outcome is None:
+            flash("Your submission was received and will appear in a moment.", "success")
+        elif outcome != "superseded":
+            flash("Your submission was received.", "success")
 
         return redirect(url_for('my_courses'))
 
-    return render_template("solve_assignment.html", assignment=assignment)
+    return render_template("solve_assignment.html", assignment=assignment, submission=current_submission)
 
 
-@app.route('/upload_materials/<int:course_id>', methods=["GET", "POST"])
+@routes.route('/upload_materials/<int:course_id>', methods=["GET", "POST"])
 @instructor_only
 def upload_course_material(course_id):
     form = UploadMaterialForm()
@@ -554,16 +817,12 @@ def upload_course_material(course_id):
         description = form.description.data
 
         file_name = secure_filename(file.filename)
-        file_path = os.path.join("uploads/courses", str(course_id))
-        os.makedirs(file_path, exist_ok=True)
-        full_path = os.path.join(file_path, file_name)
-
-        file.save(full_path)
+        stored = save_upload(file)
 
         new_material = CourseMaterial(
             course_id=course_id,
             file_name=file_name,
-            file_path=full_path,
+            file_path=stored.path,
             description=description
         )
         db.session.add(new_material)
@@ -578,61 +837,109 @@ def upload_course_material(course_id):
     )
 
 
-@app.route('/files/<int:course_id>/<filename>', methods=["GET"])
+def deliver_upload(relative_path, download_name):
+    if is_quarantined(relative_path):
+        abort(403, "This file was flagged by the virus scanner.")
+
+    return deliver_file(os.path.join(current_app.root_path, relative_path), download_name)
+
+
+@routes.route('/files/<int:course_id>/<filename>', methods=["GET"])
 def serve_file(course_id, filename):
     filename = secure_filename(filename)
 
-    directory = os.path.join(app.root_path, "uploads", "courses", str(course_id))
-    file_path = os.path.join(directory, filename)
+    material = db.session.execute(
+        db.select(CourseMaterial)
+        .where(CourseMaterial.course_id == course_id, CourseMaterial.file_name == filename)
+        .order_by(CourseMaterial.id.desc())
+    ).scalars().first()
+    if material:
+        file_path = material.file_path
+    else:
+        # Materials uploaded before the content-addressed store
+        file_path = os.path.join("uploads", "courses", str(course_id), filename)
+
+    return deliver_upload(file_path, filename)
+
+
+@routes.route('/assignment_files/<int:assignment_id>', methods=["GET"])
+def serve_assignment_file(assignment_id):
+    assignment = db.get_or_404(Assignments, assignment_id)
+    if not assignment.file_path:
+        abort(404)
+
+    return deliver_upload(assignment.file_path, assignment.file_name)
+
+
+@routes.route('/submission_files/<int:submission_id>', methods=["GET"])
+def serve_submission_file(submission_id):
+    submission = db.get_or_404(Submission, submission_id)
 
-    if not os.path.exists(file_path):
-        print("File does not exist.")
+    if not current_user.is_authenticated:
+        abort(403)
+    if current_user.id not in (submission.student_id, submission.assignment.course.instructor_id):
+        abort(403)
+    if not submission.file_path:
         abort(404)
 
-    return send_file(file_path, as_attachment=True)
+    return deliver_upload(submission.file_path, submission.file_name)
 
 
-@app.route('/grades', methods=["GET"])
+@routes.route('/grades', methods=["GET"])
 @student_only
 def view_grades():
     if not current_user.is_authenticated:
         return redirect(url_for('log_in'))
 
-    grades = db.session.execute(
-        db.select(Grade)
-        .join(Assignments)
-        .join(Course)
+    rows = db.session.execute(
+        db.select(Grade, Submission)
+        .join(Grade.assignment)
+        .join(Grade.course)
+        .outerjoin(Submission, (Submission.assignment_id == Grade.assignment_id) & (Submission.student_id == Grade.student_id))
         .where(Grade.student_id == current_user.id)
-    ).scalars().all()
+        .options(contains_eager(Grade.assignment), contains_eager(Grade.course))
+    ).all()
 
     grades_data = []
-    for grade in grades:
-        submission = db.session.execute(
-            db.select(Submission)
-            .where(
-                Submission.assignment_id == grade.assignment_id,
-                Submission.student_id == current_user.id
-            )
-        ).scalar()
-
+    for grade, submission in rows:
         grades_data.append({
             "course_name": grade.course.name,
             "assignment_title": grade.assignment.title,
             "grade": grade.grade,
+            "feedback": submission.feedback if submission else None,
             "submission": {
                 "content": submission.content if submission else None,
                 "file_name": submission.file_name if submission else None,
-                "file_path": submission.file_path if submission else None
+                "file_path": submission.file_path if submission else None,
+                "url": url_for('serve_submission_file', submission_id=submission.id) if submission else None
             }
         })
 
     return render_template("grades.html", grades=grades_data)
 
 
-@app.route('/taught_courses')
+@routes.route('/notifications', methods=["GET"])
+@student_only
+def view_notifications():
+    if not current_user.is_authenticated:
+        return redirect(url_for('log_in'))
+
+    return render_template("notifications.html", notifications=notifications.load_notifications(current_user.id))
+
+
+@routes.route('/notifications/read', methods=["POST"])
+@student_only
+def read_notifications():
+    notifications.mark_read(current_user.id)
+    return redirect(url_for('view_notifications'))
+
+
+@routes.route('/taught_courses')
 @instructor_only
+@cached_page(page_cache.taught_course_versions)
 def instructor_courses():
     course_list = db.session.execute(db.select(Course).where(Course.instructor_id == current_user.id)).scalars().all()
+    progress = course_progress.load_course_summaries([course.id for course in course_list])
 
     courses_data = []
     for course in course_list:
@@ -643,13 +950,14 @@ def instructor_courses():
         courses_data.append({
             "course": course,
             "materials": materials,
-            "assignments": assignments
+            "assignments": assignments,
+            "progress": progress.get(course.id),
         })
 
     return render_template("instructor_courses.html", courses=courses_data)
 
 
-@app.route('/add_assignment/<int:course_id>', methods=["GET", "POST"])
+@routes.route('/add_assignment/<int:course_id>', methods=["GET", "POST"])
 @instructor_only
 def add_assignment(course_id):
     course = db.get_or_404(Course, course_id)
@@ -663,19 +971,15 @@ def add_assignment(course_id):
         file = form.file.data
 
         file_name = secure_filename(file.filename) if file else None
-        file_path = None
-        if file_name:
-            upload_path = os.path.join(app.config['UPLOAD_COURSES_FOLDER'], str(course_id), "assignments")
-            os.makedirs(upload_path, exist_ok=True)
-            file_path = os.path.join(upload_path, file_name)
-            file.save(file_path)
+        file_path = save_upload(file).path if file_name else None
 
         new_assignment = Assignments(
             course_id=course_id,
             title=title,
             text=text,
             assignment_type=assignment_type,
-            deadline=deadline.strftime("%Y-%m-%d"),
+            deadline=deadline,
+            weight=form.weight.data,
             file_name=file_name,
             file_path=file_path
         )
@@ -687,22 +991,125 @@ def add_assignment(course_id):
     return render_template("add_assignment.html", course=course, form=form)
 
 
-@app.route('/grade_assignments')
+def taught_course_or_404(course_id):
+    course = db.get_or_404(Course, course_id)
+    if course.instructor_id != current_user.id:
+        abort(403)
+
+    return course
+
+
+@routes.route('/course_gradebook/<int:course_id>')
+@instructor_only
+def course_gradebook(course_id):
+    course = taught_course_or_404(course_id)
+    return render_template("gradebook.html", course=course, gradebook=gradebook.course_gradebook(course_id))
+
+
+@routes.route('/api/courses/<int:course_id>/gradebook')
+@instructor_only
+def course_gradebook_json(course_id):
+    taught_course_or_404(course_id)
+    return gradebook.course_gradebook(course_id)
+
+
+def grading_queue(instructor_id):
+    """Ungraded submissions for an instructor's courses, with assignment and student loaded in the same query."""
+    return (
+        db.select(Submission)
+        .join(Submission.assignment)
+        .join(Assignments.course)
+        .where(Course.instructor_id == instructor_id, Submission.is_graded == False)
+        .options(contains_eager(Submission.assignment), joinedload(Submission.student))
+    )
+
+
+def parse_grade_batch(form_data):
+    """Read ``grade-<id>``/``feedback-<id>`` inputs into ``{submission_id: (grade, feedback)}`` and a list of errors."""
+    grades, errors = {}, []
+    for key, value in form_data.items():
+        if not key.startswith("grade-") or not value.strip():
+            continue
+
+        submission_id = key.removeprefix("grade-")
+        try:
+            grade_value = float(value)
+        except ValueError:
+            errors.append(f"Grade '{value}' is not a number.")
+            continue
+        if not 0 <= grade_value <= 10:
+            errors.append("Grade must be between 0 and 10.")
+            continue
+        if not submission_id.isdigit():
+            continue
+
+        feedback = form_data.get(f"feedback-{submission_id}", "").strip()
+        grades[int(submission_id)] = (grade_value, feedback or None)
+
+    return grades, errors
+
+
+@routes.route('/grade_assignments', methods=["GET", "POST"])
 @instructor_only
 def grade_assignments():
     if not current_user.is_authenticated:
         return redirect(url_for('log_in'))
 
-    ungraded_submissions = db.session.execute(db.select(Submission).join(Assignments).join(Course).where(Course.instructor_id == current_user.id, Submission.is_graded == False)).scalars().all()
+    form = GradeBatchForm()
+    if form.validate_on_submit():
+        grades, errors = parse_grade_batch(request.form)
+        if errors:
+            for error in errors:
+                flash(error, "error")
+        elif grades:
+            # Only submissions still waiting in this instructor's queue can be graded
+            submissions = db.session.execute(
+                grading_queue(current_user.id).where(Submission.id.in_(grades))
+            ).scalars().all()
+
+            for submission in submissions:
+                grade_value, feedback = grades[submission.id]
+                db.session.add(Grade(
+                    student_id=submission.student_id,
+                    course_id=submission.assignment.course_id,
+                    assignment_id=submission.assignment_id,
+                    grade=grade_value
+                ))
+                submission.feedback = feedback
+                submission.is_graded = True
+
+            try:
+                db.session.commit()
+            except IntegrityError:
+                db.session.rollback()
+                flash("Some of these submissions were already graded. No grades were saved.", "error")
+            else:
+                flash(f"Saved {len(submissions)} grades.", "success")
+
+        return redirect(url_for('grade_assignments', after=request.args.get("after")))
+
+    page = paginate(
+        grading_queue(current_user.id),
+        [Assignments.deadline, Assignments.id, Submission.id],
+        request.args.get("after"),
+        page_size(),
+        cursor_values=lambda submission: [submission.assignment.deadline, submission.assignment_id, submission.id]
+    )
 
-    return render_template("ungraded_assignments.html", submissions=ungraded_submissions)
+    return render_template("ungraded_assignments.html", submissions=page.items, next_cursor=page.next_cursor, form=form)
 
 
-@app.route('/grade_submission/<int:submission_id>', methods=["GET", "POST"])
+@routes.route('/grade_submission/<int:submission_id>', methods=["GET", "POST"])
 @instructor_only
 def grade_submission(submission_id):
     submission = db.get_or_404(Submission, submission_id)
     assignment = submission.assignment
+    taught_course_or_404(assignment.course_id)
+
+    if submission.is_graded:
+        flash("This submission has already been graded.", "error")
+        return redirect(url_for('grade_assignments'))
+
     form = GradeSubmissionFormText()
 
     if assignment.assignment_type == 1:
@@ -710,7 +1117,7 @@ def grade_submission(submission_id):
     elif assignment.assignment_type == 0:
         form = GradeSubmissionFormFile()
         if submission.file_name:
-            file_url = url_for('static', filename=submission.file_path)
+            file_url = url_for('serve_submission_file', submission_id=submission.id)
             form.file_link.data = f"Download file: {file_url}"
 
     if form.validate_on_submit():
@@ -725,22 +1132,83 @@ def grade_submission(submission_id):
         )
         db.session.add(new_grade)
 
-        if feedback:
-            submission.feedback = feedback
-
+        submission.feedback = feedback or None
         submission.is_graded = True
-        db.session.commit()
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # Graded from another tab or by the batch form since this page was loaded
+            db.session.rollback()
+            flash("This submission has already been graded.", "error")
 
         return redirect(url_for('grade_assignments'))
 
     return render_template("grade_submission.html", submission=submission, form=form)
 
 
-@app.route('/logout', methods=["GET", "POST"])
+@routes.route('/assignments/<int:assignment_id>/export')
+@instructor_only
+def export_assignment(assignment_id):
+    assignment = db.get_or_404(Assignments, assignment_id)
+    taught_course_or_404(assignment.course_id)
+    return export_response("assignment", assignment.id, f"{assignment.title} submissions.zip")
+
+
+@routes.route('/courses/<int:course_id>/archive')
+@admin_only
+def export_course(course_id):
+    course = db.get_or_404(Course, course_id)
+    return export_response("course", course.id, f"{course.name} archive.zip")
+
+
+def export_response(kind, object_id, download_name):
+    """Stream the archive in this response, or queue it as a background job if it is too large."""
+    if exports.estimated_size(kind, object_id) > current_app.config["EXPORT_INLINE_LIMIT"]:
+        export_job = exports.queue_export(kind, object_id, current_user.id, download_name)
+        db.session.commit()
+        return redirect(url_for('export_status', job_id=export_job.id))
+
+    response = Response(stream_with_context(exports.stream_archive(kind, object_id)), mimetype="application/zip")
+    response.headers["Content-Disposition"] = f"attachment; filename*=UTF-8''{quote(download_name)}"
+    # Built from the current submissions and grades, so never reuse a copy
+    response.cache_control.no_store = True
+    return response
+
+
+@routes.route('/exports/<int:job_id>')
+def export_status(job_id):
+    if not current_user.is_authenticated:
+        return redirect(url_for('log_in'))
+
+    export_job = db.get_or_404(Job, job_id)
+    payload = json.loads(export_job.payload)
+    if export_job.kind != "export_archive" or payload["user_id"] != current_user.id:
+        abort(404)
+
+    if export_job.status == "done":
+        return deliver_file(exports.export_path(payload["token"]), payload["download_name"])
+
+    exports.fail_if_never_started(export_job)
+
+    return render_template("export_status.html", job=export_job, download_name=payload["download_name"])
+
+
+@routes.route('/search')
+def search_page():
+    if not current_user.is_authenticated:
+        return redirect(url_for('log_in'))
+
+    query = request.args.get("q", "").strip()
+    results = search.search(current_user, query) if query else []
+
+    return render_template("search.html", query=query, results=results)
+
+
+@routes.route('/logout', methods=["GET", "POST"])
 def log_out():
     logout_user()
     return redirect(url_for('welcome'))
 
 
 if __name__ == '__main__':
-    app.run(debug=True, port=5001)
+    create_app().run(debug=True, port=5001)
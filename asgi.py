@@ -0,0 +1,223 @@
+"""ASGI entry point, for running the application under an ASGI server:
+
+    uvicorn asgi:application --workers 4
+
+Flask views are synchronous, so each request still runs in a worker thread
+(``LMS_ASGI_THREADS`` per process). The adapter keeps the slow I/O around a
+view off those threads:
+- request bodies (uploads) are received by the event loop and spooled to a
+  temp file before a thread is taken, so a slow client does not hold one;
+- files returned through ``wsgi.file_wrapper`` (downloads in ``direct``
+  delivery mode, static files) are streamed by the event loop once the view
+  has returned, with the disk reads done in the loop's default executor.
+Other responses are sent from the worker thread as it produces them.
+
+asgiref's ``WsgiToAsgi`` is not used: it runs every request on one shared
+thread and streams downloads from it.
+"""
+import asyncio
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from tempfile import SpooledTemporaryFile
+
+from app import create_app
+
+THREADS = int(os.environ.get("LMS_ASGI_THREADS", 32))
+# Request bodies larger than this are spooled to disk
+SPOOL_SIZE = 1024 * 1024
+CHUNK_SIZE = 64 * 1024
+
+
+class FileWrapper:
+    """``wsgi.file_wrapper`` whose file is sent by the event loop instead of the worker thread."""
+
+    def __init__(self, file, block_size=CHUNK_SIZE):
+        self.file = file
+        self.block_size = block_size
+
+    def seekable(self):
+        return hasattr(self.file, "seekable") and self.file.seekable()
+
+    def seek(self, *args):
+        self.file.seek(*args)
+
+    def tell(self):
+        return self.file.tell()
+
+    def read(self):
+        return self.file.read(self.block_size)
+
+    # Iterated in the worker thread when the response wraps the file again (range requests)
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        data = self.read()
+        if not data:
+            raise StopIteration()
+        return data
+
+    def close(self):
+        if hasattr(self.file, "close"):
+            self.file.close()
+
+
+class ClientDisconnected(Exception):
+    """The client went away before sending the whole request body."""
+
+
+class WsgiAdapter:
+    def __init__(self, wsgi_app, threads=THREADS):
+        self.wsgi_app = wsgi_app
+        self.executor = ThreadPoolExecutor(threads, thread_name_prefix="asgi-worker")
+        # Werkzeug would reject larger bodies anyway; refuse them before spooling
+        self.max_body = wsgi_app.config.get("MAX_CONTENT_LENGTH")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            return await self.lifespan(receive, send)
+        if scope["type"] != "http":
+            raise ValueError(f"Unsupported ASGI scope {scope['type']!r}")
+
+        loop = asyncio.get_running_loop()
+        with SpooledTemporaryFile(SPOOL_SIZE) as body:
+            try:
+                complete = await self.receive_body(scope, receive, body)
+            except ClientDisconnected:
+                # Running the view on a truncated form could store half a submission or grade
+                return
+            if not complete:
+                await send({"type": "http.response.start", "status": 413,
+                            "headers": [(b"content-type", b"text/plain; charset=utf-8")]})
+                await send({"type": "http.response.body", "body": b"Request body too large"})
+                return
+
+            environ = self.build_environ(scope, body)
+            file_response = await loop.run_in_executor(self.executor, self.run_wsgi_app, environ, loop, send)
+
+        if file_response is not None:
+            await self.send_file(loop, send, *file_response)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await asyncio.get_running_loop().run_in_executor(None, self.executor.shutdown)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def receive_body(self, scope, receive, body):
+        """Spool the request body into ``body``; False if it is larger than ``max_body``.
+
+        Raises ``ClientDisconnected`` if the client disconnects before the end of the body.
+        """
+        for name, value in scope["headers"]:
+            if name == b"content-length" and self.max_body is not None and int(value) > self.max_body:
+                return False
+
+        size = 0
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                raise ClientDisconnected()
+            chunk = message.get("body", b"")
+            size += len(chunk)
+            if self.max_body is not None and size > self.max_body:
+                return False
+            body.write(chunk)
+            if not message.get("more_body"):
+                break
+        body.seek(0)
+        return True
+
+    def build_environ(self, scope, body):
+        path = scope["path"]
+        root_path = scope.get("root_path", "")
+        if root_path and path.startswith(root_path):
+            path = path[len(root_path):]
+        server = scope.get("server") or ("localhost", 80)
+
+        environ = {
+            "REQUEST_METHOD": scope["method"],
+            "SCRIPT_NAME": root_path.encode("utf-8").decode("latin-1"),
+            "PATH_INFO": path.encode("utf-8").decode("latin-1"),
+            # Native strings hold the raw bytes as latin-1 (PEP 3333), which Werkzeug decodes again
+            "QUERY_STRING": scope["query_string"].decode("latin-1"),
+            "SERVER_NAME": server[0],
+            "SERVER_PORT": str(server[1] or 80),
+            "SERVER_PROTOCOL": f"HTTP/{scope['http_version']}",
+            # The spooled size, which is also right for chunked uploads
+            "CONTENT_LENGTH": str(body.seek(0, os.SEEK_END)),
+            "wsgi.version": (1, 0),
+            "wsgi.url_scheme": scope.get("scheme", "http"),
+            "wsgi.input": body,
+            "wsgi.errors": sys.stderr,
+            "wsgi.multithread": True,
+            "wsgi.multiprocess": True,
+            "wsgi.run_once": False,
+            "wsgi.file_wrapper": FileWrapper,
+        }
+        body.seek(0)
+        if scope.get("client"):
+            environ["REMOTE_ADDR"], environ["REMOTE_PORT"] = scope["client"][0], str(scope["client"][1])
+
+        for name, value in scope["headers"]:
+            name, value = name.decode("latin-1"), value.decode("latin-1")
+            if name == "content-length":
+                continue
+            key = "CONTENT_TYPE" if name == "content-type" else "HTTP_" + name.upper().replace("-", "_")
+            if key in environ:
+                value = environ[key] + ("; " if key == "HTTP_COOKIE" else ",") + value
+            environ[key] = value
+        return environ
+
+    def run_wsgi_app(self, environ, loop, send):
+        """Run the view in a worker thread; returns the start message and file when the loop should send the file."""
+        response = {}
+
+        def start_response(status, headers, exc_info=None):
+            if exc_info and response.get("sent"):
+                raise exc_info[1].with_traceback(exc_info[2])
+            response["start"] = {
+                "type": "http.response.start",
+                "status": int(status.split(" ", 1)[0]),
+                "headers": [(name.lower().encode("latin-1"), value.encode("latin-1")) for name, value in headers],
+            }
+
+        def send_from_thread(message):
+            asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+        iterable = self.wsgi_app(environ, start_response)
+        if isinstance(iterable, FileWrapper):
+            return response["start"], iterable
+
+        try:
+            for chunk in iterable:
+                if not chunk:
+                    continue
+                if not response.get("sent"):
+                    send_from_thread(response["start"])
+                    response["sent"] = True
+                send_from_thread({"type": "http.response.body", "body": chunk, "more_body": True})
+
+            if not response.get("sent"):
+                send_from_thread(response["start"])
+            send_from_thread({"type": "http.response.body", "body": b""})
+        finally:
+            if hasattr(iterable, "close"):
+                iterable.close()
+
+    async def send_file(self, loop, send, start, wrapper):
+        try:
+            await send(start)
+            while data := await loop.run_in_executor(None, wrapper.read):
+                await send({"type": "http.response.body", "body": data, "more_body": True})
+            await send({"type": "http.response.body", "body": b""})
+        finally:
+            wrapper.close()
+
+
+application = WsgiAdapter(create_app())
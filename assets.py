@@ -0,0 +1,213 @@
+"""Fingerprinted static files and precompiled templates.
+
+``url_for('static', filename=...)``, and the static endpoints of blueprints
+such as Bootstrap's when it serves its own files, put the first 12 hex
+digits of the file's SHA-256 before the extension:
+``/static/css/style.3f2a9c81d0b4.css``. A URL with the current fingerprint
+is served with a one-year ``immutable`` lifetime, so browsers never
+revalidate it, and editing the file changes its URL. A URL with an older
+fingerprint, from a page cached before a deploy, gets the current file with
+the usual short lifetime.
+
+Text files (CSS, JavaScript, SVG...) are compressed once per version, with
+gzip and, when the ``brotli`` package is installed, brotli, into
+``<instance>/assets``. Each client gets the smallest variant it accepts.
+``flask --app app build-assets`` compresses every file ahead of time.
+
+Templates are compiled when the app is created, so the first request of a
+restarted worker does not pay for it. The compiled code is cached in
+``<instance>/jinja-cache``, so a restart loads it instead of compiling again.
+"""
+import functools
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+import tempfile
+import threading
+
+from flask import current_app, request, send_file, abort
+from jinja2 import FileSystemBytecodeCache
+from werkzeug.security import safe_join
+
+ONE_YEAR = 365 * 24 * 3600
+FINGERPRINT_LENGTH = 12
+FINGERPRINTED = re.compile(r"^(?P<base>.+)\.(?P<fingerprint>[0-9a-f]{%d})(?P<extension>\.[A-Za-z0-9]+)$" % FINGERPRINT_LENGTH)
+COMPRESSIBLE_TYPES = {"application/javascript", "application/json", "application/xml", "image/svg+xml", "font/ttf", "font/otf"}
+# Below this, the saving does not pay for the extra header
+MIN_COMPRESS_SIZE = 256
+
+# path -> (mtime_ns, size, sha256 hex digest)
+_digests = {}
+_lock = threading.Lock()
+
+
+def init_assets(app):
+    """Call after the extensions are set up, so their blueprints' static files are fingerprinted too."""
+    app.config.setdefault("ASSET_CACHE_FOLDER", os.environ.get("LMS_ASSET_CACHE_DIR", os.path.join(app.instance_path, "assets")))
+    app.config.setdefault("PRECOMPILE_TEMPLATES",
+                          os.environ.get("LMS_PRECOMPILE_TEMPLATES", "on").lower() not in ("0", "false", "no", "off"))
+    app.config.setdefault("TEMPLATE_CACHE_FOLDER",
+                          os.environ.get("LMS_TEMPLATE_CACHE_DIR", os.path.join(app.instance_path, "jinja-cache")))
+
+    app.url_defaults(fingerprint_static_urls)
+    for endpoint in list(app.view_functions):
+        if endpoint == "static" or endpoint.endswith(".static"):
+            app.view_functions[endpoint] = _static_view(endpoint)
+
+    if app.config["TEMPLATE_CACHE_FOLDER"]:
+        os.makedirs(app.config["TEMPLATE_CACHE_FOLDER"], exist_ok=True)
+        app.jinja_env.bytecode_cache = FileSystemBytecodeCache(app.config["TEMPLATE_CACHE_FOLDER"])
+    if app.config["PRECOMPILE_TEMPLATES"]:
+        precompile_templates(app)
+
+
+def precompile_templates(app):
+    """Load every template into the environment's cache; returns how many there are."""
+    names = app.jinja_env.list_templates(extensions=("html", "xml", "txt"))
+    for name in names:
+        app.jinja_env.get_template(name)
+    return len(names)
+
+
+def static_folder(endpoint):
+    if endpoint == "static":
+        return current_app.static_folder
+    blueprint = current_app.blueprints.get(endpoint.rsplit(".", 1)[0])
+    return blueprint.static_folder if blueprint is not None else None
+
+
+def file_digest(path):
+    """SHA-256 of the file, recomputed only when its size or modification time changes."""
+    stat = os.stat(path)
+    cached = _digests.get(path)
+    if cached is not None and cached[:2] == (stat.st_mtime_ns, stat.st_size):
+        return cached[2]
+
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while data := f.read(1024 * 1024):
+            digest.update(data)
+    with _lock:
+        _digests[path] = (stat.st_mtime_ns, stat.st_size, digest.hexdigest())
+    return digest.hexdigest()
+
+
+def fingerprint_static_urls(endpoint, values):
+    if endpoint != "static" and not endpoint.endswith(".static"):
+        return
+
+    filename = values.get("filename")
+    folder = static_folder(endpoint)
+    path = safe_join(folder, filename) if folder and filename else None
+    if path is None or not os.path.isfile(path):
+        return
+
+    base, extension = os.path.splitext(filename)
+    values["filename"] = f"{base}.{file_digest(path)[:FINGERPRINT_LENGTH]}{extension}"
+
+
+def _static_view(endpoint):
+    def serve_static(filename):
+        return serve_static_file(static_folder(endpoint), filename)
+
+    return serve_static
+
+
+def serve_static_file(folder, filename):
+    path = safe_join(folder, filename)
+    current = False
+    match = FINGERPRINTED.match(filename)
+    # A file whose own name looks fingerprinted is served as it is
+    if match and (path is None or not os.path.isfile(path)):
+        filename = match["base"] + match["extension"]
+        path = safe_join(folder, filename)
+        current = path is not None and os.path.isfile(path) and file_digest(path).startswith(match["fingerprint"])
+
+    if path is None or not os.path.isfile(path):
+        abort(404)
+
+    mimetype = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+    compressible = current and _compressible(mimetype, path)
+    encoding = None
+    if compressible:
+        path, encoding = _compressed_variant(path, request.accept_encodings)
+
+    if current:
+        response = send_file(path, mimetype=mimetype, max_age=ONE_YEAR)
+        response.cache_control.immutable = True
+    else:
+        response = send_file(path, mimetype=mimetype, max_age=current_app.get_send_file_max_age(filename))
+
+    if encoding is not None:
+        response.headers["Content-Encoding"] = encoding
+    if compressible:
+        response.vary.add("Accept-Encoding")
+    return response
+
+
+def _compressible(mimetype, path):
+    return (mimetype.startswith("text/") or mimetype in COMPRESSIBLE_TYPES) and os.path.getsize(path) >= MIN_COMPRESS_SIZE
+
+
+@functools.cache
+def _encoders():
+    encoders = []
+    try:
+        import brotli
+    except ImportError:
+        pass
+    else:
+        encoders.append(("br", ".br", lambda data: brotli.compress(data, quality=11)))
+    # mtime=0 keeps the output the same on every machine, and so its ETag
+    encoders.append(("gzip", ".gz", lambda data: gzip.compress(data, 9, mtime=0)))
+    return encoders
+
+
+def compress_file(path):
+    """Write the compressed variants of the file that are missing; returns their paths by encoding."""
+    folder = current_app.config["ASSET_CACHE_FOLDER"]
+    name = file_digest(path) + os.path.splitext(path)[1]
+    variants = {}
+    data = None
+    for encoding, suffix, compress in _encoders():
+        variant = os.path.join(folder, name + suffix)
+        if not os.path.exists(variant):
+            if data is None:
+                os.makedirs(folder, exist_ok=True)
+                with open(path, "rb") as f:
+                    data = f.read()
+            # Several workers may compress the same file; each renames a complete one into place
+            fd, temp_path = tempfile.mkstemp(dir=folder, prefix=".tmp-")
+            with os.fdopen(fd, "wb") as f:
+                f.write(compress(data))
+            os.replace(temp_path, variant)
+        variants[encoding] = variant
+    return variants
+
+
+def _compressed_variant(path, accept_encodings):
+    """The smallest variant of the file the client accepts, and its encoding (None for the file itself)."""
+    best, best_size, best_encoding = path, os.path.getsize(path), None
+    for encoding, variant in compress_file(path).items():
+        if accept_encodings[encoding]:
+            size = os.path.getsize(variant)
+            if size < best_size:
+                best, best_size, best_encoding = variant, size, encoding
+    return best, best_encoding
+
+
+def build_assets(app):
+    """Compress every compressible static file of the app and its blueprints; returns how many there are."""
+    folders = [app.static_folder] + [blueprint.static_folder for blueprint in app.blueprints.values()]
+    count = 0
+    for folder in filter(None, folders):
+        for directory, _, names in os.walk(folder):
+            for name in names:
+                path = os.path.join(directory, name)
+                mimetype = mimetypes.guess_type(name)[0] or ""
+                if _compressible(mimetype, path):
+                    compress_file(path)
+                    count += 1
+    return count
@@ -0,0 +1,110 @@
+"""Selecting the students that can still be added to a course.
+
+Compares the old approach (load the enrolled ids, then ``NOT IN (<every id>)``)
+with the ``NOT EXISTS`` anti-join used by add_student_to_course, on a course
+that already has half of all students enrolled. The first search page of the
+type-ahead endpoint is timed as well. Prints the timings as JSON.
+
+    python benchmarks/available_students.py --students 1000 10000 100000
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models import db, User, Course, Enrollment  # noqa: E402
+
+
+def populate(session, students):
+    instructor = User(name="Instructor", age=40, email="instr@example.com", phone_number="0799999990", status="instr")
+    session.add(instructor)
+    session.flush()
+    course = Course(name="Course", instructor_id=instructor.id)
+    session.add(course)
+    session.flush()
+
+    session.execute(insert(User), [
+        {"name": f"Student {i:06d}", "age": 20, "email": f"s{i}@example.com", "phone_number": f"07{i:08d}", "status": "student"}
+        for i in range(students)
+    ])
+    student_ids = session.execute(db.select(User.id).where(User.status == "student")).scalars().all()
+    session.execute(insert(Enrollment), [
+        {"course_id": course.id, "student_id": student_id} for student_id in student_ids[::2]
+    ])
+    session.commit()
+    return course.id
+
+
+def old_query(session, course_id):
+    enrolled_ids = session.execute(
+        db.select(Enrollment.student_id).where(Enrollment.course_id == course_id)
+    ).scalars().all()
+    return session.execute(
+        db.select(User).where(User.status == "student", User.id.not_in(enrolled_ids))
+    ).scalars().all()
+
+
+def anti_join(course_id):
+    enrolled = db.select(Enrollment.id).where(Enrollment.course_id == course_id, Enrollment.student_id == User.id)
+    return db.select(User).where(User.status == "student", ~enrolled.exists())
+
+
+def new_query(session, course_id):
+    return session.execute(anti_join(course_id)).scalars().all()
+
+
+def search_page(session, course_id):
+    statement = anti_join(course_id).where(User.name >= "Student 0005", User.name < "Student 0005\U0010ffff")
+    return session.execute(statement.order_by(User.name, User.id).limit(10)).scalars().all()
+
+
+def timed(function, *args, repeat=3):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        rows = function(*args)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return {"rows": len(rows), "ms": round(best * 1000, 2)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--students", type=int, nargs="+", default=[1000, 10000, 100000])
+    args = parser.parse_args()
+
+    results = []
+    for students in args.students:
+        with tempfile.TemporaryDirectory() as directory:
+            engine = create_engine(f"sqlite:///{os.path.join(directory, 'bench.db')}")
+            db.metadata.create_all(engine)
+
+            with Session(engine) as session:
+                course_id = populate(session, students)
+                result = {"students": students, "enrolled": (students + 1) // 2}
+
+                try:
+                    result["not_in_list"] = timed(old_query, session, course_id)
+                except OperationalError as error:
+                    session.rollback()
+                    result["not_in_list"] = {"error": str(error.orig)}
+
+                result["not_exists"] = timed(new_query, session, course_id)
+                result["type_ahead_page"] = timed(search_page, session, course_id)
+
+            engine.dispose()
+        results.append(result)
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+"""Rows per second for CSV user and enrollment imports.
+
+Generates the CSV files, imports them into a fresh SQLite database through
+bulk_import and prints the throughput as JSON. Password hashing is by far the
+most expensive part of a user import, so it uses a cheap method by default;
+pass --hash-method to include a production cost.
+
+    python benchmarks/bulk_import.py --users 100000 --courses 200 --enrollments 100000
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def write_users_csv(path, count):
+    with open(path, "w") as f:
+        f.write("username,password,name,email,phone_number,age,status\n")
+        for i in range(count):
+            f.write(f"user{i},secret{i},Student {i},user{i}@example.com,07{i:08d},20,student\n")
+        # Rows that must be reported, not imported
+        f.write("user0,secret,Duplicate,dup@example.com,0799999999,20,student\n")
+        f.write("broken,secret,Broken,not-an-email,0799999998,20,student\n")
+
+
+def write_enrollments_csv(path, count, students, courses):
+    with open(path, "w") as f:
+        f.write("course,username\n")
+        for i in range(count):
+            f.write(f"Course {i % courses},user{(i * 7919) % students}\n")
+        f.write("No Such Course,user0\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=100000)
+    parser.add_argument("--courses", type=int, default=200)
+    parser.add_argument("--enrollments", type=int, default=100000)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--hash-method", default="pbkdf2:sha256:1000")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        os.environ["LMS_DATABASE_URL"] = f"sqlite:///{os.path.join(directory, 'bench.db')}"
+        import passwords
+        passwords.hash_method = args.hash_method
+        import bulk_import
+        from app import create_app
+        from models import db, User, Course
+
+        users_csv = os.path.join(directory, "users.csv")
+        enrollments_csv = os.path.join(directory, "enrollments.csv")
+        write_users_csv(users_csv, args.users)
+        write_enrollments_csv(enrollments_csv, args.enrollments, args.users, args.courses)
+
+        results = {"batch_size": args.batch_size, "hash_method": args.hash_method}
+        app = create_app()
+        with app.app_context():
+            instructor = User(name="Instructor", age=40, email="instr@example.com", phone_number="0799999990", status="instr")
+            db.session.add(instructor)
+            db.session.flush()
+            db.session.add_all([Course(name=f"Course {i}", instructor_id=instructor.id) for i in range(args.courses)])
+            db.session.commit()
+
+            with open(users_csv, "rb") as f:
+                started = time.perf_counter()
+                report = bulk_import.import_users(f, args.batch_size)
+                elapsed = time.perf_counter() - started
+            results["users"] = {
+                "imported": report.imported,
+                "errors": len(report.errors),
+                "seconds": round(elapsed, 2),
+                "rows_per_second": round(report.imported / elapsed),
+            }
+
+            with open(enrollments_csv, "rb") as f:
+                started = time.perf_counter()
+                report = bulk_import.import_enrollments(f, args.batch_size)
+                elapsed = time.perf_counter() - started
+            results["enrollments"] = {
+                "imported": report.imported,
+                "errors": len(report.errors),
+                "seconds": round(elapsed, 2),
+                "rows_per_second": round(report.imported / elapsed),
+            }
+
+            db.engine.dispose()
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
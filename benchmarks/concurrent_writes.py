@@ -0,0 +1,113 @@
+"""Concurrent submission writes against SQLite, default journaling vs. the tuned engine.
+
+Writer threads insert rows the way solve_assignment does (one short transaction
+per submission) while reader threads keep querying the table. The script reports
+throughput and how many operations failed with "database is locked".
+
+    python benchmarks/concurrent_writes.py --writers 16 --readers 8 --writes 50
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import configure_engine, sqlite_pragmas  # noqa: E402
+
+
+def run(engine, writers, readers, writes_per_writer):
+    with engine.begin() as connection:
+        connection.execute(text(
+            "CREATE TABLE submission (id INTEGER PRIMARY KEY, student_id INTEGER, content TEXT)"
+        ))
+
+    locked = {"writes": 0, "reads": 0}
+    lock = threading.Lock()
+    stop_reading = threading.Event()
+
+    def writer(student_id):
+        for _ in range(writes_per_writer):
+            try:
+                with engine.begin() as connection:
+                    connection.execute(
+                        text("INSERT INTO submission (student_id, content) VALUES (:s, :c)"),
+                        {"s": student_id, "c": "x" * 512}
+                    )
+            except OperationalError:
+                with lock:
+                    locked["writes"] += 1
+
+    def reader():
+        while not stop_reading.is_set():
+            try:
+                with engine.connect() as connection:
+                    connection.execute(text("SELECT COUNT(*) FROM submission")).scalar()
+            except OperationalError:
+                with lock:
+                    locked["reads"] += 1
+
+    reader_threads = [threading.Thread(target=reader) for _ in range(readers)]
+    writer_threads = [threading.Thread(target=writer, args=(i,)) for i in range(writers)]
+
+    for thread in reader_threads:
+        thread.start()
+    started = time.perf_counter()
+    for thread in writer_threads:
+        thread.start()
+    for thread in writer_threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    stop_reading.set()
+    for thread in reader_threads:
+        thread.join()
+
+    with engine.connect() as connection:
+        stored = connection.execute(text("SELECT COUNT(*) FROM submission")).scalar()
+
+    return {
+        "seconds": round(elapsed, 3),
+        "stored_writes": stored,
+        "writes_per_second": round(stored / elapsed, 1),
+        "locked_writes": locked["writes"],
+        "locked_reads": locked["reads"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--writers", type=int, default=16)
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--writes", type=int, default=50, help="writes per writer thread")
+    parser.add_argument("--timeout", type=float, default=1.0, help="busy timeout in seconds for both runs")
+    args = parser.parse_args()
+
+    results = {}
+    # One pooled connection per thread, like one per worker thread in the app
+    pool = {"pool_size": args.writers + args.readers, "connect_args": {"timeout": args.timeout}}
+    with tempfile.TemporaryDirectory() as directory:
+        # The app's previous configuration: rollback journal, synchronous=FULL
+        default = create_engine(
+            f"sqlite:///{os.path.join(directory, 'default.db')}", **pool
+        )
+        results["default"] = run(default, args.writers, args.readers, args.writes)
+        default.dispose()
+
+        tuned = create_engine(
+            f"sqlite:///{os.path.join(directory, 'tuned.db')}", **pool
+        )
+        configure_engine(tuned, dict(sqlite_pragmas(), busy_timeout=int(args.timeout * 1000)))
+        results["tuned"] = run(tuned, args.writers, args.readers, args.writes)
+        tuned.dispose()
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
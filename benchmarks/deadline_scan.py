@@ -0,0 +1,76 @@
+"""Time of the deadline scan that writes reminders and overdue notices.
+
+Seeds a synthetic database with --students students (4 courses each, 10
+assignments per course with deadlines spread over +-60 days, 60% submitted)
+and times:
+- the first scan, which writes the reminders for the next 24 hours and the
+  overdue notices for the last 24 hours;
+- the same scan repeated, which finds everything notified already;
+- the scan five minutes later, which only looks at deadlines passed since.
+Emails go to a sink that only counts them, so the figures are the database
+work and the building of the messages.
+
+    python benchmarks/deadline_scan.py --students 100000
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import synthetic_data  # noqa: E402
+
+
+class CountingSink:
+    def __init__(self):
+        self.sent = 0
+
+    def send(self, messages):
+        self.sent += len(messages)
+
+
+def timed_scan(notifications, since, now):
+    started = time.perf_counter()
+    counts = notifications.scan_deadlines(since, now)
+    return dict(counts, seconds=round(time.perf_counter() - started, 3))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--students", type=int, default=100000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        os.environ["LMS_DATABASE_URL"] = f"sqlite:///{os.path.join(directory, 'scan.db')}"
+        os.environ["LMS_JOB_WORKERS"] = "0"
+        import notifications
+        import passwords
+        from app import create_app
+        from models import db
+
+        app = create_app({"UPLOAD_STORE_FOLDER": os.path.join(directory, "store"), "EMAIL_SINK": CountingSink()})
+
+        started = time.perf_counter()
+        with app.app_context(), db.engine.begin() as connection:
+            counts = synthetic_data.seed(
+                connection, args.students * 42, app.config["UPLOAD_STORE_FOLDER"], passwords.hash_password(synthetic_data.PASSWORD)
+            )
+        results = {"tables": counts, "seed_seconds": round(time.perf_counter() - started, 1)}
+
+        now = datetime.now()
+        with app.app_context():
+            results["first_scan"] = timed_scan(notifications, None, now)
+            results["repeated_scan"] = timed_scan(notifications, None, now)
+            results["scan_5_minutes_later"] = timed_scan(notifications, now, now + timedelta(minutes=5))
+            results["emails"] = app.extensions["email_sink"].sent
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
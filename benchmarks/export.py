@@ -0,0 +1,203 @@
+"""Export a large course as a ZIP and watch the memory of the process doing it.
+
+Creates a course whose submissions add up to ``--size-gb`` of distinct files,
+then builds the course archive twice:
+- streamed through the test client, as the /courses/<id>/archive download;
+- written to disk by the ``export_archive`` background job.
+Reports throughput and the peak resident memory during each export, next to
+the resident memory before it. Constant memory means the peak does not grow
+with ``--size-gb``.
+
+    python benchmarks/export.py --size-gb 5
+"""
+import argparse
+import hashlib
+import json
+import os
+import resource
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+MB = 1024 * 1024
+
+
+def rss_mb():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / MB
+    except OSError:
+        # Peak rather than current on systems without /proc; still an upper bound
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def write_files(store_folder, count, size, block):
+    """Distinct files of ``size`` bytes in the content-addressed layout; returns (sha256, size, relative path)."""
+    os.makedirs(store_folder, exist_ok=True)
+    files = []
+    for number in range(count):
+        header = f"file {number}\n".encode()
+        digest = hashlib.sha256()
+        temp_path = os.path.join(store_folder, f"tmp-{number}")
+        with open(temp_path, "wb") as f:
+            f.write(header)
+            digest.update(header)
+            remaining = size - len(header)
+            while remaining > 0:
+                data = block[:remaining]
+                f.write(data)
+                digest.update(data)
+                remaining -= len(data)
+
+        sha256 = digest.hexdigest()
+        path = os.path.join(store_folder, sha256[:2], sha256)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(temp_path, path)
+        files.append((sha256, size, path))
+    return files
+
+
+def seed(app, db, store_folder, size_gb, file_mb, students):
+    from sqlalchemy import insert
+    from models import User, UserAccount, Course, Enrollment, Assignments, Submission, StoredFile
+
+    file_size = file_mb * MB
+    count = max(1, int(size_gb * 1024 / file_mb))
+    files = write_files(store_folder, count, file_size, os.urandom(MB))
+
+    with app.app_context():
+        instructor = User(name="Instructor", age=40, email="instr@example.com", phone_number="0799999990", status="instr")
+        db.session.add(instructor)
+        db.session.flush()
+        course = Course(name="Archive", instructor_id=instructor.id)
+        db.session.add(course)
+        db.session.flush()
+
+        first_student = instructor.id + 1
+        db.session.execute(insert(User), [
+            {"id": first_student + n, "name": f"Student {n}", "age": 20, "email": f"s{n}@example.com",
+             "phone_number": f"07{n:08d}", "status": "student"}
+            for n in range(students)
+        ])
+        db.session.execute(insert(UserAccount), [
+            {"user_id": first_student + n, "username": f"student{n}", "password": "-"} for n in range(students)
+        ])
+        db.session.execute(insert(Enrollment), [
+            {"course_id": course.id, "student_id": first_student + n} for n in range(students)
+        ])
+
+        assignment_count = -(-count // students)
+        assignments = [
+            Assignments(course_id=course.id, title=f"Assignment {n}", text="-", assignment_type=1,
+                        deadline=datetime.now() + timedelta(days=7))
+            for n in range(assignment_count)
+        ]
+        db.session.add_all(assignments)
+        db.session.flush()
+
+        relative = lambda path: os.path.relpath(path, app.root_path)
+        db.session.execute(insert(StoredFile), [
+            {"sha256": sha256, "size": size, "path": relative(path), "scan_status": "clean"} for sha256, size, path in files
+        ])
+        db.session.execute(insert(Submission), [
+            {"assignment_id": assignments[n // students].id, "student_id": first_student + n % students,
+             "content": None, "file_name": f"project-{n}.bin", "file_path": relative(path),
+             "is_graded": False, "submitted_at": datetime.now(), "is_late": False}
+            for n, (_, _, path) in enumerate(files)
+        ])
+        db.session.commit()
+        return course.id, count * file_size
+
+
+def measure(export):
+    """Run ``export``, which reports the bytes it produces to ``progress``, while sampling resident memory."""
+    before = rss_mb()
+    samples = [before]
+    written = 0
+    done = threading.Event()
+
+    def sample():
+        while not done.wait(0.01):
+            samples.append(rss_mb())
+
+    def progress(size):
+        nonlocal written
+        written += size
+
+    sampler = threading.Thread(target=sample)
+    sampler.start()
+    started = time.perf_counter()
+    try:
+        export(progress)
+    finally:
+        seconds = time.perf_counter() - started
+        done.set()
+        sampler.join()
+    return {
+        "archive_mb": round(written / MB, 1),
+        "seconds": round(seconds, 2),
+        "mb_per_second": round(written / MB / seconds, 1),
+        "rss_before_mb": round(before, 1),
+        "rss_peak_mb": round(max(samples), 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size-gb", type=float, default=5)
+    parser.add_argument("--file-mb", type=int, default=25, help="size of each submitted file")
+    parser.add_argument("--students", type=int, default=40)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        os.environ["LMS_DATABASE_URL"] = f"sqlite:///{os.path.join(directory, 'export.db')}"
+        os.environ.setdefault("LMS_JOB_WORKERS", "0")
+        from app import create_app
+        from models import db, User
+        import exports
+
+        store_folder = os.path.join(directory, "store")
+        app = create_app({"UPLOAD_STORE_FOLDER": store_folder, "EXPORT_INLINE_LIMIT": 1 << 62})
+        course_id, total = seed(app, db, store_folder, args.size_gb, args.file_mb, args.students)
+
+        with app.app_context():
+            admin = db.session.execute(db.select(User).where(User.status == "instr")).scalar()
+            admin.status = "admin"
+            admin_id = admin.id
+            db.session.commit()
+
+        client = app.test_client()
+        with client.session_transaction() as session:
+            session["_user_id"] = str(admin_id)
+            session["_fresh"] = True
+
+        def stream(progress):
+            response = client.get(f"/courses/{course_id}/archive", buffered=False)
+            assert response.status_code == 200, response.status_code
+            for chunk in response.response:
+                progress(len(chunk))
+            response.close()
+
+        def background(progress):
+            with app.app_context():
+                exports.export_archive("course", course_id, admin_id, "archive.zip", "benchmark")
+                path = exports.export_path("benchmark")
+            progress(os.path.getsize(path))
+            os.unlink(path)
+
+        results = {
+            "files_mb": round(total / MB, 1),
+            "streamed": measure(stream),
+            "background_job": measure(background),
+        }
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
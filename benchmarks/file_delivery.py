@@ -0,0 +1,105 @@
+"""Exercise the course-file delivery path against a generated large file.
+
+Checks full downloads, ETag and Last-Modified revalidation (304), resumable
+Range/If-Range requests (206) and the X-Accel-Redirect mode through the Flask
+test client, and prints the timings as JSON.
+
+    python benchmarks/file_delivery.py --size-mb 256
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+from flask import Flask
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from file_delivery import init_file_delivery, deliver_file  # noqa: E402
+
+
+def make_app(root, mode):
+    app = Flask(__name__, root_path=root)
+    app.config["FILE_DELIVERY_MODE"] = mode
+    init_file_delivery(app)
+
+    @app.route("/files/<filename>")
+    def serve(filename):
+        return deliver_file(os.path.join(root, "uploads", filename), filename)
+
+    return app
+
+
+def timed(client, *args, **kwargs):
+    started = time.perf_counter()
+    response = client.get(*args, **kwargs)
+    body = response.get_data()
+    return response, body, round((time.perf_counter() - started) * 1000, 2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size-mb", type=int, default=64)
+    args = parser.parse_args()
+
+    results = {"size_mb": args.size_mb}
+    with tempfile.TemporaryDirectory() as root:
+        os.makedirs(os.path.join(root, "uploads"))
+        path = os.path.join(root, "uploads", "lecture.pdf")
+        with open(path, "wb") as f:
+            for _ in range(args.size_mb):
+                f.write(os.urandom(1024 * 1024))
+        size = os.path.getsize(path)
+        with open(path, "rb") as f:
+            f.seek(size // 2)
+            second_half = f.read()
+
+        client = make_app(root, "direct").test_client()
+
+        full, body, results["full_ms"] = timed(client, "/files/lecture.pdf")
+        assert full.status_code == 200 and len(body) == size
+        assert full.headers["Accept-Ranges"] == "bytes"
+        assert "private" in full.headers["Cache-Control"] and "no-cache" in full.headers["Cache-Control"]
+        etag, last_modified = full.headers["ETag"], full.headers["Last-Modified"]
+
+        response, body, results["if_none_match_ms"] = timed(
+            client, "/files/lecture.pdf", headers={"If-None-Match": etag}
+        )
+        assert response.status_code == 304 and body == b""
+
+        response, body, results["if_modified_since_ms"] = timed(
+            client, "/files/lecture.pdf", headers={"If-Modified-Since": last_modified}
+        )
+        assert response.status_code == 304 and body == b""
+
+        response, body, results["resume_second_half_ms"] = timed(
+            client, "/files/lecture.pdf", headers={"Range": f"bytes={size // 2}-", "If-Range": etag}
+        )
+        assert response.status_code == 206 and body == second_half
+        assert response.headers["Content-Range"] == f"bytes {size // 2}-{size - 1}/{size}"
+
+        response, body, results["stale_if_range_ms"] = timed(
+            client, "/files/lecture.pdf", headers={"Range": "bytes=0-99", "If-Range": '"stale"'}
+        )
+        assert response.status_code == 200 and len(body) == size
+
+        response, body, _ = timed(client, "/files/lecture.pdf", headers={"Range": f"bytes={size}-"})
+        assert response.status_code == 416
+
+        assert client.get("/files/missing.pdf").status_code == 404
+
+        accel = make_app(root, "x-accel-redirect").test_client()
+        response, body, results["x_accel_redirect_ms"] = timed(accel, "/files/lecture.pdf")
+        assert response.headers["X-Accel-Redirect"] == "/protected/uploads/lecture.pdf" and body == b""
+
+        sendfile = make_app(root, "x-sendfile").test_client()
+        response, body, results["x_sendfile_ms"] = timed(sendfile, "/files/lecture.pdf")
+        assert response.headers["X-Sendfile"] == path and body == b""
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
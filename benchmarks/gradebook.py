@@ -0,0 +1,95 @@
+"""Gradebook statistics for a large course.
+
+Fills a fresh SQLite database with one course of --students x --assignments
+grades, then times loading the grade matrix, computing the statistics and a
+cached lookup. Prints the timings in milliseconds as JSON.
+
+    python benchmarks/gradebook.py --students 500 --assignments 50
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def best_of(repeat, function, *args):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function(*args)
+        timings.append(time.perf_counter() - started)
+    return round(min(timings) * 1000, 4)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--students", type=int, default=500)
+    parser.add_argument("--assignments", type=int, default=50)
+    parser.add_argument("--missing", type=float, default=0.1, help="share of grades not given yet")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        os.environ["LMS_DATABASE_URL"] = f"sqlite:///{os.path.join(directory, 'bench.db')}"
+        import numpy as np
+        from sqlalchemy import insert
+        import gradebook
+        from app import create_app
+        from models import db, User, Course, Enrollment, Assignments, Grade
+
+        rng = random.Random(42)
+        app = create_app()
+        with app.app_context():
+            instructor = User(name="Instructor", age=40, email="instr@example.com", phone_number="0799999990", status="instr")
+            db.session.add(instructor)
+            db.session.flush()
+            course = Course(name="Course", instructor_id=instructor.id)
+            db.session.add(course)
+            db.session.flush()
+            course_id = course.id
+
+            db.session.execute(insert(User), [
+                {"name": f"Student {i}", "age": 20, "email": f"s{i}@example.com", "phone_number": f"07{i:08d}", "status": "student"}
+                for i in range(args.students)
+            ])
+            db.session.execute(insert(Assignments), [
+                {"course_id": course_id, "title": f"Assignment {i}", "text": "-", "assignment_type": 1,
+                 "deadline": datetime(2030, 1, 1), "weight": rng.choice((1.0, 2.0, 3.0))}
+                for i in range(args.assignments)
+            ])
+            student_ids = db.session.execute(db.select(User.id).where(User.status == "student")).scalars().all()
+            assignment_ids = db.session.execute(db.select(Assignments.id)).scalars().all()
+            db.session.execute(insert(Enrollment), [{"course_id": course_id, "student_id": s} for s in student_ids])
+            db.session.execute(insert(Grade), [
+                {"student_id": s, "course_id": course_id, "assignment_id": a, "grade": round(rng.uniform(1, 10), 2)}
+                for s in student_ids for a in assignment_ids if rng.random() >= args.missing
+            ])
+            db.session.commit()
+
+            matrix = gradebook.load_matrix(course_id)
+            results = {
+                "students": args.students,
+                "assignments": args.assignments,
+                "grades": int((~np.isnan(matrix[2])).sum()),
+                "load_matrix_ms": best_of(args.repeat, gradebook.load_matrix, course_id),
+                "compute_statistics_ms": best_of(args.repeat, gradebook.compute_statistics, *matrix),
+            }
+
+            gradebook.gradebook_cache.clear()
+            results["uncached_ms"] = best_of(1, gradebook.course_gradebook, course_id)
+            results["cached_ms"] = best_of(args.repeat, gradebook.course_gradebook, course_id)
+
+            db.engine.dispose()
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,353 @@
+"""Latency, throughput and queries per request of the main routes under load.
+
+Seeds a fresh SQLite database with ``synthetic_data`` (``--rows`` rows in
+total), then drives the real routes as logged-in students and instructors:
+
+- ``log_in``: a student signs in (includes the password hash check);
+- ``my_courses``, ``view_grades``: a student's pages;
+- ``serve_file``: a student downloads a course material;
+- ``solve_assignment``: a student submits an assignment not submitted yet;
+- ``grade_assignments``: an instructor opens the grading queue, and
+  ``grade_assignments_post`` grades ten submissions from it.
+
+Each scenario runs once through the Flask test client (in-process, one
+request at a time) and once over HTTP against a threaded local server with
+``--threads`` concurrent connections. The number of SQL statements per
+request comes from the app's own metrics. The report is JSON, so two commits
+can be compared with ``diff`` or a script:
+
+    python benchmarks/load_test.py --rows 100000 --requests 500 --threads 8 > after.json
+"""
+import argparse
+import http.client
+import json
+import logging
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.cookies import SimpleCookie
+from urllib.parse import urlencode
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import synthetic_data  # noqa: E402
+
+VIRTUAL_USERS = 50
+GRADE_BATCH = 10
+
+
+def percentile_ms(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, round(fraction * len(sorted_values)) - 1))
+    return round(sorted_values[index] * 1000, 2)
+
+
+def summarize(latencies, statuses, elapsed, statements):
+    latencies = sorted(latencies)
+    return {
+        "requests": len(latencies),
+        "errors": sum(1 for status in statuses if status >= 400),
+        "throughput_rps": round(len(latencies) / elapsed, 1) if elapsed else None,
+        "p50_ms": percentile_ms(latencies, 0.50),
+        "p95_ms": percentile_ms(latencies, 0.95),
+        "p99_ms": percentile_ms(latencies, 0.99),
+        "queries_per_request": statements,
+    }
+
+
+def statement_totals(metrics, endpoint):
+    """``(sum, count)`` of the statements-per-request histogram of an endpoint."""
+    series = metrics.statements_per_request.values.get((endpoint,))
+    return (series[1], sum(series[0])) if series else (0, 0)
+
+
+class Scenario:
+    """A named stream of requests: ``next_request(number)`` returns ``(user, method, path, form)``."""
+
+    def __init__(self, name, endpoint, next_request):
+        self.name = name
+        self.endpoint = endpoint
+        self.next_request = next_request
+
+
+def build_scenarios(app, db, students, instructors):
+    from models import Enrollment, Assignments, Submission, Course, CourseMaterial
+
+    rng = random.Random(3)
+    with app.app_context():
+        student_ids = [user_id for user_id, _ in students]
+        open_pairs = db.session.execute(
+            db.select(Enrollment.student_id, Assignments.id)
+            .join(Assignments, Assignments.course_id == Enrollment.course_id)
+            .outerjoin(Submission, (Submission.assignment_id == Assignments.id) & (Submission.student_id == Enrollment.student_id))
+            .where(Enrollment.student_id.in_(student_ids), Submission.id.is_(None))
+        ).all()
+        materials = db.session.execute(
+            db.select(Enrollment.student_id, CourseMaterial.course_id, CourseMaterial.file_name)
+            .join(CourseMaterial, CourseMaterial.course_id == Enrollment.course_id)
+            .where(Enrollment.student_id.in_(student_ids))
+        ).all()
+        ungraded = {}
+        for instructor_id, submission_id in db.session.execute(
+            db.select(Course.instructor_id, Submission.id)
+            .join(Assignments, Assignments.course_id == Course.id)
+            .join(Submission, Submission.assignment_id == Assignments.id)
+            .where(Course.instructor_id.in_([user_id for user_id, _ in instructors]), Submission.is_graded == False)
+        ):
+            ungraded.setdefault(instructor_id, []).append(submission_id)
+
+    rng.shuffle(open_pairs)
+    grading_batches = [
+        (instructor_id, submission_ids[start:start + GRADE_BATCH])
+        for instructor_id, submission_ids in ungraded.items()
+        for start in range(0, len(submission_ids), GRADE_BATCH)
+    ]
+    rng.shuffle(grading_batches)
+    lock = threading.Lock()
+
+    def take(items):
+        with lock:
+            return items.pop() if items else None
+
+    def student(number):
+        return students[number % len(students)]
+
+    def log_in(number):
+        return None, "POST", "/login", {"username": student(number)[1], "password": synthetic_data.PASSWORD}
+
+    def solve_assignment(number):
+        pair = take(open_pairs)
+        if pair is None:
+            return None
+        return pair[0], "POST", f"/solve_assignment/{pair[1]}", {"content": "Load test submission"}
+
+    def serve_file(number):
+        student_id, course_id, file_name = materials[number % len(materials)]
+        return student_id, "GET", f"/files/{course_id}/{file_name}", None
+
+    def grade_assignments_post(number):
+        batch = take(grading_batches)
+        if batch is None:
+            return None
+        instructor_id, submission_ids = batch
+        form = {f"grade-{submission_id}": "8" for submission_id in submission_ids}
+        form.update({f"feedback-{submission_id}": "Good" for submission_id in submission_ids})
+        return instructor_id, "POST", "/grade_assignments", form
+
+    return [
+        Scenario("log_in", "log_in", log_in),
+        Scenario("my_courses", "my_courses", lambda number: (student(number)[0], "GET", "/my_courses", None)),
+        Scenario("view_grades", "view_grades", lambda number: (student(number)[0], "GET", "/grades", None)),
+        Scenario("serve_file", "serve_file", serve_file),
+        Scenario("solve_assignment", "solve_assignment", solve_assignment),
+        Scenario("grade_assignments", "grade_assignments",
+                 lambda number: (instructors[number % len(instructors)][0], "GET", "/grade_assignments", None)),
+        Scenario("grade_assignments_post", "grade_assignments", grade_assignments_post),
+    ]
+
+
+def client_sessions(app, users):
+    clients = {}
+    for user_id, username in users:
+        client = app.test_client()
+        client.post("/login", data={"username": username, "password": synthetic_data.PASSWORD})
+        clients[user_id] = client
+    return clients
+
+
+def run_client(app, metrics, scenario, requests, clients):
+    """Send the scenario's requests one at a time through the Flask test client."""
+    latencies, statuses = [], []
+    before = statement_totals(metrics, scenario.endpoint)
+    started = time.perf_counter()
+    for number in range(requests):
+        spec = scenario.next_request(number)
+        if spec is None:
+            break
+        user_id, method, path, form = spec
+        client = clients[user_id] if user_id is not None else app.test_client()
+
+        request_started = time.perf_counter()
+        response = client.open(path, method=method, data=form)
+        response.close()
+        latencies.append(time.perf_counter() - request_started)
+        statuses.append(response.status_code)
+    elapsed = time.perf_counter() - started
+
+    return summarize(latencies, statuses, elapsed, statements_per_request(metrics, scenario.endpoint, before))
+
+
+def statements_per_request(metrics, endpoint, before):
+    total, count = statement_totals(metrics, endpoint)
+    count -= before[1]
+    return round((total - before[0]) / count, 1) if count else None
+
+
+class HttpUser:
+    """One keep-alive connection with the session cookie of a signed-in user."""
+
+    def __init__(self, port):
+        self.port = port
+        self.connection = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+        self.cookie = None
+
+    def request(self, method, path, form=None):
+        headers = {"Cookie": self.cookie} if self.cookie else {}
+        body = None
+        if form is not None:
+            body = urlencode(form)
+            headers["Content-Type"] = "application/x-www-form-urlencoded"
+
+        self.connection.request(method, path, body=body, headers=headers)
+        response = self.connection.getresponse()
+        response.read()
+        if response.getheader("Set-Cookie"):
+            cookie = SimpleCookie(response.getheader("Set-Cookie"))
+            self.cookie = "; ".join(f"{name}={morsel.value}" for name, morsel in cookie.items())
+        return response.status
+
+    def close(self):
+        self.connection.close()
+
+
+def http_sessions(port, users):
+    """Session cookies of the signed-in users."""
+    sessions = {}
+    for user_id, username in users:
+        user = HttpUser(port)
+        user.request("POST", "/login", {"username": username, "password": synthetic_data.PASSWORD})
+        sessions[user_id] = user.cookie
+        user.close()
+    return sessions
+
+
+def run_http(port, metrics, scenario, requests, sessions, threads):
+    """Send the scenario's requests from ``threads`` concurrent connections."""
+    counter = iter(range(requests))
+    counter_lock = threading.Lock()
+    latencies, statuses = [], []
+
+    def worker():
+        connection = HttpUser(port)
+        while True:
+            with counter_lock:
+                number = next(counter, None)
+            if number is None:
+                break
+            spec = scenario.next_request(number)
+            if spec is None:
+                break
+            user_id, method, path, form = spec
+            connection.cookie = sessions.get(user_id)
+
+            request_started = time.perf_counter()
+            status = connection.request(method, path, form)
+            elapsed = time.perf_counter() - request_started
+            with counter_lock:
+                latencies.append(elapsed)
+                statuses.append(status)
+        connection.close()
+
+    before = statement_totals(metrics, scenario.endpoint)
+    started = time.perf_counter()
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    return summarize(latencies, statuses, elapsed, statements_per_request(metrics, scenario.endpoint, before))
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=10000, help="synthetic dataset size, 1000 to 1000000")
+    parser.add_argument("--requests", type=int, default=200, help="requests per scenario and mode")
+    parser.add_argument("--threads", type=int, default=8, help="concurrent HTTP connections")
+    parser.add_argument("--mode", choices=("client", "http", "both"), default="both")
+    parser.add_argument("--hash-method", default=None, help="password hash method (default: LMS_PASSWORD_HASH_METHOD)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        os.environ["LMS_DATABASE_URL"] = f"sqlite:///{os.path.join(directory, 'load.db')}"
+        os.environ["LMS_JOB_WORKERS"] = "0"
+        from werkzeug.serving import make_server
+
+        import metrics
+        import passwords
+        if args.hash_method:
+            # Seeded passwords and login checks must use the same method, or every login rehashes
+            passwords.hash_method = args.hash_method
+        from app import create_app
+        from models import db
+
+        # Forms are posted without their CSRF token; uploads go to the temp directory; every user logs in from one address
+        app = create_app({"WTF_CSRF_ENABLED": False, "UPLOAD_STORE_FOLDER": os.path.join(directory, "store"), "RATE_LIMITS": {}})
+        logging.getLogger("werkzeug").setLevel(logging.ERROR)
+        # Statement counts are in the report; the per-request warnings would drown it
+        logging.getLogger("lms.slow_queries").setLevel(logging.ERROR)
+
+        started = time.perf_counter()
+        with app.app_context(), db.engine.begin() as connection:
+            counts = synthetic_data.seed(
+                connection, args.rows, app.config["UPLOAD_STORE_FOLDER"], passwords.hash_password(synthetic_data.PASSWORD)
+            )
+        results = {
+            "commit": git_commit(),
+            "rows": sum(counts.values()),
+            "tables": counts,
+            "seed_seconds": round(time.perf_counter() - started, 1),
+            "requests_per_scenario": args.requests,
+            "threads": args.threads,
+        }
+
+        with app.app_context():
+            from models import User, UserAccount
+            people = db.session.execute(
+                db.select(User.id, UserAccount.username, User.status).join(UserAccount, UserAccount.user_id == User.id)
+            ).all()
+        students = [(user_id, username) for user_id, username, status in people if status == "student"][:VIRTUAL_USERS]
+        instructors = [(user_id, username) for user_id, username, status in people if status == "instr"][:VIRTUAL_USERS]
+
+        if args.mode in ("client", "both"):
+            clients = client_sessions(app, students + instructors)
+            results["client"] = {
+                scenario.name: run_client(app, metrics, scenario, args.requests, clients)
+                for scenario in build_scenarios(app, db, students, instructors)
+            }
+
+        if args.mode in ("http", "both"):
+            server = make_server("127.0.0.1", 0, app, threaded=True)
+            thread = threading.Thread(target=server.serve_forever, daemon=True)
+            thread.start()
+            try:
+                sessions = http_sessions(server.port, students + instructors)
+                results["http"] = {
+                    scenario.name: run_http(server.port, metrics, scenario, args.requests, sessions, args.threads)
+                    for scenario in build_scenarios(app, db, students, instructors)
+                }
+            finally:
+                server.shutdown()
+
+        with app.app_context():
+            db.engine.dispose()
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
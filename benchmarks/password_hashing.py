@@ -0,0 +1,59 @@
+"""Logins per second at several password hashing cost settings.
+
+Each setting hashes one password and then verifies it from a number of
+concurrent "request" threads through passwords.verify_password, i.e. through
+the bounded hashing pool that log_in uses.
+
+    python benchmarks/password_hashing.py --logins 64 --threads 16
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import passwords  # noqa: E402
+
+METHODS = [
+    "pbkdf2:sha256:260000",
+    "pbkdf2:sha256:600000",
+    "scrypt:16384:8:1",
+    "scrypt:32768:8:1",
+    "scrypt:65536:8:1",
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--logins", type=int, default=64, help="logins per cost setting")
+    parser.add_argument("--threads", type=int, default=16, help="concurrent request threads")
+    parser.add_argument("--methods", nargs="*", default=METHODS)
+    args = parser.parse_args()
+
+    results = {"hash_workers": passwords.pool_size, "request_threads": args.threads, "methods": {}}
+    for method in args.methods:
+        passwords.hash_method = method
+        stored = passwords.hash_password("correct horse battery staple")
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.threads) as requests:
+            outcomes = list(requests.map(
+                lambda _: passwords.verify_password(stored, "correct horse battery staple"),
+                range(args.logins)
+            ))
+        elapsed = time.perf_counter() - started
+
+        assert all(matches and not needs_rehash for matches, needs_rehash in outcomes)
+        results["methods"][method] = {
+            "logins_per_second": round(args.logins / elapsed, 1),
+            "cpu_ms_per_login": round(elapsed / args.logins * 1000 * min(args.threads, passwords.pool_size), 1),
+        }
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+"""Overhead of the login rate limits, per bucket update and per request.
+
+Times ``take`` on the in-process and the shared (memory-mapped file) bucket
+tables and the whole check of a login request (IP and username buckets).
+Then times failed login attempts through the test client from ``--clients``
+addresses:
+- with no limits;
+- with limits too generous to refuse anything, for each backend;
+- refused by the limit.
+The check is too small to show up next to the rest of a login request; the
+last case shows what an attack costs once it is refused.
+
+    python benchmarks/rate_limit.py --requests 5000
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+NEVER_REFUSED = "log_in:ip=1000000000/1,username=1000000000/1"
+
+
+def time_buckets(buckets, keys, operations):
+    names = [f"log_in:ip:10.0.{n // 256}.{n % 256}" for n in range(keys)]
+    started = time.perf_counter()
+    for n in range(operations):
+        buckets.take(names[n % keys], 1000000000, 1)
+    return round((time.perf_counter() - started) / operations * 1e6, 2)
+
+
+def time_check(app, operations):
+    """The rate limit check of one login request, both buckets, with the form already parsed."""
+    import rate_limits
+
+    limits = app.config["RATE_LIMITS"]["log_in"]
+    with app.test_request_context("/login", method="POST", data={"username": "nobody", "password": "guess"}):
+        rate_limits.enforce("log_in", limits)
+        started = time.perf_counter()
+        for _ in range(operations):
+            rate_limits.enforce("log_in", limits)
+        return round((time.perf_counter() - started) / operations * 1e6, 2)
+
+
+def time_logins(app, requests, clients):
+    client = app.test_client()
+    latencies = []
+    statuses = set()
+    for n in range(requests):
+        environ = {"REMOTE_ADDR": f"10.1.{n % clients // 256}.{n % clients % 256}"}
+        started = time.perf_counter()
+        response = client.post("/login", data={"username": f"nobody{n % clients}", "password": "guess"},
+                               environ_base=environ)
+        latencies.append(time.perf_counter() - started)
+        statuses.add(response.status_code)
+    latencies.sort()
+    return {
+        "statuses": sorted(statuses),
+        "p50_us": round(statistics.median(latencies) * 1e6, 1),
+        "p99_us": round(latencies[int(len(latencies) * 0.99)] * 1e6, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--clients", type=int, default=1000, help="distinct client addresses and usernames")
+    parser.add_argument("--operations", type=int, default=200000, help="bucket updates to time per backend")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        os.environ["LMS_DATABASE_URL"] = f"sqlite:///{os.path.join(directory, 'rate_limit.db')}"
+        os.environ["LMS_RATE_LIMIT_FILE"] = os.path.join(directory, "rate-limits")
+        os.environ.setdefault("LMS_JOB_WORKERS", "0")
+        from app import create_app
+        import rate_limits
+
+        shared = rate_limits.SharedBuckets(os.path.join(directory, "buckets"))
+        results = {
+            "take_us": {
+                "memory": time_buckets(rate_limits.MemoryBuckets(), args.clients, args.operations),
+                "shared": time_buckets(shared, args.clients, args.operations),
+            },
+            "check_us": {},
+            "login_attempt": {},
+        }
+
+        config = {"WTF_CSRF_ENABLED": False}
+        for name, backend, limits in (
+            ("no_limits", "memory", "off"),
+            ("memory", "memory", NEVER_REFUSED),
+            ("shared", "shared", NEVER_REFUSED),
+            ("refused", "memory", "log_in:ip=1/3600"),
+        ):
+            os.environ["LMS_RATE_LIMIT_BACKEND"] = backend
+            app = create_app(dict(config, RATE_LIMITS=rate_limits.parse_limits(limits)))
+            if limits == NEVER_REFUSED:
+                results["check_us"][name] = time_check(app, args.operations)
+            if name == "refused":
+                # Use up every client's token first
+                time_logins(app, args.clients, args.clients)
+            time_logins(app, min(args.requests, 500), args.clients)
+            results["login_attempt"][name] = time_logins(app, args.requests, args.clients)
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
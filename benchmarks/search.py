@@ -0,0 +1,145 @@
+"""Full-text search latency on a large synthetic corpus.
+
+Builds the FTS5 search index in a fresh SQLite file with --documents entries
+spread over --courses courses (words drawn from a Zipf-like vocabulary), then
+times queries scoped the way a student, an instructor and an admin see the
+index. Prints build time and p50/p95 query latency in milliseconds as JSON.
+
+    python benchmarks/search.py --documents 1000000
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+from sqlalchemy import create_engine, insert, text
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import search  # noqa: E402
+from database import configure_engine  # noqa: E402
+from models import db, Course  # noqa: E402
+
+SYLLABLES = ["ka", "lo", "mi", "ne", "ru", "ta", "vi", "so", "pe", "da", "zu", "fo", "gri", "sta", "ble", "tron"]
+
+
+def vocabulary(size, rng):
+    words = set()
+    while len(words) < size:
+        words.add("".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))))
+    return sorted(words, key=lambda word: rng.random())
+
+
+def documents(count, courses, words, rng, words_per_document=40):
+    # Zipf-like weights: the n-th word is about 1/n as frequent as the first
+    cumulative, total = [], 0.0
+    for rank in range(1, len(words) + 1):
+        total += 1.0 / rank
+        cumulative.append(total)
+
+    for object_id in range(1, count + 1):
+        kind = rng.choice(("material", "assignment", "submission", "submission"))
+        course_id = rng.randint(1, courses)
+        student_id = rng.randint(1, courses * 20)
+        body = " ".join(rng.choices(words, cum_weights=cumulative, k=words_per_document))
+        title = " ".join(rng.choices(words, cum_weights=cumulative, k=3))
+        yield {
+            "rowid": search.rowid(kind, object_id),
+            "title": title,
+            "body": body,
+            "scope": f"s{course_id} u{student_id}" if kind == "submission" else f"c{course_id}",
+            "kind": search.KINDS[kind],
+            "course_id": course_id,
+            "owner_id": student_id if kind == "submission" else None,
+        }
+
+
+def timed_queries(connection, queries, scope, repeat):
+    results = {}
+    for label, query in queries.items():
+        expression = search.match_expression(query)
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            rows = search.run_query(connection, expression, scope)
+            timings.append((time.perf_counter() - started) * 1000)
+        timings.sort()
+        results[label] = {
+            "query": query,
+            "hits": len(rows),
+            "p50_ms": round(statistics.median(timings), 2),
+            "p95_ms": round(timings[int(len(timings) * 0.95) - 1], 2),
+        }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--documents", type=int, default=1000000)
+    parser.add_argument("--courses", type=int, default=2000)
+    parser.add_argument("--vocabulary", type=int, default=50000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    rng = random.Random(7)
+    words = vocabulary(args.vocabulary, rng)
+
+    with tempfile.TemporaryDirectory() as directory:
+        engine = create_engine(f"sqlite:///{os.path.join(directory, 'search.db')}")
+        configure_engine(engine)
+        db.metadata.create_all(engine, tables=[Course.__table__])
+
+        with engine.begin() as connection:
+            connection.execute(insert(Course), [
+                {"id": course_id, "name": f"Course {course_id}", "instructor_id": 1}
+                for course_id in range(1, args.courses + 1)
+            ])
+
+        started = time.perf_counter()
+        with engine.begin() as connection:
+            batch = []
+            for document in documents(args.documents, args.courses, words, rng):
+                batch.append(document)
+                if len(batch) == 10000:
+                    connection.execute(search.INSERT_ENTRY, batch)
+                    batch = []
+            if batch:
+                connection.execute(search.INSERT_ENTRY, batch)
+            connection.execute(text("INSERT INTO search_index (search_index) VALUES ('optimize')"))
+        build_seconds = time.perf_counter() - started
+
+        queries = {
+            "most_common_word": words[0],
+            "common_word": words[10],
+            "mid_frequency_word": words[1000],
+            "rare_word": words[-1],
+            "two_words": f"{words[5]} {words[50]}",
+            "prefix": words[20][:3],
+        }
+        student_scope = [f"c{course_id}" for course_id in rng.sample(range(1, args.courses + 1), 6)] + ["u17"]
+        instructor_scope = [
+            token for course_id in rng.sample(range(1, args.courses + 1), 3) for token in (f"c{course_id}", f"s{course_id}")
+        ]
+
+        with engine.connect() as connection:
+            results = {
+                "documents": args.documents,
+                "courses": args.courses,
+                "build_seconds": round(build_seconds, 1),
+                "index_mb": round(os.path.getsize(os.path.join(directory, "search.db")) / 1024 / 1024, 1),
+                "student": timed_queries(connection, queries, student_scope, args.repeat),
+                "instructor": timed_queries(connection, queries, instructor_scope, args.repeat),
+                "admin": timed_queries(connection, queries, None, args.repeat),
+            }
+
+        engine.dispose()
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
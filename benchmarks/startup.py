@@ -0,0 +1,89 @@
+"""Startup time of a worker process: importing the application, ``create_app`` and the first request.
+
+Every measurement is taken in a fresh interpreter, as a restarted worker
+would be, against a new database (which ``create_app`` has to create) and
+against one that already exists (by then the compiled templates are cached
+too), then once more with no precompiled or cached templates. Also lists the slowest top-level imports.
+
+    python benchmarks/startup.py --runs 10
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = """
+import json, time
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+application = app.create_app()
+created = time.perf_counter()
+response = application.test_client().get("/login")
+assert response.status_code == 200, response.status_code
+answered = time.perf_counter()
+print(json.dumps({"import": imported - started, "create_app": created - imported, "first_request": answered - created}))
+"""
+
+
+def probe(environment):
+    output = subprocess.run([sys.executable, "-c", PROBE], cwd=ROOT, env=environment, capture_output=True, text=True, check=True)
+    return json.loads(output.stdout)
+
+
+def slowest_imports(environment, count):
+    output = subprocess.run([sys.executable, "-X", "importtime", "-c", "import app"],
+                            cwd=ROOT, env=environment, capture_output=True, text=True, check=True)
+    imports = []
+    for line in output.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if cumulative.strip().isdigit() and "." not in name.strip():
+            imports.append((int(cumulative), name.strip()))
+    return {name: round(microseconds / 1000, 1) for microseconds, name in sorted(imports, reverse=True)[:count]}
+
+
+def summarize(samples):
+    return {
+        phase: round(statistics.median(sample[phase] for sample in samples) * 1000, 1)
+        for phase in ("import", "create_app", "first_request")
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--imports", type=int, default=10, help="how many of the slowest imports to list")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        environment = dict(os.environ, LMS_JOB_WORKERS="0", LMS_SUBMISSION_GROUP_COMMIT="off")
+        new_database, existing_database, not_precompiled = [], [], []
+        for run in range(args.runs):
+            database = os.path.join(directory, f"startup-{run}.db")
+            environment["LMS_DATABASE_URL"] = f"sqlite:///{database}"
+            # Each run starts with no compiled templates, like a fresh deploy
+            environment["LMS_TEMPLATE_CACHE_DIR"] = os.path.join(directory, f"jinja-cache-{run}")
+            new_database.append(probe(environment))
+            existing_database.append(probe(environment))
+            not_precompiled.append(probe(dict(environment, LMS_PRECOMPILE_TEMPLATES="off", LMS_TEMPLATE_CACHE_DIR="")))
+
+        results = {
+            "runs": args.runs,
+            "new_database_ms": summarize(new_database),
+            "existing_database_ms": summarize(existing_database),
+            "existing_database_templates_not_compiled_ms": summarize(not_precompiled),
+            "slowest_imports_ms": slowest_imports(environment, args.imports),
+        }
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,222 @@
+"""The rush of submissions in the last minutes before a deadline.
+
+Starts ``--processes`` server processes on one SQLite database, like a
+multi-worker deployment, and has ``--concurrency`` clients post
+``--submissions`` submissions to one assignment as fast as they can. This is
+done twice: once with every request committing its own transaction
+(``LMS_SUBMISSION_GROUP_COMMIT=off``), and once with submissions staged and
+group-committed. For each mode it prints, as JSON:
+- request latency and errors;
+- how many submissions reached the database;
+- the lag between sending a submission and the server timestamp it got,
+  which decides whether it counts as late.
+
+    python benchmarks/submission_spike.py --processes 4 --concurrency 200 --submissions 2000
+"""
+import argparse
+import http.client
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+from urllib.parse import urlencode
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import synthetic_data  # noqa: E402
+
+
+def serve(ports, environment, store_folder):
+    os.environ.update(environment)
+    import logging
+    from werkzeug.serving import make_server
+    from app import create_app
+
+    app = create_app({"WTF_CSRF_ENABLED": False, "UPLOAD_STORE_FOLDER": store_folder})
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    logging.getLogger("lms.slow_queries").setLevel(logging.CRITICAL)
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    ports.put(server.port)
+    server.serve_forever()
+
+
+def percentile_ms(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, round(fraction * len(sorted_values)) - 1))
+    return round(sorted_values[index] * 1000, 2)
+
+
+def spike_assignment(app, db, students):
+    """A new course with ``students`` enrolled and one assignment due now; returns its id and the student ids."""
+    from sqlalchemy import insert, select
+    from models import Course, Enrollment, Assignments, User
+
+    with app.app_context():
+        course = Course(name=f"Spike {time.time()}", instructor_id=2)
+        db.session.add(course)
+        db.session.flush()
+        student_ids = db.session.execute(
+            select(User.id).where(User.status == "student").order_by(User.id).limit(students)
+        ).scalars().all()
+        db.session.execute(insert(Enrollment), [{"course_id": course.id, "student_id": student_id} for student_id in student_ids])
+        assignment = Assignments(course_id=course.id, title="Final project", text="Due now", assignment_type=1,
+                                 deadline=datetime.now() + timedelta(days=1))
+        db.session.add(assignment)
+        db.session.commit()
+        return assignment.id, student_ids
+
+
+def session_cookies(app, db, student_ids):
+    """Session cookies for the students, signed with the app's key and valid in every server process."""
+    from models import UserAccount
+
+    cookies = {}
+    with app.app_context():
+        usernames = dict(db.session.execute(
+            db.select(UserAccount.user_id, UserAccount.username).where(UserAccount.user_id.in_(student_ids))
+        ).all())
+    for student_id in student_ids:
+        client = app.test_client()
+        client.post("/login", data={"username": usernames[student_id], "password": synthetic_data.PASSWORD})
+        cookies[student_id] = f"session={client.get_cookie('session').value}"
+    return cookies
+
+
+def run_spike(ports, assignment_id, cookies, concurrency):
+    pending = list(cookies.items())
+    lock = threading.Lock()
+    latencies, statuses, sent_at = [], [], {}
+
+    def client(number):
+        connection = http.client.HTTPConnection("127.0.0.1", ports[number % len(ports)], timeout=120)
+        while True:
+            with lock:
+                if not pending:
+                    break
+                student_id, cookie = pending.pop()
+            body = urlencode({"content": f"Final project of {student_id}"})
+            headers = {"Cookie": cookie, "Content-Type": "application/x-www-form-urlencoded"}
+
+            started = time.perf_counter()
+            sent = datetime.now()
+            try:
+                connection.request("POST", f"/solve_assignment/{assignment_id}", body=body, headers=headers)
+                response = connection.getresponse()
+                response.read()
+                status = response.status
+            except (OSError, http.client.HTTPException):
+                connection.close()
+                connection = http.client.HTTPConnection("127.0.0.1", ports[number % len(ports)], timeout=120)
+                status = 599
+            elapsed = time.perf_counter() - started
+            with lock:
+                latencies.append(elapsed)
+                statuses.append(status)
+                sent_at[student_id] = sent
+        connection.close()
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=client, args=(number,)) for number in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, statuses, sent_at, time.perf_counter() - started
+
+
+def run_mode(app, db, args, environment, store_folder):
+    from models import Submission
+
+    assignment_id, student_ids = spike_assignment(app, db, args.submissions)
+    cookies = session_cookies(app, db, student_ids)
+
+    context = multiprocessing.get_context("spawn")
+    ports_queue = context.Queue()
+    servers = [context.Process(target=serve, args=(ports_queue, environment, store_folder), daemon=True)
+               for _ in range(args.processes)]
+    for server in servers:
+        server.start()
+    ports = [ports_queue.get(timeout=60) for _ in servers]
+
+    try:
+        latencies, statuses, sent_at, elapsed = run_spike(ports, assignment_id, cookies, args.concurrency)
+        # Submissions still staged when their request gave up waiting
+        time.sleep(2)
+    finally:
+        for server in servers:
+            server.terminate()
+            server.join()
+
+    with app.app_context():
+        stored = db.session.execute(
+            db.select(Submission.student_id, Submission.submitted_at).where(Submission.assignment_id == assignment_id)
+        ).all()
+    lags = sorted(
+        (submitted_at - sent_at[student_id]).total_seconds()
+        for student_id, submitted_at in stored if submitted_at is not None and student_id in sent_at
+    )
+    latencies.sort()
+
+    return {
+        "requests": len(latencies),
+        "errors": sum(1 for status in statuses if status >= 400),
+        "stored": len(stored),
+        "seconds": round(elapsed, 2),
+        "throughput_rps": round(len(latencies) / elapsed, 1),
+        "p50_ms": percentile_ms(latencies, 0.50),
+        "p95_ms": percentile_ms(latencies, 0.95),
+        "p99_ms": percentile_ms(latencies, 0.99),
+        "timestamp_lag_p50_ms": percentile_ms(lags, 0.50),
+        "timestamp_lag_max_ms": percentile_ms(lags, 1.0),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--submissions", type=int, default=2000)
+    parser.add_argument("--rows", type=int, default=200000, help="size of the synthetic dataset around the spike")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        database = os.path.join(directory, "spike.db")
+        store_folder = os.path.join(directory, "store")
+        environment = {
+            "LMS_DATABASE_URL": f"sqlite:///{database}",
+            "LMS_PASSWORD_HASH_METHOD": "pbkdf2:sha256:1000",
+            "LMS_JOB_WORKERS": "0",
+            # Every student logs in from the same address
+            "LMS_RATE_LIMITS": "off",
+        }
+        os.environ.update(environment)
+        # The coordinating process only seeds and checks; it must not drain the staging folder itself
+        os.environ["LMS_SUBMISSION_GROUP_COMMIT"] = "off"
+
+        import passwords
+        from app import create_app
+        from models import db
+
+        app = create_app({"WTF_CSRF_ENABLED": False, "UPLOAD_STORE_FOLDER": store_folder})
+        with app.app_context(), db.engine.begin() as connection:
+            synthetic_data.seed(connection, max(args.rows, args.submissions * 45), store_folder,
+                                passwords.hash_password(synthetic_data.PASSWORD))
+
+        results = {"processes": args.processes, "concurrency": args.concurrency, "submissions": args.submissions}
+        for mode, group_commit in (("commit_per_request", "off"), ("group_commit", "on")):
+            results[mode] = run_mode(app, db, args, dict(environment, LMS_SUBMISSION_GROUP_COMMIT=group_commit), store_folder)
+
+        with app.app_context():
+            db.engine.dispose()
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
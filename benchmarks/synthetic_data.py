@@ -0,0 +1,223 @@
+"""Synthetic dataset for load tests, written through the application's models.
+
+``seed`` fills an empty database with students, instructors, courses,
+enrollments, assignments, submissions, grades and course materials, sized so
+that the total row count is close to ``rows``. Material files are real files
+in the upload store, so downloads can be benchmarked. The derived tables
+(statistics counters, course versions, search index) are rebuilt at the end,
+the same way the maintenance commands do.
+
+Every account's password is ``password``. Users are named ``admin``,
+``instructor<n>`` and ``student<n>``.
+
+    python benchmarks/synthetic_data.py --rows 100000 --database /tmp/lms.db
+"""
+import argparse
+import hashlib
+import json
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+PASSWORD = "password"
+WORDS = (
+    "python generators iterators recursion sorting graphs trees hashing queues stacks complexity "
+    "proof induction database index transaction normalization join network socket protocol thread "
+    "lock deadlock cache memory pointer compiler parser grammar matrix vector gradient regression"
+).split()
+
+
+def sizes_for(rows):
+    """Table sizes adding up to roughly ``rows`` rows in total."""
+    students = max(10, rows // 42)
+    courses = max(4, students // 25)
+    return {
+        "students": students,
+        "courses": courses,
+        "instructors": max(1, courses // 3),
+        "enrollments_per_student": min(4, courses),
+        "assignments_per_course": 10,
+        "materials_per_course": 3,
+        "material_files": 20,
+        "submission_rate": 0.6,
+        "graded_rate": 0.5,
+    }
+
+
+def sentence(rng, words):
+    return " ".join(rng.choice(WORDS) for _ in range(words))
+
+
+def insert_batches(connection, model, rows, batch_size=5000):
+    batch, count = [], 0
+    for row in rows:
+        batch.append(row)
+        if len(batch) == batch_size:
+            connection.execute(insert(model), batch)
+            count += len(batch)
+            batch = []
+    if batch:
+        connection.execute(insert(model), batch)
+        count += len(batch)
+    return count
+
+
+def write_material_files(store_folder, count, rng, size=256 * 1024):
+    """Write ``count`` distinct files into the upload store and return their ``StoredFile`` rows."""
+    files = []
+    for number in range(count):
+        data = rng.randbytes(size)
+        digest = hashlib.sha256(data).hexdigest()
+        path = os.path.join(store_folder, digest[:2], digest)
+        os.makedirs(os.path.join(ROOT, os.path.dirname(path)), exist_ok=True)
+        with open(os.path.join(ROOT, path), "wb") as f:
+            f.write(data)
+        files.append({"sha256": digest, "size": size, "path": path, "scan_status": "clean"})
+    return files
+
+
+def seed(connection, rows, store_folder, password_hash, seed_value=1):
+    """Fill an empty database and return the number of rows written per table."""
+    import course_progress
+    import page_cache
+    import search
+    import site_statistics
+    from models import (
+        User, UserAccount, Course, Enrollment, CourseMaterial, Assignments, Submission, Grade, StoredFile
+    )
+
+    rng = random.Random(seed_value)
+    sizes = sizes_for(rows)
+    counts = {}
+
+    # Ids are assigned here, so no table has to be read back
+    instructor_ids = list(range(2, 2 + sizes["instructors"]))
+    student_ids = list(range(instructor_ids[-1] + 1, instructor_ids[-1] + 1 + sizes["students"]))
+    users = [(1, "admin", "Admin", "admin")]
+    users += [(user_id, f"instructor{n}", f"Instructor {n}", "instr") for n, user_id in enumerate(instructor_ids)]
+    users += [(user_id, f"student{n}", f"Student {n}", "student") for n, user_id in enumerate(student_ids)]
+
+    counts["user"] = insert_batches(connection, User, (
+        {"id": user_id, "name": name, "age": 20 if status == "student" else 40, "phone_number": f"07{user_id:08d}",
+         "email": f"{username}@example.com", "status": status}
+        for user_id, username, name, status in users
+    ))
+    counts["user_account"] = insert_batches(connection, UserAccount, (
+        {"user_id": user_id, "username": username, "password": password_hash}
+        for user_id, username, name, status in users
+    ))
+
+    course_ids = list(range(1, sizes["courses"] + 1))
+    course_instructor = {course_id: instructor_ids[course_id % len(instructor_ids)] for course_id in course_ids}
+    counts["course"] = insert_batches(connection, Course, (
+        {"id": course_id, "name": f"Course {course_id}", "instructor_id": course_instructor[course_id]}
+        for course_id in course_ids
+    ))
+
+    enrolled = {
+        student_id: rng.sample(course_ids, sizes["enrollments_per_student"]) for student_id in student_ids
+    }
+    counts["enrollment"] = insert_batches(connection, Enrollment, (
+        {"course_id": course_id, "student_id": student_id}
+        for student_id, courses in enrolled.items() for course_id in courses
+    ))
+
+    now = datetime.now().replace(second=0, microsecond=0)
+    assignments_of = {}
+    assignment_rows = []
+    for course_id in course_ids:
+        for number in range(sizes["assignments_per_course"]):
+            assignment_id = len(assignment_rows) + 1
+            assignments_of.setdefault(course_id, []).append(assignment_id)
+            assignment_rows.append({
+                "id": assignment_id,
+                "course_id": course_id,
+                "title": f"Homework {number + 1}: {sentence(rng, 2)}",
+                "text": sentence(rng, 30),
+                "assignment_type": number % 2,
+                "deadline": now + timedelta(days=rng.randint(-60, 60), hours=rng.randint(0, 23)),
+                "weight": 1.0,
+            })
+    counts["assignments"] = insert_batches(connection, Assignments, assignment_rows)
+
+    stored_files = write_material_files(store_folder, sizes["material_files"], rng)
+    counts["stored_file"] = insert_batches(connection, StoredFile, stored_files)
+    counts["course_material"] = insert_batches(connection, CourseMaterial, (
+        {"course_id": course_id, "file_name": f"lecture{number + 1}.pdf", "file_path": rng.choice(stored_files)["path"],
+         "description": sentence(rng, 12)}
+        for course_id in course_ids for number in range(sizes["materials_per_course"])
+    ))
+
+    submissions, grades = [], []
+    for student_id, courses in enrolled.items():
+        for course_id in courses:
+            for assignment_id in assignments_of[course_id]:
+                if rng.random() >= sizes["submission_rate"]:
+                    continue
+                graded = rng.random() < sizes["graded_rate"]
+                deadline = assignment_rows[assignment_id - 1]["deadline"]
+                submitted_at = deadline - timedelta(minutes=rng.randint(-720, 4320))
+                submissions.append({
+                    "id": len(submissions) + 1,
+                    "assignment_id": assignment_id,
+                    "student_id": student_id,
+                    "content": sentence(rng, 20),
+                    "is_graded": graded,
+                    "feedback": "Well done." if graded else None,
+                    "submitted_at": submitted_at,
+                    "is_late": submitted_at > deadline,
+                })
+                if graded:
+                    grades.append({
+                        "student_id": student_id,
+                        "course_id": course_id,
+                        "assignment_id": assignment_id,
+                        "grade": float(rng.randint(1, 10)),
+                    })
+    counts["submission"] = insert_batches(connection, Submission, submissions)
+    counts["grade"] = insert_batches(connection, Grade, grades)
+
+    # The bulk inserts bypassed the mapper events that maintain these
+    site_statistics.reconcile(connection)
+    page_cache.populate_versions(connection)
+    search.reindex(connection)
+    course_progress.rebuild(connection)
+
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--database", required=True, help="SQLite file to create")
+    parser.add_argument("--hash-method", default=None, help="password hash method (default: LMS_PASSWORD_HASH_METHOD)")
+    args = parser.parse_args()
+
+    if os.path.exists(args.database):
+        parser.error(f"{args.database} already exists")
+    os.environ["LMS_DATABASE_URL"] = f"sqlite:///{os.path.abspath(args.database)}"
+
+    import passwords
+    if args.hash_method:
+        passwords.hash_method = args.hash_method
+    from app import create_app
+    from models import db
+
+    app = create_app()
+
+    started = time.perf_counter()
+    with app.app_context(), db.engine.begin() as connection:
+        counts = seed(connection, args.rows, app.config["UPLOAD_STORE_FOLDER"], passwords.hash_password(PASSWORD))
+
+    print(json.dumps({"rows": sum(counts.values()), "tables": counts, "seconds": round(time.perf_counter() - started, 1)}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
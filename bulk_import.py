@@ -0,0 +1,250 @@
+"""CSV import of users and enrollments for the start of term.
+
+Rows are read lazily from the CSV stream and handled in batches. Each batch is
+validated with a few set-based lookups, then inserted with executemany in its
+own transaction. A row that fails validation is reported with its line number
+and skipped; the rest of the batch is still imported.
+
+Users:       username,password,name,email,phone_number,age,status
+Enrollments: course,username     (course name, student username)
+"""
+import codecs
+import csv
+import re
+from collections import Counter
+from dataclasses import dataclass, field
+
+from sqlalchemy import insert, tuple_
+from sqlalchemy.exc import IntegrityError
+
+import course_progress
+import page_cache
+import site_statistics
+from models import db, User, UserAccount, Course, Enrollment
+from passwords import hash_passwords, is_hashed
+
+USER_COLUMNS = ("username", "password", "name", "email", "phone_number", "age", "status")
+ENROLLMENT_COLUMNS = ("course", "username")
+USER_STATUSES = ("student", "instr")
+PHONE_PATTERN = re.compile(r'^0[1-9][0-9]{8}$')
+EMAIL_PATTERN = re.compile(r'^[^@\s]+@[^@\s]+\.[^@\s]+$')
+DEFAULT_BATCH_SIZE = 1000
+
+
+@dataclass
+class ImportReport:
+    imported: int = 0
+    errors: list = field(default_factory=list)
+
+    def error(self, line, message):
+        self.errors.append((line, message))
+
+
+def read_csv(stream, columns):
+    """Yield ``(line_number, row)`` from a binary CSV stream without reading it all into memory."""
+    reader = csv.DictReader(codecs.iterdecode(stream, "utf-8-sig"))
+
+    missing = set(columns) - set(reader.fieldnames or ())
+    if missing:
+        raise ValueError(f"Missing CSV columns: {', '.join(sorted(missing))}")
+
+    for row in reader:
+        yield reader.line_num, {column: (row.get(column) or "").strip() for column in columns}
+
+
+def batches(rows, size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def import_users(stream, batch_size=DEFAULT_BATCH_SIZE):
+    report = ImportReport()
+    seen = {"username": set(), "email": set(), "phone_number": set()}
+
+    for batch in batches(read_csv(stream, USER_COLUMNS), batch_size):
+        valid = []
+        for line, row in batch:
+            message = _validate_user(row, seen)
+            if message:
+                report.error(line, message)
+                continue
+
+            for key in seen:
+                seen[key].add(row[key])
+            valid.append((line, row))
+
+        valid = _drop_existing_users(valid, report)
+        if valid:
+            _insert_users(valid, report)
+
+    return report
+
+
+def _validate_user(row, seen):
+    empty = [column for column in USER_COLUMNS if not row[column]]
+    if empty:
+        return f"missing {', '.join(empty)}"
+    if row["status"] not in USER_STATUSES:
+        return f"status must be one of {', '.join(USER_STATUSES)}"
+    if not EMAIL_PATTERN.match(row["email"]):
+        return "invalid email"
+    if not PHONE_PATTERN.match(row["phone_number"]):
+        return "invalid phone number"
+    if not row["age"].isdigit():
+        return "age must be a number"
+
+    for key in seen:
+        if row[key] in seen[key]:
+            return f"duplicate {key} in file: {row[key]}"
+    return None
+
+
+def _drop_existing_users(rows, report):
+    """Remove rows whose username, email or phone number is already taken, one query per column."""
+    lookups = (
+        ("username", UserAccount.username),
+        ("email", User.email),
+        ("phone_number", User.phone_number),
+    )
+    for key, column in lookups:
+        values = {row[key] for _, row in rows}
+        if not values:
+            continue
+
+        taken = set(db.session.execute(db.select(column).where(column.in_(values))).scalars())
+        if not taken:
+            continue
+
+        kept = []
+        for line, row in rows:
+            if row[key] in taken:
+                report.error(line, f"{key} already exists: {row[key]}")
+            else:
+                kept.append((line, row))
+        rows = kept
+
+    return rows
+
+
+def _insert_users(rows, report):
+    plaintext = [row["password"] for _, row in rows if not is_hashed(row["password"])]
+    hashed = iter(hash_passwords(plaintext))
+    passwords = [row["password"] if is_hashed(row["password"]) else next(hashed) for _, row in rows]
+
+    users = [
+        {
+            "name": row["name"],
+            "email": row["email"],
+            "phone_number": row["phone_number"],
+            "age": int(row["age"]),
+            "status": row["status"],
+        }
+        for _, row in rows
+    ]
+
+    try:
+        user_ids = db.session.execute(
+            insert(User).returning(User.id, sort_by_parameter_order=True), users
+        ).scalars().all()
+        db.session.execute(insert(UserAccount), [
+            {"user_id": user_id, "username": row["username"], "password": password}
+            for user_id, (_, row), password in zip(user_ids, rows, passwords)
+        ])
+
+        # Bulk inserts skip the mapper events that keep the statistics current
+        connection = db.session.connection()
+        for status, count in Counter(user["status"] for user in users).items():
+            site_statistics.bump(connection, site_statistics.user_counter(status), count)
+
+        db.session.commit()
+        report.imported += len(rows)
+    except IntegrityError:
+        # Lost a race with another writer; fall back to row by row to find the offenders
+        db.session.rollback()
+        for (line, row), user, password in zip(rows, users, passwords):
+            try:
+                new_user = User(**user)
+                new_user.account = UserAccount(username=row["username"], password=password)
+                db.session.add(new_user)
+                db.session.commit()
+                report.imported += 1
+            except IntegrityError:
+                db.session.rollback()
+                report.error(line, "username, email or phone number already exists")
+
+
+def import_enrollments(stream, batch_size=DEFAULT_BATCH_SIZE):
+    report = ImportReport()
+    seen = set()
+
+    for batch in batches(read_csv(stream, ENROLLMENT_COLUMNS), batch_size):
+        course_ids = dict(db.session.execute(
+            db.select(Course.name, Course.id).where(Course.name.in_({row["course"] for _, row in batch}))
+        ).all())
+        student_ids = dict(db.session.execute(
+            db.select(UserAccount.username, User.id)
+            .join(User, User.id == UserAccount.user_id)
+            .where(UserAccount.username.in_({row["username"] for _, row in batch}), User.status == "student")
+        ).all())
+
+        pairs = []
+        for line, row in batch:
+            course_id = course_ids.get(row["course"])
+            student_id = student_ids.get(row["username"])
+            if course_id is None:
+                report.error(line, f"unknown course: {row['course']}")
+            elif student_id is None:
+                report.error(line, f"unknown student: {row['username']}")
+            elif (course_id, student_id) in seen:
+                report.error(line, "duplicate enrollment in file")
+            else:
+                seen.add((course_id, student_id))
+                pairs.append((line, course_id, student_id))
+
+        if pairs:
+            existing = set(db.session.execute(
+                db.select(Enrollment.course_id, Enrollment.student_id)
+                .where(tuple_(Enrollment.course_id, Enrollment.student_id).in_([(c, s) for _, c, s in pairs]))
+            ).all())
+            for line, course_id, student_id in pairs:
+                if (course_id, student_id) in existing:
+                    report.error(line, "student is already enrolled")
+            pairs = [pair for pair in pairs if (pair[1], pair[2]) not in existing]
+
+        if pairs:
+            _insert_enrollments(pairs, report)
+
+    return report
+
+
+def _insert_enrollments(pairs, report):
+    try:
+        db.session.execute(insert(Enrollment), [
+            {"course_id": course_id, "student_id": student_id} for _, course_id, student_id in pairs
+        ])
+
+        connection = db.session.connection()
+        site_statistics.bump(connection, "enrollments", len(pairs))
+        for course_id, count in Counter(course_id for _, course_id, _ in pairs).items():
+            site_statistics.bump_course(connection, course_id, enrollments=count)
+            page_cache.bump_version(connection, course_id)
+        course_progress.add_enrollments(connection, [(course_id, student_id) for _, course_id, student_id in pairs])
+
+        db.session.commit()
+        report.imported += len(pairs)
+    except IntegrityError:
+        db.session.rollback()
+        for line, course_id, student_id in pairs:
+            try:
+                db.session.add(Enrollment(course_id=course_id, student_id=student_id))
+                db.session.commit()
+                report.imported += 1
+            except IntegrityError:
+                db.session.rollback()
+                report.error(line, "student is already enrolled")
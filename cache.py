@@ -0,0 +1,171 @@
+"""Small key/value cache backends shared by the caching layers of the app.
+
+``LRUCache`` lives in the worker process. ``FileCache`` keeps one JSON file
+per key in a private directory, so several worker processes on the same
+machine share entries and see each other's deletes. ``RedisCache`` stores entries in a Redis server
+(or anything that speaks its protocol), shared by every worker on every
+machine. All of them expire entries after ``ttl`` seconds and count hits and
+misses.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+
+class CacheBackend:
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        value = self._get(key)
+        if value is None:
+            self.misses += 1
+            return default
+
+        self.hits += 1
+        return value
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+        }
+
+    def _get(self, key):
+        raise NotImplementedError
+
+    def set(self, key, value):
+        raise NotImplementedError
+
+    def delete(self, key):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+
+class LRUCache(CacheBackend):
+    def __init__(self, max_entries=10000, ttl=300):
+        super().__init__(ttl)
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+
+            expires, value = entry
+            if expires < time.monotonic():
+                del self._entries[key]
+                return None
+
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+def private_directory(path):
+    """Create ``path`` accessible to this user only, and refuse an existing one that others could write to."""
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    status = os.stat(path)
+    if status.st_mode & 0o022 or (hasattr(os, "getuid") and status.st_uid != os.getuid()):
+        raise PermissionError(f"{path} must belong to this user and must not be writable by others")
+
+
+class FileCache(CacheBackend):
+    """Values must be JSON serializable; entries are read back with ``json``, never unpickled."""
+
+    def __init__(self, directory, ttl=300):
+        super().__init__(ttl)
+        self.directory = directory
+        private_directory(directory)
+
+    def _path(self, key):
+        return os.path.join(self.directory, hashlib.sha1(key.encode()).hexdigest())
+
+    def _get(self, key):
+        path = self._path(key)
+        try:
+            if os.path.getmtime(path) + self.ttl < time.time():
+                os.unlink(path)
+                return None
+            with open(path) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def set(self, key, value):
+        # Write to a temp file and rename, so readers never see a partial entry
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, prefix=".tmp-")
+        with os.fdopen(fd, "w") as f:
+            json.dump(value, f)
+        os.replace(temp_path, self._path(key))
+
+    def delete(self, key):
+        try:
+            os.unlink(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def clear(self):
+        for name in os.listdir(self.directory):
+            try:
+                os.unlink(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                pass
+
+
+class RedisCache(CacheBackend):
+    """JSON entries in a Redis-compatible server; needs the optional ``redis`` package."""
+
+    def __init__(self, url="redis://localhost:6379/0", ttl=300, prefix="lms:", client=None):
+        super().__init__(ttl)
+        if client is None:
+            try:
+                import redis
+            except ImportError:
+                raise RuntimeError("RedisCache needs the redis package: pip install redis")
+            client = redis.Redis.from_url(url)
+
+        self.client = client
+        self.prefix = prefix
+
+    def _get(self, key):
+        value = self.client.get(self.prefix + key)
+        return None if value is None else json.loads(value)
+
+    def set(self, key, value):
+        self.client.set(self.prefix + key, json.dumps(value), ex=self.ttl)
+
+    def delete(self, key):
+        self.client.delete(self.prefix + key)
+
+    def clear(self):
+        keys = list(self.client.scan_iter(match=self.prefix + "*"))
+        if keys:
+            self.client.delete(*keys)
@@ -0,0 +1,216 @@
+"""Per-student progress through each course, kept in ``student_course_progress``.
+
+Every enrollment has a row with the number of assignments in the course, how
+many of them the student has submitted and how many were graded, the sum and
+count of their grades, and the next deadline they still have to meet. Mapper
+events on ``Enrollment``, ``Assignments``, ``Submission`` and ``Grade`` adjust
+the rows inside the flush that changes them, so the dashboards read one row
+per course. Bulk inserts call ``add_enrollments`` themselves, and ``rebuild``
+recomputes every row from the source tables.
+
+``next_deadline`` only counts deadlines that had not passed when the row was
+last written; ``load_progress`` and ``load_course_summaries`` recompute rows
+whose deadline has passed since. The cached pages showing these figures get a
+new key when a deadline of their courses passes (see ``page_cache``), so they
+are rendered, and the rows refreshed, again.
+"""
+from datetime import datetime
+
+from sqlalchemy import event, select, update, delete, insert, func, exists, tuple_, case, true, inspect
+
+from model_events import old_value, course_of_submission
+from models import db, Enrollment, Assignments, Submission, Grade, StudentCourseProgress
+
+progress = StudentCourseProgress.__table__
+
+
+def _next_deadline(course_id, student_id, now):
+    """Correlated subquery: the student's earliest unsubmitted deadline in the course that is still ahead."""
+    # Correlated to the outer statement too, not only to the subquery around it
+    submitted = exists().where(Submission.assignment_id == Assignments.id, Submission.student_id == student_id).correlate_except(Submission)
+    return (
+        select(func.min(Assignments.deadline))
+        .where(Assignments.course_id == course_id, Assignments.deadline >= now, ~submitted)
+        .scalar_subquery()
+    )
+
+
+def _insert_rows(connection, condition):
+    """Compute the rows of the enrollments matching ``condition`` from the source tables."""
+    course_id, student_id = Enrollment.course_id, Enrollment.student_id
+    submitted = (
+        select(func.count()).select_from(Submission).join(Assignments, Assignments.id == Submission.assignment_id)
+        .where(Assignments.course_id == course_id, Submission.student_id == student_id)
+    )
+    graded = submitted.where(Submission.is_graded == True)
+    grades = (Grade.course_id == course_id) & (Grade.student_id == student_id)
+
+    connection.execute(insert(progress).from_select(
+        ["course_id", "student_id", "assignments_total", "assignments_submitted", "assignments_graded",
+         "grade_count", "grade_sum", "next_deadline"],
+        select(
+            course_id,
+            student_id,
+            select(func.count()).where(Assignments.course_id == course_id).scalar_subquery(),
+            submitted.scalar_subquery(),
+            graded.scalar_subquery(),
+            select(func.count()).where(grades).scalar_subquery(),
+            select(func.coalesce(func.sum(Grade.grade), 0)).where(grades).scalar_subquery(),
+            _next_deadline(course_id, student_id, datetime.now()),
+        ).where(condition)
+    ))
+
+
+def add_enrollments(connection, pairs):
+    """Create the rows for enrollments written with bulk inserts, as ``(course_id, student_id)`` pairs."""
+    if pairs:
+        _insert_rows(connection, tuple_(Enrollment.course_id, Enrollment.student_id).in_(list(pairs)))
+
+
+def rebuild(connection):
+    """Recompute every row from the source tables."""
+    connection.execute(delete(progress))
+    _insert_rows(connection, true())
+
+
+def _adjust(connection, course_id, student_id, refresh_deadline=False, **deltas):
+    values = {column: progress.c[column] + delta for column, delta in deltas.items() if delta}
+    if refresh_deadline:
+        values["next_deadline"] = _next_deadline(progress.c.course_id, progress.c.student_id, datetime.now())
+    if course_id is None or not values:
+        return
+
+    connection.execute(
+        update(progress).where(progress.c.course_id == course_id, progress.c.student_id == student_id).values(**values)
+    )
+
+
+def refresh_deadlines(connection, condition):
+    """Recompute ``next_deadline`` on the rows matching ``condition``."""
+    connection.execute(
+        update(progress).where(condition)
+        .values(next_deadline=_next_deadline(progress.c.course_id, progress.c.student_id, datetime.now()))
+    )
+
+
+@event.listens_for(Enrollment, "after_insert")
+def enrollment_inserted(mapper, connection, target):
+    _insert_rows(connection, Enrollment.id == target.id)
+
+
+@event.listens_for(Enrollment, "after_delete")
+def enrollment_deleted(mapper, connection, target):
+    connection.execute(
+        delete(progress).where(progress.c.course_id == target.course_id, progress.c.student_id == target.student_id)
+    )
+
+
+@event.listens_for(Assignments, "after_insert")
+def assignment_inserted(mapper, connection, target):
+    values = {"assignments_total": progress.c.assignments_total + 1}
+    if target.deadline >= datetime.now():
+        # Nobody has submitted a new assignment, so its deadline is next for everyone whose next one is later
+        is_next = (progress.c.next_deadline == None) | (progress.c.next_deadline > target.deadline)
+        values["next_deadline"] = case((is_next, target.deadline), else_=progress.c.next_deadline)
+    connection.execute(update(progress).where(progress.c.course_id == target.course_id).values(**values))
+
+
+@event.listens_for(Assignments, "after_delete")
+def assignment_deleted(mapper, connection, target):
+    # Its submissions went first, each through submission_deleted
+    connection.execute(
+        update(progress).where(progress.c.course_id == target.course_id)
+        .values(assignments_total=progress.c.assignments_total - 1)
+    )
+    refresh_deadlines(connection, progress.c.course_id == target.course_id)
+
+
+@event.listens_for(Assignments, "after_update")
+def assignment_updated(mapper, connection, target):
+    if inspect(target).attrs.deadline.history.has_changes():
+        refresh_deadlines(connection, progress.c.course_id == target.course_id)
+
+
+@event.listens_for(Submission, "after_insert")
+def submission_inserted(mapper, connection, target):
+    _adjust(connection, course_of_submission(connection, target), target.student_id,
+            refresh_deadline=True, assignments_submitted=1, assignments_graded=1 if target.is_graded else 0)
+
+
+@event.listens_for(Submission, "after_delete")
+def submission_deleted(mapper, connection, target):
+    _adjust(connection, course_of_submission(connection, target), target.student_id,
+            refresh_deadline=True, assignments_submitted=-1,
+            assignments_graded=-1 if old_value(target, "is_graded") else 0)
+
+
+@event.listens_for(Submission, "after_update")
+def submission_updated(mapper, connection, target):
+    was_graded = bool(old_value(target, "is_graded"))
+    if was_graded != bool(target.is_graded):
+        _adjust(connection, course_of_submission(connection, target), target.student_id,
+                assignments_graded=-1 if was_graded else 1)
+
+
+@event.listens_for(Grade, "after_insert")
+def grade_inserted(mapper, connection, target):
+    _adjust(connection, target.course_id, target.student_id, grade_count=1, grade_sum=target.grade)
+
+
+@event.listens_for(Grade, "after_delete")
+def grade_deleted(mapper, connection, target):
+    _adjust(connection, target.course_id, target.student_id, grade_count=-1, grade_sum=-old_value(target, "grade"))
+
+
+@event.listens_for(Grade, "after_update")
+def grade_updated(mapper, connection, target):
+    _adjust(connection, target.course_id, target.student_id, grade_sum=target.grade - old_value(target, "grade"))
+
+
+def _summary(row):
+    return {
+        "total": row.assignments_total,
+        "submitted": row.assignments_submitted,
+        "graded": row.assignments_graded,
+        "percent_submitted": round(100 * row.assignments_submitted / row.assignments_total) if row.assignments_total else None,
+        "average_grade": round(row.grade_sum / row.grade_count, 2) if row.grade_count else None,
+        "next_deadline": row.next_deadline,
+    }
+
+
+def load_progress(student_id):
+    """The student's progress in each of their courses, by course id."""
+    condition = StudentCourseProgress.student_id == student_id
+    rows = db.session.execute(select(StudentCourseProgress).where(condition)).scalars().all()
+
+    if any(row.next_deadline is not None and row.next_deadline < datetime.now() for row in rows):
+        # Deadlines passed since the rows were written; the next ones are recomputed and kept
+        refresh_deadlines(db.session.connection(), (progress.c.student_id == student_id) & (progress.c.next_deadline < datetime.now()))
+        db.session.commit()
+        rows = db.session.execute(select(StudentCourseProgress).where(condition)).scalars().all()
+
+    return {row.course_id: _summary(row) for row in rows}
+
+
+def load_course_summaries(course_ids):
+    """Totals over the enrolled students of each course, by course id."""
+    passed = progress.c.course_id.in_(course_ids) & (progress.c.next_deadline < datetime.now())
+    if db.session.execute(select(exists().where(passed))).scalar():
+        refresh_deadlines(db.session.connection(), passed)
+        db.session.commit()
+
+    rows = db.session.execute(
+        select(
+            progress.c.course_id,
+            func.count().label("students"),
+            func.sum(progress.c.assignments_total).label("assignments_total"),
+            func.sum(progress.c.assignments_submitted).label("assignments_submitted"),
+            func.sum(progress.c.assignments_graded).label("assignments_graded"),
+            func.sum(progress.c.grade_count).label("grade_count"),
+            func.sum(progress.c.grade_sum).label("grade_sum"),
+            func.min(progress.c.next_deadline).label("next_deadline"),
+        )
+        .where(progress.c.course_id.in_(course_ids))
+        .group_by(progress.c.course_id)
+    ).all()
+    return {row.course_id: dict(_summary(row), students=row.students) for row in rows}
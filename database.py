@@ -0,0 +1,66 @@
+"""Engine configuration read from the environment.
+
+``LMS_DATABASE_URL`` selects the backend (SQLite by default). Server databases
+get a connection pool sized by ``LMS_DB_POOL_SIZE``/``LMS_DB_MAX_OVERFLOW`` with
+pre-ping and recycling; SQLite connections are switched to WAL journaling and
+tuned with the pragmas below every time the pool opens a new connection.
+"""
+import os
+
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+DEFAULT_DATABASE_URL = "sqlite:///learning-system.db"
+
+
+def _env_int(name, default):
+    return int(os.environ.get(name, default))
+
+
+def _env_bool(name, default):
+    return os.environ.get(name, str(default)).lower() in ("1", "true", "yes", "on")
+
+
+def database_url():
+    return os.environ.get("LMS_DATABASE_URL", DEFAULT_DATABASE_URL)
+
+
+def engine_options(url):
+    """Return the SQLALCHEMY_ENGINE_OPTIONS for the given database URL."""
+    if make_url(url).get_backend_name() == "sqlite":
+        # sqlite3's own lock timeout, in seconds; the busy_timeout pragma below mirrors it
+        return {"connect_args": {"timeout": _env_int("LMS_SQLITE_BUSY_TIMEOUT_MS", 5000) / 1000}}
+
+    return {
+        "pool_size": _env_int("LMS_DB_POOL_SIZE", 5),
+        "max_overflow": _env_int("LMS_DB_MAX_OVERFLOW", 10),
+        "pool_timeout": _env_int("LMS_DB_POOL_TIMEOUT", 30),
+        "pool_recycle": _env_int("LMS_DB_POOL_RECYCLE", 1800),
+        "pool_pre_ping": _env_bool("LMS_DB_POOL_PRE_PING", True),
+    }
+
+
+def sqlite_pragmas():
+    return {
+        "journal_mode": os.environ.get("LMS_SQLITE_JOURNAL_MODE", "WAL"),
+        "synchronous": os.environ.get("LMS_SQLITE_SYNCHRONOUS", "NORMAL"),
+        "busy_timeout": _env_int("LMS_SQLITE_BUSY_TIMEOUT_MS", 5000),
+        # Negative values are KiB rather than pages
+        "cache_size": -_env_int("LMS_SQLITE_CACHE_SIZE_KB", 20000),
+        "mmap_size": _env_int("LMS_SQLITE_MMAP_SIZE", 256 * 1024 * 1024),
+    }
+
+
+def configure_engine(engine, pragmas=None):
+    """Apply the SQLite pragmas to every connection the engine's pool opens."""
+    if engine.dialect.name != "sqlite":
+        return
+
+    pragmas = sqlite_pragmas() if pragmas is None else pragmas
+
+    @event.listens_for(engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
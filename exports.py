@@ -0,0 +1,319 @@
+"""ZIP exports of an assignment's submissions and end-of-term course archives.
+
+Archives are never built in memory or in a temp file. ``zip_stream`` writes
+the ZIP into a small sink and yields the bytes as they are produced: file
+contents are copied ``CHUNK_SIZE`` at a time, and the entries are read from
+the database ``PAGE_SIZE`` rows at a time, each page in its own short read
+transaction. A download of any size therefore uses constant memory. Stored
+files are added uncompressed, since PDFs, images and office files are
+compressed already. The grades CSV is deflated.
+
+Archives whose files add up to more than ``LMS_EXPORT_INLINE_LIMIT_MB`` are
+built by an ``export_archive`` background job into ``<store>/exports``, where
+they are kept for ``LMS_EXPORT_RETENTION_HOURS``. An export that no worker
+has started after ``LMS_EXPORT_QUEUE_TIMEOUT_MINUTES`` is marked failed, so its
+page stops waiting. Files flagged by the virus scanner and files missing from
+disk are left out.
+"""
+import csv
+import io
+import os
+import tempfile
+import time
+import uuid
+import zipfile
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import select, update, func, union_all
+
+from jobs import job, enqueue, heartbeat, utcnow
+from models import db, User, UserAccount, Assignments, CourseMaterial, Submission, Grade, StoredFile, Job
+
+CHUNK_SIZE = 1024 * 1024
+PAGE_SIZE = 500
+MB = 1024 * 1024
+
+# A file in the archive; ``chunks`` is called when the entry is written and returns an iterator of bytes
+Entry = namedtuple("Entry", ["name", "date_time", "size", "compress_type", "chunks"])
+
+
+def init_exports(app):
+    app.config.setdefault("EXPORT_INLINE_LIMIT", int(os.environ.get("LMS_EXPORT_INLINE_LIMIT_MB", 1024)) * MB)
+    app.config.setdefault("EXPORT_RETENTION_HOURS", int(os.environ.get("LMS_EXPORT_RETENTION_HOURS", 72)))
+    app.config.setdefault("EXPORT_QUEUE_TIMEOUT", int(os.environ.get("LMS_EXPORT_QUEUE_TIMEOUT_MINUTES", 30)) * 60)
+
+
+class _Sink:
+    """Write-only file for ``ZipFile``; without ``seek`` it writes data descriptors instead of rewinding."""
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def take(self):
+        data = b"".join(self.chunks)
+        self.chunks.clear()
+        return data
+
+    @property
+    def pending(self):
+        return bool(self.chunks)
+
+
+def zip_stream(entries):
+    """Yield a ZIP archive of ``entries`` in pieces of about ``CHUNK_SIZE`` bytes."""
+    sink = _Sink()
+    archive = zipfile.ZipFile(sink, "w")
+    for entry in entries:
+        info = zipfile.ZipInfo(entry.name, entry.date_time)
+        info.compress_type = entry.compress_type
+        if entry.size is not None:
+            # Known sizes let zipfile pick ZIP64 headers only for the entries that need them
+            info.file_size = entry.size
+
+        with archive.open(info, "w", force_zip64=entry.size is None) as destination:
+            for chunk in entry.chunks():
+                destination.write(chunk)
+                if sink.pending:
+                    yield sink.take()
+        if sink.pending:
+            yield sink.take()
+
+    archive.close()
+    yield sink.take()
+
+
+def _read_file(path):
+    def chunks():
+        with open(path, "rb") as f:
+            while data := f.read(CHUNK_SIZE):
+                yield data
+
+    return chunks
+
+
+def _date_time(value):
+    # ZIP timestamps start in 1980 and have no time zone
+    value = value or datetime.now()
+    return max(value.timetuple()[:6], (1980, 1, 1, 0, 0, 0))
+
+
+def _file_entry(name, relative_path, scan_status, modified=None):
+    """The entry for an uploaded file, or None if it is quarantined or missing."""
+    if scan_status == "infected":
+        return None
+
+    path = os.path.join(current_app.root_path, relative_path)
+    try:
+        stat = os.stat(path)
+    except (FileNotFoundError, NotADirectoryError):
+        return None
+
+    date_time = _date_time(modified or datetime.fromtimestamp(stat.st_mtime))
+    return Entry(name, date_time, stat.st_size, zipfile.ZIP_STORED, _read_file(path))
+
+
+def _pages(statement, key):
+    """Run ``statement`` ordered and paged by ``key``, its first column, one short read transaction per page."""
+    last = None
+    while True:
+        page_statement = statement if last is None else statement.where(key > last)
+        rows = db.session.execute(page_statement.order_by(key).limit(PAGE_SIZE)).all()
+        # Ends the read transaction, so a long download does not hold back SQLite's WAL checkpoints
+        db.session.commit()
+        if not rows:
+            return
+        yield from rows
+        last = rows[-1][0]
+
+
+def _safe_name(text):
+    name = "".join(c if c.isalnum() or c in " -_." else "_" for c in text).strip(" .")
+    return name or "untitled"
+
+
+def _submission_rows(assignment_ids):
+    statement = (
+        select(Submission.id, Submission.assignment_id, Submission.file_name, Submission.file_path,
+               Submission.content, Submission.submitted_at, Submission.is_late, Submission.feedback,
+               UserAccount.username, User.name, Grade.grade, StoredFile.scan_status)
+        .join(User, User.id == Submission.student_id)
+        .outerjoin(UserAccount, UserAccount.user_id == Submission.student_id)
+        .outerjoin(Grade, (Grade.assignment_id == Submission.assignment_id) & (Grade.student_id == Submission.student_id))
+        .outerjoin(StoredFile, StoredFile.path == Submission.file_path)
+        .where(Submission.assignment_id.in_(assignment_ids))
+    )
+    return _pages(statement, Submission.id)
+
+
+def _submission_entries(assignment_ids, folders):
+    for row in _submission_rows(assignment_ids):
+        folder = f"{folders[row.assignment_id]}{_safe_name(row.username or str(row.id))}/"
+        if row.file_path:
+            entry = _file_entry(folder + _safe_name(row.file_name or "file"), row.file_path, row.scan_status, row.submitted_at)
+            if entry is not None:
+                yield entry
+        if row.content:
+            content = row.content.encode("utf-8")
+            yield Entry(folder + "submission.html", _date_time(row.submitted_at), len(content),
+                        zipfile.ZIP_DEFLATED, lambda content=content: iter((content,)))
+
+
+def _grades_csv(assignment_ids, titles):
+    def chunks():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(["assignment", "username", "student", "submitted_at", "late", "grade", "feedback"])
+        for row in _submission_rows(assignment_ids):
+            writer.writerow([
+                titles[row.assignment_id], row.username, row.name,
+                row.submitted_at.isoformat(sep=" ") if row.submitted_at else "",
+                "yes" if row.is_late else "no",
+                "" if row.grade is None else row.grade,
+                row.feedback or "",
+            ])
+            if buffer.tell() >= CHUNK_SIZE:
+                yield buffer.getvalue().encode("utf-8")
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue().encode("utf-8")
+
+    return Entry("grades.csv", _date_time(None), None, zipfile.ZIP_DEFLATED, chunks)
+
+
+def assignment_entries(assignment_id):
+    """Every submission of the assignment, one folder per student, and a CSV of the grades."""
+    title = db.session.execute(select(Assignments.title).where(Assignments.id == assignment_id)).scalar()
+    yield from _submission_entries([assignment_id], {assignment_id: ""})
+    yield _grades_csv([assignment_id], {assignment_id: title})
+
+
+def course_entries(course_id):
+    """The course's materials, its assignments with their submissions, and a CSV of all its grades."""
+    materials = select(CourseMaterial.id, CourseMaterial.file_name, CourseMaterial.file_path, StoredFile.scan_status) \
+        .outerjoin(StoredFile, StoredFile.path == CourseMaterial.file_path) \
+        .where(CourseMaterial.course_id == course_id)
+    for material_id, file_name, file_path, scan_status in _pages(materials, CourseMaterial.id):
+        entry = _file_entry(f"materials/{material_id}-{_safe_name(file_name)}", file_path, scan_status)
+        if entry is not None:
+            yield entry
+
+    assignments = db.session.execute(
+        select(Assignments.id, Assignments.title, Assignments.file_name, Assignments.file_path)
+        .where(Assignments.course_id == course_id)
+        .order_by(Assignments.id)
+    ).all()
+    db.session.commit()
+
+    folders = {assignment.id: f"assignments/{assignment.id}-{_safe_name(assignment.title)}/" for assignment in assignments}
+    for assignment in assignments:
+        if assignment.file_path:
+            scan_status = db.session.execute(
+                select(StoredFile.scan_status).where(StoredFile.path == assignment.file_path)
+            ).scalar()
+            entry = _file_entry(folders[assignment.id] + _safe_name(assignment.file_name or "assignment"),
+                                assignment.file_path, scan_status)
+            if entry is not None:
+                yield entry
+
+    ids = list(folders)
+    yield from _submission_entries(ids, {assignment_id: folder + "submissions/" for assignment_id, folder in folders.items()})
+    yield _grades_csv(ids, {assignment.id: assignment.title for assignment in assignments})
+
+
+ARCHIVES = {
+    "assignment": assignment_entries,
+    "course": course_entries,
+}
+
+
+def estimated_size(kind, object_id):
+    """Total size of the stored files that go into the archive; files uploaded before the store are not counted."""
+    if kind == "assignment":
+        paths = select(Submission.file_path.label("path")).where(Submission.assignment_id == object_id)
+    else:
+        assignment_ids = select(Assignments.id).where(Assignments.course_id == object_id)
+        paths = union_all(
+            select(CourseMaterial.file_path.label("path")).where(CourseMaterial.course_id == object_id),
+            select(Assignments.file_path.label("path")).where(Assignments.course_id == object_id),
+            select(Submission.file_path.label("path")).where(Submission.assignment_id.in_(assignment_ids)),
+        )
+    paths = paths.subquery()
+    return db.session.execute(
+        select(func.coalesce(func.sum(StoredFile.size), 0)).join(paths, paths.c.path == StoredFile.path)
+    ).scalar()
+
+
+def stream_archive(kind, object_id):
+    return zip_stream(ARCHIVES[kind](object_id))
+
+
+def export_path(token):
+    return os.path.join(current_app.root_path, current_app.config["UPLOAD_STORE_FOLDER"], "exports", f"{token}.zip")
+
+
+def queue_export(kind, object_id, user_id, download_name):
+    """Queue a background export; the job's payload names the user allowed to download it."""
+    return enqueue("export_archive", {
+        "kind": kind,
+        "object_id": object_id,
+        "user_id": user_id,
+        "download_name": download_name,
+        "token": uuid.uuid4().hex,
+    }, max_attempts=2)
+
+
+def fail_if_never_started(export_job):
+    """Mark a queued export failed once it has waited ``EXPORT_QUEUE_TIMEOUT`` seconds for a worker."""
+    if export_job.status != "queued" or export_job.attempts:
+        return
+
+    cutoff = utcnow() - timedelta(seconds=current_app.config["EXPORT_QUEUE_TIMEOUT"])
+    # The status check makes this a no-op if a worker claims the job meanwhile
+    db.session.execute(
+        update(Job)
+        .where(Job.id == export_job.id, Job.status == "queued", Job.attempts == 0, Job.created_at < cutoff)
+        .values(status="failed", last_error="No job worker started the export in time.")
+    )
+    db.session.commit()
+    db.session.refresh(export_job)
+
+
+def purge_old_exports():
+    folder = os.path.dirname(export_path("x"))
+    cutoff = time.time() - current_app.config["EXPORT_RETENTION_HOURS"] * 3600
+    for entry in os.scandir(folder):
+        if entry.stat().st_mtime < cutoff:
+            os.unlink(entry.path)
+
+
+@job("export_archive")
+def export_archive(kind, object_id, user_id, download_name, token):
+    path = export_path(token)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    purge_old_exports()
+
+    # Each attempt writes its own file, so a retry never interleaves with one still running
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=f"{token}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            for chunk in stream_archive(kind, object_id):
+                f.write(chunk)
+                heartbeat()
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
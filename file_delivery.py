@@ -0,0 +1,81 @@
+"""Download responses for uploaded files.
+
+Every response carries an ETag and Last-Modified validator and
+``Cache-Control: no-cache``: the URLs name a material or submission, not a
+version of its content, so a browser revalidates on every use and gets a cheap
+304 while the file is unchanged, or the new file once it was re-uploaded.
+Responses honour Range/If-Range so interrupted
+downloads resume instead of restarting. ``FILE_DELIVERY_MODE`` decides who
+copies the bytes:
+
+- ``direct``: the WSGI server streams the file (``wsgi.file_wrapper``, which is
+  ``sendfile(2)`` under gunicorn/uwsgi).
+- ``x-sendfile``: Apache/lighttpd send the file named in ``X-Sendfile``.
+- ``x-accel-redirect``: nginx serves the file from the internal location in
+  ``X_ACCEL_REDIRECT_PREFIX`` that maps onto the application root.
+"""
+import mimetypes
+import os
+from urllib.parse import quote
+
+from flask import current_app, send_file, abort
+
+DELIVERY_MODES = ("direct", "x-sendfile", "x-accel-redirect")
+
+
+def init_file_delivery(app):
+    app.config.setdefault("FILE_DELIVERY_MODE", os.environ.get("LMS_FILE_DELIVERY_MODE", "direct"))
+    app.config.setdefault("X_ACCEL_REDIRECT_PREFIX", os.environ.get("LMS_X_ACCEL_REDIRECT_PREFIX", "/protected/"))
+
+    if app.config["FILE_DELIVERY_MODE"] not in DELIVERY_MODES:
+        raise ValueError(f"FILE_DELIVERY_MODE must be one of {', '.join(DELIVERY_MODES)}")
+
+    app.config["USE_X_SENDFILE"] = app.config["FILE_DELIVERY_MODE"] == "x-sendfile"
+
+
+def deliver_file(path, download_name=None):
+    """Return a cacheable, range-capable attachment response for the file at ``path``."""
+    try:
+        stat = os.stat(path)
+    except (FileNotFoundError, NotADirectoryError):
+        abort(404)
+
+    download_name = download_name or os.path.basename(path)
+
+    if current_app.config["FILE_DELIVERY_MODE"] == "x-accel-redirect":
+        response = _accel_redirect(path, download_name, stat)
+    else:
+        response = send_file(
+            path,
+            as_attachment=True,
+            download_name=download_name,
+            conditional=True,
+            etag=True,
+            last_modified=stat.st_mtime,
+        )
+
+    # Werkzeug only sets this on ranged replies, advertise it so clients know they can resume
+    response.accept_ranges = "bytes"
+    # Materials and submissions are per-user content, keep them out of shared caches
+    response.cache_control.public = False
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    response.cache_control.max_age = None
+    response.expires = None
+    return response
+
+
+def _accel_redirect(path, download_name, stat):
+    relative_path = os.path.relpath(os.path.abspath(path), current_app.root_path)
+    if relative_path.startswith(os.pardir):
+        abort(404)
+
+    response = current_app.response_class(
+        mimetype=mimetypes.guess_type(download_name)[0] or "application/octet-stream"
+    )
+    response.headers["X-Accel-Redirect"] = current_app.config["X_ACCEL_REDIRECT_PREFIX"] + quote(relative_path)
+    response.headers["Content-Disposition"] = f"attachment; filename*=UTF-8''{quote(download_name)}"
+    # nginx answers conditional and range requests itself, these are the validators it forwards
+    response.set_etag(f"{stat.st_mtime_ns:x}-{stat.st_size:x}")
+    response.last_modified = stat.st_mtime
+    return response
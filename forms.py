@@ -1,5 +1,6 @@
 from flask_wtf import FlaskForm
-from wtforms import StringField, SubmitField, PasswordField, SelectField, FileField, TextAreaField, DateField, FloatField
+from wtforms import StringField, IntegerField, SubmitField, PasswordField, SelectField, FileField, TextAreaField, DateTimeLocalField, FloatField
+from wtforms.widgets import HiddenInput
 from wtforms.validators import DataRequired, Email, Regexp, EqualTo, Length, NumberRange
 from flask_ckeditor import CKEditorField
 
@@ -43,7 +44,8 @@ class CreateCourseForm(FlaskForm):
 
 
 class AddStudentToCourseForm(FlaskForm):
-    student = SelectField("Student", coerce=int, validators=[DataRequired()])
+    # Filled in by the type-ahead search on the page
+    student = IntegerField("Student", widget=HiddenInput(), validators=[DataRequired(message="Choose a student.")])
     submit = SubmitField("Add Student to Course")
 
 
@@ -57,7 +59,8 @@ class AddAssignmentForm(FlaskForm):
     title = StringField("Title", validators=[DataRequired()])
     text = TextAreaField("Description", validators=[DataRequired()])
     assignment_type = SelectField("Assignment Type", choices=[(0, "Upload File"), (1, "Solve Here")], coerce=int,  validators=[DataRequired()])
-    deadline = DateField("Deadline", format="%Y-%m-%d", validators=[DataRequired()])
+    deadline = DateTimeLocalField("Deadline", format="%Y-%m-%dT%H:%M", validators=[DataRequired()])
+    weight = FloatField("Weight in Final Grade", default=1.0, validators=[NumberRange(min=0, message="Weight cannot be negative.")])
     file = FileField("Attachment (optional)")
     submit = SubmitField("Add Assignment")
 
@@ -74,3 +77,14 @@ class GradeSubmissionFormText(FlaskForm):
     feedback = TextAreaField("Feedback (Optional)")
     submission_content = TextAreaField("Student Submission", render_kw={"readonly": True})
     submit = SubmitField("Submit Grade")
+
+
+class GradeBatchForm(FlaskForm):
+    # The grade and feedback inputs are rendered per submission by the template
+    submit = SubmitField("Save Grades")
+
+
+class BulkImportForm(FlaskForm):
+    users_file = FileField("Users CSV (username, password, name, email, phone_number, age, status)")
+    enrollments_file = FileField("Enrollments CSV (course, username)")
+    submit = SubmitField("Import")
@@ -0,0 +1,175 @@
+"""Per-course grade statistics computed with NumPy.
+
+A course's grades are read in one columnar query and scattered into a
+students x assignments matrix, with NaN where a student has no grade yet.
+Every statistic is then a single vectorized reduction over one axis of that
+matrix, so a 500 x 50 course takes a few milliseconds.
+
+Results are cached per course and keyed by the course's ``course_version``,
+which page_cache bumps in the same flush as any change to its grades,
+assignments, enrollments or student names. The cache is per process, but every
+worker reads the current version with its statistics, so no worker can serve
+figures from before a change another one committed.
+"""
+import itertools
+import os
+import warnings
+
+import numpy as np
+from sqlalchemy import select
+
+from cache import LRUCache
+from models import db, User, Enrollment, Assignments, Grade, CourseVersion
+
+MAX_GRADE = 10
+PERCENTILES = (25, 50, 75, 90)
+# One bucket per whole point; a 10 falls into the last one
+HISTOGRAM_EDGES = np.arange(MAX_GRADE + 1)
+
+gradebook_cache = LRUCache(
+    int(os.environ.get("LMS_GRADEBOOK_CACHE_SIZE", 256)),
+    int(os.environ.get("LMS_GRADEBOOK_CACHE_TTL", 3600)),
+)
+
+
+def load_matrix(course_id):
+    """Return ``(assignments, students, grades)`` for a course.
+
+    ``assignments`` and ``students`` are lists of row tuples ordered by id and
+    ``grades`` is a float matrix with one row per student and NaN for missing grades.
+    """
+    assignments = db.session.execute(
+        db.select(Assignments.id, Assignments.title, Assignments.weight)
+        .where(Assignments.course_id == course_id)
+        .order_by(Assignments.id)
+    ).all()
+    students = db.session.execute(
+        db.select(User.id, User.name)
+        .join(Enrollment, Enrollment.student_id == User.id)
+        .where(Enrollment.course_id == course_id)
+        .order_by(User.id)
+    ).all()
+
+    rows = db.session.execute(
+        db.select(Grade.student_id, Grade.assignment_id, Grade.grade).where(Grade.course_id == course_id)
+    ).all()
+
+    grades = np.full((len(students), len(assignments)), np.nan)
+    if rows and students and assignments:
+        # fromiter over the flattened rows is far faster than np.array() on a list of Row objects
+        flat = np.fromiter(itertools.chain.from_iterable(rows), dtype=np.float64, count=len(rows) * 3)
+        student_ids, assignment_ids, values = flat.reshape(-1, 3).T
+        row_index, row_known = _positions([student.id for student in students], student_ids)
+        column_index, column_known = _positions([assignment.id for assignment in assignments], assignment_ids)
+        # Grades of students who have since left the course have no row to go to
+        known = row_known & column_known
+        grades[row_index[known], column_index[known]] = values[known]
+
+    return assignments, students, grades
+
+
+def _positions(sorted_ids, values):
+    """Index of each value in ``sorted_ids``, and whether it is there at all."""
+    sorted_ids = np.asarray(sorted_ids, dtype=np.float64)
+    index = np.minimum(np.searchsorted(sorted_ids, values), len(sorted_ids) - 1)
+    return index, sorted_ids[index] == values
+
+
+def histograms(grades):
+    """Counts per whole-point bucket for each column of ``grades``, ignoring NaN."""
+    bins = len(HISTOGRAM_EDGES) - 1
+    graded = ~np.isnan(grades)
+    buckets = np.clip(np.floor(np.where(graded, grades, 0)), 0, bins - 1).astype(np.int64)
+    offsets = buckets + np.arange(grades.shape[1]) * bins
+    return np.bincount(offsets[graded], minlength=grades.shape[1] * bins).reshape(grades.shape[1], bins)
+
+
+def _nan_stat(function, grades, axis, **kwargs):
+    """Apply a NaN-aware reduction, giving NaN for rows or columns without any grade."""
+    if grades.size == 0:
+        length = grades.shape[1 - axis]
+        return np.full((len(kwargs["q"]), length) if "q" in kwargs else length, np.nan)
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        return function(grades, axis=axis, **kwargs)
+
+
+def _rounded(values):
+    return [None if np.isnan(value) else round(float(value), 2) for value in values]
+
+
+def compute_statistics(assignments, students, grades):
+    """Per-assignment and per-student statistics of a grade matrix, as plain JSON-ready dicts."""
+    graded = ~np.isnan(grades)
+    weights = np.array([1.0 if assignment.weight is None else assignment.weight for assignment in assignments], dtype=np.float64)
+
+    percentiles = _nan_stat(np.nanpercentile, grades, 0, q=PERCENTILES)
+    assignment_stats = {
+        "mean": _rounded(_nan_stat(np.nanmean, grades, 0)),
+        "min": _rounded(_nan_stat(np.nanmin, grades, 0)),
+        "max": _rounded(_nan_stat(np.nanmax, grades, 0)),
+        "percentiles": [dict(zip(map(str, PERCENTILES), _rounded(column))) for column in percentiles.T],
+        "histogram": histograms(grades).tolist(),
+    }
+
+    # Weighted average over the assignments the student has been graded on so far
+    weight_totals = (graded * weights).sum(axis=1)
+    weighted_sums = np.where(graded, grades, 0) @ weights
+    finals = np.full(len(students), np.nan)
+    np.divide(weighted_sums, weight_totals, out=finals, where=weight_totals > 0)
+
+    student_stats = {
+        "mean": _rounded(_nan_stat(np.nanmean, grades, 1)),
+        "median": _rounded(_nan_stat(np.nanmedian, grades, 1)),
+        "final": _rounded(finals),
+    }
+
+    final_graded = finals[~np.isnan(finals)]
+    course = {
+        "students": len(students),
+        "assignments": len(assignments),
+        "grades": int(graded.sum()),
+        "final_mean": _rounded([final_graded.mean()])[0] if final_graded.size else None,
+        "final_median": _rounded([np.median(final_graded)])[0] if final_graded.size else None,
+        "final_histogram": histograms(finals.reshape(-1, 1))[0].tolist(),
+    }
+
+    assignment_counts = graded.sum(axis=0).tolist()
+    student_counts = graded.sum(axis=1).tolist()
+    return {
+        "course": course,
+        "histogram_edges": HISTOGRAM_EDGES.tolist(),
+        "assignments": [
+            dict(
+                {"id": assignment.id, "title": assignment.title, "weight": float(weights[i]), "count": assignment_counts[i]},
+                **{name: values[i] for name, values in assignment_stats.items()}
+            )
+            for i, assignment in enumerate(assignments)
+        ],
+        "students": [
+            dict(
+                {"id": student.id, "name": student.name, "count": student_counts[i]},
+                **{name: values[i] for name, values in student_stats.items()}
+            )
+            for i, student in enumerate(students)
+        ],
+    }
+
+
+def cache_key(course_id, version):
+    return f"gradebook:{course_id}:{version}"
+
+
+def course_gradebook(course_id):
+    """Statistics for a course, from the cache when nothing has changed since they were computed."""
+    version = db.session.execute(
+        select(CourseVersion.version).where(CourseVersion.course_id == course_id)
+    ).scalar() or 0
+    statistics = gradebook_cache.get(cache_key(course_id, version))
+    if statistics is None:
+        # Read in the same transaction as the version, so they match
+        statistics = compute_statistics(*load_matrix(course_id))
+        gradebook_cache.set(cache_key(course_id, version), statistics)
+
+    return statistics
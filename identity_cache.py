@@ -0,0 +1,111 @@
+"""Cached user lookups for Flask-Login.
+
+``load_user`` runs on every authenticated request. Instead of loading the
+``User`` row each time, it keeps a snapshot of the user (and their username)
+in a cache keyed by id and returns a detached ``CachedUser``. Mapper events on
+``User`` and ``UserAccount`` drop the snapshot when a row changes, once the
+transaction commits.
+
+``LMS_IDENTITY_CACHE`` picks the backend: ``memory`` (default, per process),
+``file`` (shared by workers through ``LMS_IDENTITY_CACHE_DIR``, by default
+``instance/identity-cache``) or ``none``. The memory backend only drops
+snapshots in the process that made the change: with several worker processes,
+a deleted or edited user keeps their old identity on the other workers for up
+to ``LMS_IDENTITY_CACHE_TTL`` seconds. Use ``file`` (or ``none``) there.
+"""
+import os
+
+from flask_login import UserMixin
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+
+from cache import LRUCache, FileCache
+from models import db, User, UserAccount
+
+SNAPSHOT_FIELDS = ("id", "name", "age", "phone_number", "email", "status")
+
+identity_cache = None
+
+
+class CachedUser(UserMixin):
+    """Read-only stand-in for ``User`` built from a cached snapshot."""
+
+    def __init__(self, snapshot):
+        self.__dict__.update(snapshot)
+
+
+def init_identity_cache(app):
+    global identity_cache
+
+    backend = os.environ.get("LMS_IDENTITY_CACHE", "memory")
+    ttl = int(os.environ.get("LMS_IDENTITY_CACHE_TTL", 300))
+
+    if backend == "memory":
+        identity_cache = LRUCache(int(os.environ.get("LMS_IDENTITY_CACHE_SIZE", 10000)), ttl)
+    elif backend == "file":
+        directory = os.environ.get("LMS_IDENTITY_CACHE_DIR", os.path.join(app.instance_path, "identity-cache"))
+        identity_cache = FileCache(directory, ttl)
+    elif backend == "none":
+        identity_cache = None
+    else:
+        raise ValueError("LMS_IDENTITY_CACHE must be one of memory, file, none")
+
+
+def cache_key(user_id):
+    return f"user:{user_id}"
+
+
+def load_user(user_id):
+    """Return the user with this id, from the cache when possible, or None if it no longer exists."""
+    if identity_cache is None:
+        return db.session.get(User, int(user_id))
+
+    snapshot = identity_cache.get(cache_key(user_id))
+    if snapshot is None:
+        row = db.session.execute(
+            db.select(User, UserAccount.username)
+            .outerjoin(UserAccount, UserAccount.user_id == User.id)
+            .where(User.id == int(user_id))
+        ).first()
+        if row is None:
+            return None
+
+        user, username = row
+        snapshot = {field: getattr(user, field) for field in SNAPSHOT_FIELDS}
+        snapshot["username"] = username
+        identity_cache.set(cache_key(user_id), snapshot)
+
+    return CachedUser(snapshot)
+
+
+def cache_stats():
+    if identity_cache is None:
+        return {"backend": "none"}
+
+    return dict(identity_cache.stats(), backend=type(identity_cache).__name__)
+
+
+def _schedule_invalidation(target, user_id):
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault("stale_user_ids", set()).add(user_id)
+
+
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def user_changed(mapper, connection, target):
+    _schedule_invalidation(target, target.id)
+
+
+@event.listens_for(UserAccount, "after_update")
+@event.listens_for(UserAccount, "after_delete")
+def account_changed(mapper, connection, target):
+    _schedule_invalidation(target, target.user_id)
+
+
+@event.listens_for(Session, "after_commit")
+def drop_stale_users(session):
+    # Only after commit: dropping earlier would let a concurrent request re-cache the old row
+    for user_id in session.info.pop("stale_user_ids", ()):
+        if identity_cache is not None:
+            identity_cache.delete(cache_key(user_id))
@@ -0,0 +1,237 @@
+"""Durable background jobs stored in the application database.
+
+``enqueue`` adds a ``Job`` row to the current session, so a job is queued only
+if the request that created it commits. Workers claim the oldest due job with
+a single conditional ``UPDATE``, which is atomic without any broker or extra
+locking, run its handler, and mark it done. A failing job is retried with
+exponential backoff until ``max_attempts``, then kept as ``failed`` with its
+last error. Jobs left ``running`` by a worker that died are requeued after
+``LMS_JOB_LOCK_TIMEOUT`` seconds; handlers that can run longer than that call
+``heartbeat`` as they make progress to keep their lock.
+
+Run workers as a separate process with ``flask --app app run-worker``.
+``LMS_JOB_WORKERS`` (default 1) worker threads also run inside each web
+process, started by the first request it serves, so a default install
+processes its jobs; set it to 0 when separate workers are run.
+"""
+import json
+import logging
+import os
+import socket
+import threading
+import time
+import traceback
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import select, update, func
+
+from models import db, Job
+
+log = logging.getLogger(__name__)
+
+HANDLERS = {}
+POLL_INTERVAL = float(os.environ.get("LMS_JOB_POLL_INTERVAL", 1.0))
+LOCK_TIMEOUT = int(os.environ.get("LMS_JOB_LOCK_TIMEOUT", 600))
+RETRY_DELAY = 30
+REQUEUE_INTERVAL = 60
+HEARTBEAT_INTERVAL = LOCK_TIMEOUT / 4
+
+# The job the handler on this thread is running, for heartbeat()
+_running = threading.local()
+
+
+def utcnow():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def job(kind):
+    """Register the decorated function as the handler for jobs of ``kind``; it receives the payload as keyword arguments."""
+    def decorator(f):
+        HANDLERS[kind] = f
+        return f
+
+    return decorator
+
+
+def enqueue(kind, payload=None, delay=0, max_attempts=3):
+    """Queue a job in the current transaction; it becomes visible to workers when the session commits."""
+    now = utcnow()
+    new_job = Job(
+        kind=kind,
+        payload=json.dumps(payload or {}),
+        status="queued",
+        max_attempts=max_attempts,
+        run_at=now + timedelta(seconds=delay),
+        created_at=now,
+    )
+    db.session.add(new_job)
+    return new_job
+
+
+def claim(worker_id):
+    """Mark the oldest due job as running for this worker and return it, or None if there is nothing to do."""
+    now = utcnow()
+    next_job = (
+        select(Job.id)
+        .where(Job.status == "queued", Job.run_at <= now)
+        .order_by(Job.run_at, Job.id)
+        .limit(1)
+        .scalar_subquery()
+    )
+    # The status check makes the update a no-op if another worker claimed the same row first
+    claimed = db.session.execute(
+        update(Job)
+        .where(Job.id == next_job, Job.status == "queued")
+        .values(status="running", locked_by=worker_id, locked_at=now, attempts=Job.attempts + 1)
+        .returning(Job)
+        .execution_options(synchronize_session=False)
+    ).scalar()
+    db.session.commit()
+    return claimed
+
+
+def requeue_stale(now=None):
+    """Put back jobs whose worker stopped without finishing them."""
+    now = now or utcnow()
+    result = db.session.execute(
+        update(Job)
+        .where(Job.status == "running", Job.locked_at < now - timedelta(seconds=LOCK_TIMEOUT))
+        .values(status="queued", locked_by=None, locked_at=None, run_at=now)
+    )
+    db.session.commit()
+    return result.rowcount
+
+
+def heartbeat():
+    """Refresh the lock of the job running on this thread, so ``requeue_stale`` leaves it alone.
+
+    Cheap enough to call once per unit of work: it writes at most every
+    ``HEARTBEAT_INTERVAL`` seconds, in its own transaction so the handler's
+    session is left as it is. Does nothing outside a job.
+    """
+    claimed = getattr(_running, "job", None)
+    if claimed is None or time.monotonic() < _running.next_beat:
+        return
+
+    _running.next_beat = time.monotonic() + HEARTBEAT_INTERVAL
+    with db.engine.begin() as connection:
+        connection.execute(
+            update(Job.__table__)
+            .where(Job.id == claimed[0], Job.status == "running", Job.locked_by == claimed[1])
+            .values(locked_at=utcnow())
+        )
+
+
+def run(claimed):
+    """Run a claimed job and record the outcome."""
+    handler = HANDLERS.get(claimed.kind)
+    _running.job = (claimed.id, claimed.locked_by)
+    _running.next_beat = time.monotonic() + HEARTBEAT_INTERVAL
+    try:
+        if handler is None:
+            raise LookupError(f"No handler for job kind {claimed.kind!r}")
+        handler(**json.loads(claimed.payload))
+    except Exception:
+        db.session.rollback()
+        error = traceback.format_exc()
+        log.warning("Job %s (%s) failed on attempt %s", claimed.id, claimed.kind, claimed.attempts)
+
+        claimed.last_error = error[-4000:]
+        claimed.locked_by = None
+        claimed.locked_at = None
+        if claimed.attempts < claimed.max_attempts:
+            claimed.status = "queued"
+            claimed.run_at = utcnow() + timedelta(seconds=RETRY_DELAY * 2 ** (claimed.attempts - 1))
+        else:
+            claimed.status = "failed"
+        db.session.commit()
+        return False
+    finally:
+        _running.job = None
+
+    claimed.status = "done"
+    claimed.locked_by = None
+    claimed.locked_at = None
+    db.session.commit()
+    return True
+
+
+def work(worker_id, stop=None, burst=False):
+    """Claim and run jobs until ``stop`` is set, or until the queue is empty when ``burst`` is true."""
+    stop = stop or threading.Event()
+    processed = 0
+    next_requeue = 0.0
+
+    while not stop.is_set():
+        if time.monotonic() >= next_requeue:
+            requeue_stale()
+            next_requeue = time.monotonic() + REQUEUE_INTERVAL
+
+        claimed = claim(worker_id)
+        if claimed is None:
+            if burst:
+                break
+            stop.wait(POLL_INTERVAL)
+            continue
+
+        run(claimed)
+        processed += 1
+
+    db.session.remove()
+    return processed
+
+
+class WorkerPool:
+    """A fixed number of worker threads, each with its own app context and database session."""
+
+    def __init__(self, app, concurrency=2, burst=False):
+        self.app = app
+        self.concurrency = concurrency
+        self.burst = burst
+        self.stop = threading.Event()
+        self.threads = []
+        self.processed = 0
+        self._lock = threading.Lock()
+
+    def _run(self, number):
+        worker_id = f"{socket.gethostname()}:{os.getpid()}:{number}"
+        with self.app.app_context():
+            processed = work(worker_id, self.stop, self.burst)
+        with self._lock:
+            self.processed += processed
+
+    def start(self):
+        if self.threads:
+            return
+        with self._lock:
+            if not self.threads:
+                self._start_threads()
+
+    def _start_threads(self):
+        for number in range(self.concurrency):
+            thread = threading.Thread(target=self._run, args=(number,), name=f"job-worker-{number}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def join(self):
+        for thread in self.threads:
+            # Short timeouts keep the main thread responsive to Ctrl+C
+            while thread.is_alive():
+                thread.join(0.5)
+
+    def shutdown(self):
+        self.stop.set()
+        self.join()
+
+
+def init_jobs(app):
+    workers = int(os.environ.get("LMS_JOB_WORKERS", 1))
+    if workers > 0:
+        pool = WorkerPool(app, workers)
+        app.extensions["job_workers"] = pool
+        # Only a process that serves requests runs them, not CLI commands such as run-worker itself
+        app.before_request(pool.start)
+
+
+def queue_stats():
+    return dict(db.session.execute(select(Job.status, func.count()).group_by(Job.status)).all())
@@ -0,0 +1,303 @@
+"""Per-request performance metrics and the slow-query log.
+
+Every request is timed from the moment it is routed until its response is
+ready, and the time spent in SQL (measured around each cursor execution) and
+in rendering templates is added up on the way, together with the number of
+statements it ran and the size of its body. The figures go into histograms
+labelled by endpoint, which ``render`` writes in the Prometheus text format.
+A page with an N+1 query pattern stands out because its requests land in the
+top buckets of ``lms_db_statements_per_request``.
+
+Statements slower than ``LMS_SLOW_QUERY_MS`` are logged on the
+``lms.slow_queries`` logger with the endpoint that ran them (and written to
+``LMS_SLOW_QUERY_LOG`` if set); requests that run more than
+``LMS_QUERY_COUNT_WARNING`` statements are logged too. The most recent
+entries of both are kept in memory for the admin pages.
+
+The figures are kept per process: with several worker processes, every
+process has to be scraped (or run a single worker when profiling).
+"""
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+from flask import g, request, has_app_context, has_request_context, template_rendered, before_render_template
+from sqlalchemy import event
+
+slow_query_log = logging.getLogger("lms.slow_queries")
+
+SLOW_QUERY_SECONDS = float(os.environ.get("LMS_SLOW_QUERY_MS", 200)) / 1000
+QUERY_COUNT_WARNING = int(os.environ.get("LMS_QUERY_COUNT_WARNING", 30))
+RECENT_ENTRIES = 200
+MAX_STATEMENT_LENGTH = 2000
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STATEMENT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 250, 1000)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names, values, extra=""):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = labels
+        self.values = {}
+
+    def inc(self, labels=(), amount=1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def samples(self):
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} counter"
+        for labels, value in sorted(self.values.items()):
+            yield f"{self.name}{_labels(self.label_names, labels)} {_number(value)}"
+
+
+class Histogram:
+    def __init__(self, name, documentation, buckets, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = buckets
+        self.label_names = labels
+        # labels -> [count per bucket (not cumulative, last one is +Inf), sum]
+        self.values = {}
+
+    def observe(self, value, labels=()):
+        series = self.values.get(labels)
+        if series is None:
+            series = self.values[labels] = [[0] * (len(self.buckets) + 1), 0]
+
+        index = next((i for i, bound in enumerate(self.buckets) if value <= bound), len(self.buckets))
+        series[0][index] += 1
+        series[1] += value
+
+    def samples(self):
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} histogram"
+        for labels, (counts, total) in sorted(self.values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                bucket = 'le="' + str(bound) + '"'
+                yield f"{self.name}_bucket{_labels(self.label_names, labels, bucket)} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.label_names, labels)} {_number(total)}"
+            yield f"{self.name}_count{_labels(self.label_names, labels)} {cumulative}"
+
+
+_lock = threading.Lock()
+
+requests_total = Counter("lms_http_requests_total", "Requests handled.", ("endpoint", "method", "status"))
+request_duration = Histogram(
+    "lms_http_request_duration_seconds", "Time from routing a request to having its response.",
+    DURATION_BUCKETS, ("endpoint",)
+)
+response_bytes = Counter("lms_http_response_bytes_total", "Response body bytes sent by the application.", ("endpoint",))
+statements_per_request = Histogram(
+    "lms_db_statements_per_request", "SQL statements run by one request.", STATEMENT_BUCKETS, ("endpoint",)
+)
+sql_duration = Histogram(
+    "lms_db_duration_seconds", "Time one request spent executing SQL.", DURATION_BUCKETS, ("endpoint",)
+)
+template_duration = Histogram(
+    "lms_template_render_duration_seconds", "Time one request spent rendering templates.", DURATION_BUCKETS, ("endpoint",)
+)
+slow_statements = Counter(
+    "lms_db_slow_statements_total", "Statements slower than the slow-query threshold.", ("endpoint",)
+)
+rate_limited_requests = Counter(
+    "lms_rate_limited_requests_total", "Requests refused by a rate limit, by the bucket that was empty.", ("endpoint", "key")
+)
+METRICS = (
+    requests_total, request_duration, response_bytes, statements_per_request,
+    sql_duration, template_duration, slow_statements, rate_limited_requests,
+)
+
+recent_slow_statements = deque(maxlen=RECENT_ENTRIES)
+recent_heavy_requests = deque(maxlen=RECENT_ENTRIES)
+
+
+def current_endpoint():
+    if has_request_context():
+        return request.endpoint or "unmatched"
+    return "-"
+
+
+def init_metrics(app):
+    log_file = os.environ.get("LMS_SLOW_QUERY_LOG")
+    if log_file:
+        handler = logging.FileHandler(log_file)
+        handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+        slow_query_log.addHandler(handler)
+        slow_query_log.setLevel(logging.INFO)
+
+    @app.before_request
+    def start_request_metrics():
+        g.request_metrics = {
+            "started": time.perf_counter(),
+            "statements": 0,
+            "sql_seconds": 0.0,
+            "template_seconds": 0.0,
+            "template_starts": [],
+        }
+
+    @app.after_request
+    def measure_response(response):
+        request_metrics = g.get("request_metrics")
+        if request_metrics is not None:
+            request_metrics["status"] = response.status_code
+            # Streamed bodies without a Content-Length are not counted; calculate_content_length would buffer them
+            if response.is_sequence:
+                request_metrics["bytes"] = response.calculate_content_length() or 0
+            else:
+                request_metrics["bytes"] = response.content_length or 0
+        return response
+
+    @app.teardown_request
+    def record_request_metrics(exception=None):
+        request_metrics = g.pop("request_metrics", None)
+        if request_metrics is not None:
+            record_request(request_metrics)
+
+    template_rendered.connect(_template_rendered, app)
+    before_render_template.connect(_before_render_template, app)
+
+
+def record_request(request_metrics):
+    endpoint = request.endpoint or "unmatched"
+    labels = (endpoint,)
+    duration = time.perf_counter() - request_metrics["started"]
+    statements = request_metrics["statements"]
+
+    with _lock:
+        requests_total.inc((endpoint, request.method, str(request_metrics.get("status", 500))))
+        request_duration.observe(duration, labels)
+        response_bytes.inc(labels, request_metrics.get("bytes", 0))
+        statements_per_request.observe(statements, labels)
+        sql_duration.observe(request_metrics["sql_seconds"], labels)
+        template_duration.observe(request_metrics["template_seconds"], labels)
+
+    if statements > QUERY_COUNT_WARNING:
+        recent_heavy_requests.append({
+            "endpoint": endpoint,
+            "path": request.full_path,
+            "statements": statements,
+            "sql_ms": round(request_metrics["sql_seconds"] * 1000, 2),
+            "duration_ms": round(duration * 1000, 2),
+            "at": time.time(),
+        })
+        slow_query_log.warning("%s ran %d SQL statements in %.1f ms (%s)",
+                               endpoint, statements, request_metrics["sql_seconds"] * 1000, request.full_path)
+
+
+def record_rate_limited(endpoint, key):
+    with _lock:
+        rate_limited_requests.inc((endpoint, key))
+
+
+def _request_metrics():
+    return g.get("request_metrics") if has_app_context() else None
+
+
+def _before_render_template(sender, template, context, **extra):
+    request_metrics = _request_metrics()
+    if request_metrics is not None:
+        request_metrics["template_starts"].append(time.perf_counter())
+
+
+def _template_rendered(sender, template, context, **extra):
+    request_metrics = _request_metrics()
+    if request_metrics is not None and request_metrics["template_starts"]:
+        request_metrics["template_seconds"] += time.perf_counter() - request_metrics["template_starts"].pop()
+
+
+def instrument_engine(engine):
+    """Time every statement the engine runs and charge it to the current request."""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def start_statement(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("statement_starts", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def end_statement(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["statement_starts"].pop()
+
+        request_metrics = _request_metrics()
+        if request_metrics is not None:
+            request_metrics["statements"] += 1
+            request_metrics["sql_seconds"] += elapsed
+
+        if elapsed >= SLOW_QUERY_SECONDS:
+            record_slow_statement(statement, elapsed, executemany)
+
+    @event.listens_for(engine, "handle_error")
+    def drop_failed_statement(context):
+        # after_cursor_execute does not run for a statement that raised
+        starts = context.connection.info.get("statement_starts") if context.connection is not None else None
+        if starts:
+            starts.pop()
+
+
+def record_slow_statement(statement, elapsed, executemany=False):
+    endpoint = current_endpoint()
+    statement = " ".join(statement.split())[:MAX_STATEMENT_LENGTH]
+
+    with _lock:
+        slow_statements.inc((endpoint,))
+    # Parameters are left out: they can hold password hashes and submission text
+    recent_slow_statements.append({
+        "endpoint": endpoint,
+        "duration_ms": round(elapsed * 1000, 2),
+        "statement": statement,
+        "executemany": executemany,
+        "at": time.time(),
+    })
+    slow_query_log.warning("%.1f ms in %s: %s", elapsed * 1000, endpoint, statement)
+
+
+def render(caches=None, gauges=None):
+    """The metrics in the Prometheus text exposition format.
+
+    ``caches`` maps a cache name to its ``stats()``; ``gauges`` maps a metric
+    name to ``(help, label name, {label value: value})``.
+    """
+    lines = []
+    with _lock:
+        for metric in METRICS:
+            lines.extend(metric.samples())
+
+    if caches:
+        for suffix, field, kind, documentation in (
+            ("hits_total", "hits", "counter", "Cache lookups that found an entry."),
+            ("misses_total", "misses", "counter", "Cache lookups that found nothing."),
+            ("hit_ratio", "hit_rate", "gauge", "Share of cache lookups that found an entry."),
+        ):
+            lines.append(f"# HELP lms_cache_{suffix} {documentation}")
+            lines.append(f"# TYPE lms_cache_{suffix} {kind}")
+            for name, stats in sorted(caches.items()):
+                if stats.get(field) is not None:
+                    lines.append(f'lms_cache_{suffix}{{cache="{_escape(name)}"}} {_number(stats[field])}')
+
+    for name, (documentation, label, values) in sorted((gauges or {}).items()):
+        lines.append(f"# HELP {name} {documentation}")
+        lines.append(f"# TYPE {name} gauge")
+        for value_label, value in sorted(values.items()):
+            lines.append(f'{name}{{{label}="{_escape(value_label)}"}} {_number(value)}')
+
+    return "\n".join(lines) + "\n"
+
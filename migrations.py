@@ -0,0 +1,194 @@
+"""Schema migrations for databases created by an older version of the models.
+
+``db.create_all()`` only creates missing tables; it never touches a table that
+already exists. Each migration below brings an existing database up to date
+and records its version in ``schema_version``. Migrations must be idempotent,
+because a fresh database already has everything ``create_all()`` produced.
+"""
+from sqlalchemy import MetaData, Table, Column, Integer, select, func, text, inspect
+from sqlalchemy.schema import CreateIndex
+
+import course_progress
+import page_cache
+import search
+import site_statistics
+
+schema_version = Table(
+    "schema_version",
+    MetaData(),
+    Column("version", Integer, primary_key=True),
+)
+
+MIGRATIONS = []
+
+
+def migration(version):
+    def decorator(f):
+        MIGRATIONS.append((version, f))
+        MIGRATIONS.sort(key=lambda item: item[0])
+        return f
+
+    return decorator
+
+
+def create_index(connection, index):
+    """Create ``index`` unless it exists; SQLite's reflection skips expression indexes, so ask SQLite itself."""
+    if connection.dialect.name == "sqlite":
+        connection.execute(CreateIndex(index, if_not_exists=True))
+    else:
+        index.create(connection, checkfirst=True)
+
+
+def create_missing_indexes(connection, metadata):
+    for table in metadata.sorted_tables:
+        for index in table.indexes:
+            create_index(connection, index)
+
+
+def add_missing_column(connection, table, column):
+    """``ALTER TABLE ... ADD COLUMN`` for a nullable column from the models, unless it exists."""
+    existing = {c["name"] for c in inspect(connection).get_columns(table.name)}
+    if column.name in existing:
+        return
+
+    column_type = column.type.compile(dialect=connection.dialect)
+    connection.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"))
+
+
+@migration(1)
+def add_foreign_key_indexes(connection, metadata):
+    create_missing_indexes(connection, metadata)
+
+
+@migration(2)
+def populate_site_statistics(connection, metadata):
+    site_statistics.reconcile(connection)
+
+
+@migration(3)
+def widen_password_column(connection, metadata):
+    # Password hashes are longer than the old VARCHAR(100); SQLite does not enforce lengths
+    if connection.dialect.name == "postgresql":
+        connection.execute(text("ALTER TABLE user_account ALTER COLUMN password TYPE VARCHAR(255)"))
+    elif connection.dialect.name in ("mysql", "mariadb"):
+        connection.execute(text("ALTER TABLE user_account MODIFY password VARCHAR(255) NOT NULL"))
+
+
+@migration(4)
+def add_listing_indexes(connection, metadata):
+    create_missing_indexes(connection, metadata)
+    # Superseded by ix_user_status_name, which starts with the same column
+    connection.execute(text("DROP INDEX IF EXISTS ix_user_status"))
+
+
+@migration(5)
+def add_submission_feedback(connection, metadata):
+    submission = metadata.tables["submission"]
+    add_missing_column(connection, submission, submission.c.feedback)
+
+
+@migration(6)
+def add_assignment_weight(connection, metadata):
+    assignments = metadata.tables["assignments"]
+    add_missing_column(connection, assignments, assignments.c.weight)
+
+
+@migration(7)
+def add_course_versions(connection, metadata):
+    metadata.tables["course_version"].create(connection, checkfirst=True)
+    page_cache.populate_versions(connection)
+
+
+@migration(8)
+def add_background_jobs(connection, metadata):
+    metadata.tables["job"].create(connection, checkfirst=True)
+
+    stored_file = metadata.tables["stored_file"]
+    for column in (stored_file.c.scan_status, stored_file.c.text_path, stored_file.c.thumbnail_path):
+        add_missing_column(connection, stored_file, column)
+
+
+@migration(9)
+def add_search_index(connection, metadata):
+    search.reindex(connection)
+
+
+@migration(10)
+def add_deadline_datetimes(connection, metadata):
+    # Deadlines were 'YYYY-MM-DD' strings, due by the end of that day
+    if connection.dialect.name == "sqlite":
+        # SQLite keeps DATETIME as text in this format, which sorts and compares chronologically
+        connection.execute(text(
+            "UPDATE assignments SET deadline = deadline || ' 23:59:59.000000' WHERE length(deadline) = 10"
+        ))
+    elif connection.dialect.name == "postgresql":
+        connection.execute(text(
+            "ALTER TABLE assignments ALTER COLUMN deadline TYPE TIMESTAMP "
+            "USING deadline::date + interval '23 hours 59 minutes 59 seconds'"
+        ))
+    elif connection.dialect.name in ("mysql", "mariadb"):
+        connection.execute(text(
+            "UPDATE assignments SET deadline = CONCAT(deadline, ' 23:59:59') WHERE LENGTH(deadline) = 10"
+        ))
+        connection.execute(text("ALTER TABLE assignments MODIFY deadline DATETIME NOT NULL"))
+
+    submission = metadata.tables["submission"]
+    for column in (submission.c.submitted_at, submission.c.is_late):
+        add_missing_column(connection, submission, column)
+
+    for index in metadata.tables["assignments"].indexes:
+        create_index(connection, index)
+
+
+@migration(11)
+def add_stored_file_path_index(connection, metadata):
+    for index in metadata.tables["stored_file"].indexes:
+        create_index(connection, index)
+
+
+@migration(12)
+def add_student_course_progress(connection, metadata):
+    table = metadata.tables["student_course_progress"]
+    table.create(connection, checkfirst=True)
+    for index in table.indexes:
+        create_index(connection, index)
+    course_progress.rebuild(connection)
+
+
+@migration(13)
+def add_notifications(connection, metadata):
+    for name in ("scheduled_task", "notification"):
+        table = metadata.tables[name]
+        table.create(connection, checkfirst=True)
+        for index in table.indexes:
+            create_index(connection, index)
+
+
+@migration(14)
+def add_case_insensitive_search_indexes(connection, metadata):
+    for name in ("user", "course"):
+        for index in metadata.tables[name].indexes:
+            create_index(connection, index)
+
+
+def current_version(connection):
+    schema_version.create(connection, checkfirst=True)
+    return connection.execute(select(func.max(schema_version.c.version))).scalar() or 0
+
+
+def upgrade_schema(engine, metadata):
+    """Apply every pending migration in a single transaction and return the applied versions."""
+    applied = []
+
+    with engine.begin() as connection:
+        version = current_version(connection)
+
+        for migration_version, step in MIGRATIONS:
+            if migration_version <= version:
+                continue
+
+            step(connection, metadata)
+            connection.execute(schema_version.insert().values(version=migration_version))
+            applied.append(migration_version)
+
+    return applied
@@ -0,0 +1,41 @@
+"""Lookups shared by the mapper event listeners that keep derived tables in step.
+
+``page_cache``, ``site_statistics`` and ``course_progress`` all react to the
+same ``Submission`` events and all need the submission's course, which is not
+a column of ``submission``. ``course_of_submission`` reads it from the loaded
+``assignment`` relationship when there is one, and otherwise queries it once
+per assignment and flush, so the three listeners share a single lookup.
+"""
+from sqlalchemy import event, select, inspect
+from sqlalchemy.orm import Session, object_session
+
+from models import Assignments
+
+COURSES_KEY = "assignment_course_ids"
+
+
+def old_value(target, attribute):
+    """The value ``attribute`` had before the pending change, or its current value if it has none."""
+    history = inspect(target).attrs[attribute].history
+    return history.deleted[0] if history.deleted else getattr(target, attribute)
+
+
+def course_of_submission(connection, target):
+    """The course id of a submission being flushed."""
+    if "assignment" not in inspect(target).unloaded:
+        assignment = target.assignment
+        if assignment is not None and assignment.id == target.assignment_id:
+            return assignment.course_id
+
+    session = object_session(target)
+    courses = session.info.setdefault(COURSES_KEY, {}) if session is not None else {}
+    if target.assignment_id not in courses:
+        courses[target.assignment_id] = connection.execute(
+            select(Assignments.course_id).where(Assignments.id == target.assignment_id)
+        ).scalar()
+    return courses[target.assignment_id]
+
+
+@event.listens_for(Session, "after_flush")
+def forget_courses(session, flush_context):
+    session.info.pop(COURSES_KEY, None)
@@ -0,0 +1,274 @@
+from datetime import datetime
+
+from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.orm import relationship, DeclarativeBase, Mapped, mapped_column
+from sqlalchemy import Integer, BigInteger, String, Text, Float, Boolean, DateTime, Index, func
+from flask_login import UserMixin
+
+
+# Create database
+class Base(DeclarativeBase):
+    pass
+
+
+db = SQLAlchemy(model_class=Base)
+
+
+class UserAccount(db.Model, UserMixin):
+    __tablename__ = "user_account"
+    user_id: Mapped[int] = mapped_column(Integer, db.ForeignKey("user.id"), primary_key=True)
+    username: Mapped[str] = mapped_column(String(100), nullable=False, unique=True)
+    password: Mapped[str] = mapped_column(String(255), nullable=False)
+
+    user = relationship("User", back_populates="account")
+
+
+class User(UserMixin, db.Model):
+    __tablename__ = "user"
+    __table_args__ = (
+        # Status filter plus the (name, id) order of the paginated people listings
+        Index("ix_user_status_name", "status", "name", "id"),
+    )
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    name: Mapped[str] = mapped_column(String(100), nullable=False)
+    age: Mapped[int] = mapped_column(Integer)
+    phone_number: Mapped[str] = mapped_column(String(10), unique=True)
+    email: Mapped[str] = mapped_column(String(100), unique=True)
+    status: Mapped[str] = mapped_column(String(20), nullable=False)
+
+    account = relationship("UserAccount", back_populates="user", uselist=False, cascade="all, delete-orphan")
+    teaching_course = relationship("Course", back_populates="instructor", cascade="all, delete-orphan")
+    enrollment = relationship("Enrollment", back_populates="student", cascade="all, delete-orphan")
+    grade = relationship("Grade", back_populates="student", cascade="all, delete-orphan")
+    submissions = relationship("Submission", back_populates="student", cascade="all, delete-orphan")
+
+
+# Case-insensitive prefix search of the listings (pagination.prefix_match), within a status
+Index("ix_user_status_lower_name", User.status, func.lower(User.name))
+Index("ix_user_status_lower_email", User.status, func.lower(User.email))
+
+
+class Course(db.Model):
+    __tablename__ = "course"
+    __table_args__ = (
+        Index("ix_course_instructor_id", "instructor_id"),
+    )
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    name: Mapped[str] = mapped_column(String(250), unique=True, nullable=False)
+    instructor_id: Mapped[int] = mapped_column(Integer, db.ForeignKey("user.id"))
+
+    instructor = relationship("User", back_populates="teaching_course")
+    enrollment = relationship("Enrollment", back_populates="course", cascade="all, delete-orphan")
+    material = relationship("CourseMaterial", back_populates="course", cascade="all, delete-orphan")
+    assignment = relationship("Assignments", back_populates="course", cascade="all, delete-orphan")
+    grade = relationship("Grade", back_populates="course", cascade="all, delete-orphan")
+
+
+Index("ix_course_lower_name", func.lower(Course.name))
+
+
+class Enrollment(db.Model):
+    __tablename__ = "enrollment"
+    __table_args__ = (
+        # Unique indexes rather than UNIQUE constraints, so they can be added to existing tables
+        Index("uq_enrollment_course_student", "course_id", "student_id", unique=True),
+        Index("ix_enrollment_student_id", "student_id"),
+    )
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    course_id: Mapped[int] = mapped_column(Integer, db.ForeignKey("course.id"))
+    student_id: Mapped[int] = mapped_column(Integer, db.ForeignKey("user.id"))
+
+    course = relationship("Course", back_populates="enrollment")
+    student = relationship("User", back_populates="enrollment")
+
+
+class CourseMaterial(db.Model):
+    __tablename__ = "course_material"
+    __table_args__ = (
+        Index("ix_course_material_course_id", "course_id"),
+    )
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    course_id: Mapped[int] = mapped_column(Integer, db.ForeignKey("course.id"))
+    file_name: Mapped[str] = mapped_column(String(100), nullable=False)
+    file_path: Mapped[str] = mapped_column(String(250), nullable=False)
+    description: Mapped[str] = mapped_column(String(500), nullable=True)
+
+    course = relationship("Course", back_populates="material")
+
+
+class Assignments(db.Model):
+    __tablename__ = "assignments"
+    __table_args__ = (
+        Index("ix_assignments_course_id", "course_id"),
+        # Range scans over deadlines, e.g. everything due in the next hour
+        Index("ix_assignments_deadline", "deadline"),
+    )
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    course_id: Mapped[int] = mapped_column(Integer, db.ForeignKey("course.id"))
+    title: Mapped[str] = mapped_column(String(100), nullable=False)
+    text: Mapped[str] = mapped_column(String(1000), nullable=False)
+    file_name: Mapped[str] = mapped_column(String(100), nullable=True)
+    file_path: Mapped[str] = mapped_column(String(250), nullable=True)
+    assignment_type: Mapped[int] = mapped_column(Integer, nullable=False)
+    # Naive server-local time, compared with Submission.submitted_at
+    deadline: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+    # Relative weight in the final grade; NULL on rows from before weights counts as 1
+    weight: Mapped[float] = mapped_column(Float, nullable=True, default=1.0)
+
+    course = relationship("Course", back_populates="assignment")
+    submissions = relationship("Submission", back_populates="assignment", cascade="all, delete-orphan")
+    grades = relationship("Grade", back_populates="assignment")
+
+
+class Grade(db.Model):
+    __tablename__ = "grade"
+    __table_args__ = (
+        Index("uq_grade_assignment_student", "assignment_id", "student_id", unique=True),
+        Index("ix_grade_student_id", "student_id"),
+        Index("ix_grade_course_id", "course_id"),
+    )
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    student_id: Mapped[int] = mapped_column(Integer, db.ForeignKey("user.id"))
+    course_id: Mapped[int] = mapped_column(Integer, db.ForeignKey("course.id"))
+    assignment_id: Mapped[int] = mapped_column(Integer, db.ForeignKey("assignments.id"))  # Link to Assignments table
+    grade: Mapped[float] = mapped_column(Float, nullable=False)
+
+    student = relationship("User", back_populates="grade")
+    course = relationship("Course", back_populates="grade")
+    assignment = relationship("Assignments", back_populates="grades")
+
+
+class Submission(db.Model):
+    __tablename__ = "submission"
+    __table_args__ = (
+        Index("uq_submission_assignment_student", "assignment_id", "student_id", unique=True),
+        Index("ix_submission_student_id", "student_id"),
+        # Serves the ungraded queue: is_graded first, then the join column
+        Index("ix_submission_is_graded_assignment_id", "is_graded", "assignment_id"),
+    )
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    assignment_id: Mapped[int] = mapped_column(Integer, db.ForeignKey("assignments.id"))
+    student_id: Mapped[int] = mapped_column(Integer, db.ForeignKey("user.id"))
+    content: Mapped[str] = mapped_column(Text, nullable=True)
+    file_name: Mapped[str] = mapped_column(String(100), nullable=True)
+    file_path: Mapped[str] = mapped_column(String(250), nullable=True)
+    is_graded: Mapped[bool] = mapped_column(Boolean, default=False)
+    feedback: Mapped[str] = mapped_column(Text, nullable=True)
+    # When the server received the current version; NULL on rows from before it was recorded
+    submitted_at: Mapped[datetime] = mapped_column(DateTime, nullable=True)
+    is_late: Mapped[bool] = mapped_column(Boolean, nullable=True, default=False)
+
+    assignment = relationship("Assignments", back_populates="submissions")
+    student = relationship("User", back_populates="submissions")
+
+
+class StoredFile(db.Model):
+    """One row per distinct uploaded content, stored once under its SHA-256."""
+    __tablename__ = "stored_file"
+    __table_args__ = (
+        # Submissions and materials refer to stored files by path
+        Index("ix_stored_file_path", "path"),
+    )
+    sha256: Mapped[str] = mapped_column(String(64), primary_key=True)
+    size: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    path: Mapped[str] = mapped_column(String(250), nullable=False)
+    # Filled in by the process_upload background job
+    scan_status: Mapped[str] = mapped_column(String(20), nullable=True)
+    text_path: Mapped[str] = mapped_column(String(250), nullable=True)
+    thumbnail_path: Mapped[str] = mapped_column(String(250), nullable=True)
+
+
+class Job(db.Model):
+    """A unit of background work, claimed and run by the workers in jobs.py."""
+    __tablename__ = "job"
+    __table_args__ = (
+        # Serves the claim query: next queued job that is due
+        Index("ix_job_status_run_at", "status", "run_at", "id"),
+    )
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    kind: Mapped[str] = mapped_column(String(50), nullable=False)
+    payload: Mapped[str] = mapped_column(Text, nullable=False, default="{}")
+    status: Mapped[str] = mapped_column(String(20), nullable=False, default="queued")
+    attempts: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    max_attempts: Mapped[int] = mapped_column(Integer, nullable=False, default=3)
+    run_at: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+    created_at: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+    locked_by: Mapped[str] = mapped_column(String(100), nullable=True)
+    locked_at: Mapped[datetime] = mapped_column(DateTime, nullable=True)
+    last_error: Mapped[str] = mapped_column(Text, nullable=True)
+
+
+class ScheduledTask(db.Model):
+    """When a periodic task of scheduler.py last ran and is due again."""
+    __tablename__ = "scheduled_task"
+    name: Mapped[str] = mapped_column(String(50), primary_key=True)
+    next_run_at: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+    # Start of the last run that finished; the next run picks up from there
+    last_run_at: Mapped[datetime] = mapped_column(DateTime, nullable=True)
+    locked_by: Mapped[str] = mapped_column(String(100), nullable=True)
+
+
+class Notification(db.Model):
+    """A message shown to a user in the app, and emailed if an email sink is set up."""
+    __tablename__ = "notification"
+    __table_args__ = (
+        # At most one of each kind per student and assignment, so scans can be repeated
+        Index("uq_notification_user_assignment_kind", "user_id", "assignment_id", "kind", unique=True),
+        # A user's notifications, newest first
+        Index("ix_notification_user_id_id", "user_id", "id"),
+        # Email delivery reads the ones not sent yet
+        Index("ix_notification_emailed_at_created_at", "emailed_at", "created_at"),
+        Index("ix_notification_assignment_id", "assignment_id"),
+    )
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    user_id: Mapped[int] = mapped_column(Integer, db.ForeignKey("user.id"), nullable=False)
+    course_id: Mapped[int] = mapped_column(Integer, db.ForeignKey("course.id"), nullable=False)
+    assignment_id: Mapped[int] = mapped_column(Integer, db.ForeignKey("assignments.id"), nullable=False)
+    # "deadline_reminder" or "overdue"
+    kind: Mapped[str] = mapped_column(String(20), nullable=False)
+    created_at: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+    read_at: Mapped[datetime] = mapped_column(DateTime, nullable=True)
+    emailed_at: Mapped[datetime] = mapped_column(DateTime, nullable=True)
+
+
+class SiteCounter(db.Model):
+    """Running totals for the admin dashboard, kept current by site_statistics."""
+    __tablename__ = "site_counter"
+    name: Mapped[str] = mapped_column(String(50), primary_key=True)
+    value: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+
+
+class CourseStatistics(db.Model):
+    __tablename__ = "course_statistics"
+    course_id: Mapped[int] = mapped_column(Integer, db.ForeignKey("course.id"), primary_key=True)
+    enrollments: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    submissions: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    ungraded_submissions: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    grade_count: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    grade_sum: Mapped[float] = mapped_column(Float, nullable=False, default=0)
+
+    course = relationship("Course")
+
+
+class StudentCourseProgress(db.Model):
+    """One row per enrollment: how far the student is through the course, kept current by course_progress."""
+    __tablename__ = "student_course_progress"
+    __table_args__ = (
+        Index("ix_student_course_progress_student_id", "student_id"),
+    )
+    course_id: Mapped[int] = mapped_column(Integer, db.ForeignKey("course.id"), primary_key=True)
+    student_id: Mapped[int] = mapped_column(Integer, db.ForeignKey("user.id"), primary_key=True)
+    assignments_total: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    assignments_submitted: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    assignments_graded: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    grade_count: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    grade_sum: Mapped[float] = mapped_column(Float, nullable=False, default=0)
+    # Earliest deadline not yet passed among the assignments the student has not submitted
+    next_deadline: Mapped[datetime] = mapped_column(DateTime, nullable=True)
+
+
+class CourseVersion(db.Model):
+    """Bumped whenever anything shown on a course's pages changes; part of the page cache keys."""
+    __tablename__ = "course_version"
+    course_id: Mapped[int] = mapped_column(Integer, db.ForeignKey("course.id"), primary_key=True)
+    version: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
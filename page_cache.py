@@ -0,0 +1,196 @@
+"""Cache for rendered course pages, invalidated by per-course data versions.
+
+Every course has a row in ``course_version``. Mapper events bump it in the
+same flush that changes the course, one of its materials, assignments,
+enrollments, submissions or grades, or the name of one of its people. A cached page
+is keyed by the endpoint, the URL, the user and the ``(course_id, version,
+next_deadline)`` of the courses it shows, which are read with one small query
+per request. Any change to one of those courses, or to the set of courses,
+therefore produces a new key: stale pages are never served and are simply
+left to expire. ``next_deadline``, the course's earliest deadline still ahead,
+changes when that deadline passes, so pages showing time-dependent figures
+(the next deadline, progress summaries) are rendered again then, although no
+row changed.
+
+``LMS_PAGE_CACHE`` picks the backend: ``memory`` (default, per process),
+``file`` (shared through ``LMS_PAGE_CACHE_DIR``, by default the private
+``instance/page-cache``), ``redis`` (shared through the server at
+``LMS_PAGE_CACHE_URL``) or ``none``.
+"""
+import hashlib
+import os
+from datetime import datetime
+from functools import wraps
+
+from flask import request, make_response, session
+from flask_login import current_user
+from sqlalchemy import event, select, update, insert, delete, func, inspect
+
+from cache import LRUCache, FileCache, RedisCache
+from model_events import course_of_submission
+from models import db, User, Course, Enrollment, CourseMaterial, Assignments, Submission, Grade, CourseVersion
+
+course_version = CourseVersion.__table__
+
+page_cache = None
+
+
+def init_page_cache(app):
+    global page_cache
+
+    backend = os.environ.get("LMS_PAGE_CACHE", "memory")
+    ttl = int(os.environ.get("LMS_PAGE_CACHE_TTL", 86400))
+
+    if backend == "memory":
+        page_cache = LRUCache(int(os.environ.get("LMS_PAGE_CACHE_SIZE", 2000)), ttl)
+    elif backend == "file":
+        directory = os.environ.get("LMS_PAGE_CACHE_DIR", os.path.join(app.instance_path, "page-cache"))
+        page_cache = FileCache(directory, ttl)
+    elif backend == "redis":
+        page_cache = RedisCache(os.environ.get("LMS_PAGE_CACHE_URL", "redis://localhost:6379/0"), ttl, prefix="lms:page:")
+    elif backend == "none":
+        page_cache = None
+    else:
+        raise ValueError("LMS_PAGE_CACHE must be one of memory, file, redis, none")
+
+
+def versions_of(statement):
+    """``(course_id, version, next_deadline)`` for the courses selected by ``statement``, which must select ``Course.id``."""
+    courses = statement.subquery()
+    next_deadline = (
+        select(func.min(Assignments.deadline))
+        .where(Assignments.course_id == courses.c.id, Assignments.deadline >= datetime.now())
+        .scalar_subquery()
+    )
+    return db.session.execute(
+        select(courses.c.id, func.coalesce(course_version.c.version, 0), next_deadline)
+        .outerjoin(course_version, course_version.c.course_id == courses.c.id)
+        .order_by(courses.c.id)
+    ).all()
+
+
+def taught_course_versions(**kwargs):
+    return versions_of(select(Course.id).where(Course.instructor_id == current_user.id))
+
+
+def enrolled_course_versions(**kwargs):
+    return versions_of(select(Enrollment.course_id.label("id")).where(Enrollment.student_id == current_user.id))
+
+
+def course_versions(course_id, **kwargs):
+    return versions_of(select(Course.id).where(Course.id == course_id))
+
+
+def page_key(versions):
+    stamp = ",".join(f"{course_id}:{version}:{next_deadline}" for course_id, version, next_deadline in versions)
+    digest = hashlib.sha1(f"{request.full_path}|{current_user.get_id()}|{stamp}".encode()).hexdigest()
+    return f"page:{request.endpoint}:{digest}"
+
+
+def cached_page(course_versions):
+    """Serve a GET view from the page cache while the courses it shows are unchanged.
+
+    ``course_versions`` is called with the view's arguments and returns the
+    ``versions_of`` rows of the courses the page depends on. Place the decorator
+    below the access check, so only authorized requests reach the cache.
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            # A page showing flashed messages is only right once
+            if page_cache is None or request.method != "GET" or "_flashes" in session:
+                return f(*args, **kwargs)
+
+            key = page_key(course_versions(**kwargs))
+            body = page_cache.get(key)
+            if body is not None:
+                return body
+
+            response = make_response(f(*args, **kwargs))
+            if response.status_code == 200 and response.mimetype == "text/html":
+                page_cache.set(key, response.get_data(as_text=True))
+
+            return response
+
+        return decorated_function
+
+    return decorator
+
+
+def cache_stats():
+    if page_cache is None:
+        return {"backend": "none"}
+
+    return dict(page_cache.stats(), backend=type(page_cache).__name__)
+
+
+def bump_version(connection, course_id):
+    if course_id is not None:
+        connection.execute(
+            update(course_version)
+            .where(course_version.c.course_id == course_id)
+            .values(version=course_version.c.version + 1)
+        )
+
+
+def populate_versions(connection):
+    """Create the missing ``course_version`` rows, for courses created before versions existed."""
+    existing = select(course_version.c.course_id).where(course_version.c.course_id == Course.id)
+    connection.execute(insert(course_version).from_select(
+        ["course_id", "version"],
+        select(Course.id, 0).where(~existing.exists())
+    ))
+
+
+@event.listens_for(Course, "after_insert")
+def course_inserted(mapper, connection, target):
+    connection.execute(insert(course_version).values(course_id=target.id, version=0))
+
+
+@event.listens_for(Course, "after_update")
+def course_updated(mapper, connection, target):
+    bump_version(connection, target.id)
+
+
+@event.listens_for(Course, "before_delete")
+def course_deleted(mapper, connection, target):
+    connection.execute(delete(course_version).where(course_version.c.course_id == target.id))
+
+
+@event.listens_for(User, "after_update")
+def user_renamed(mapper, connection, target):
+    # Names of students and instructors appear on their courses' pages
+    if not inspect(target).attrs.name.history.has_changes():
+        return
+
+    courses = select(Enrollment.course_id).where(Enrollment.student_id == target.id).union(
+        select(Course.id).where(Course.instructor_id == target.id)
+    )
+    connection.execute(
+        update(course_version)
+        .where(course_version.c.course_id.in_(courses))
+        .values(version=course_version.c.version + 1)
+    )
+
+
+@event.listens_for(CourseMaterial, "after_insert")
+@event.listens_for(CourseMaterial, "after_update")
+@event.listens_for(CourseMaterial, "after_delete")
+@event.listens_for(Assignments, "after_insert")
+@event.listens_for(Assignments, "after_update")
+@event.listens_for(Assignments, "after_delete")
+@event.listens_for(Enrollment, "after_insert")
+@event.listens_for(Enrollment, "after_update")
+@event.listens_for(Enrollment, "after_delete")
+@event.listens_for(Grade, "after_insert")
+@event.listens_for(Grade, "after_update")
+@event.listens_for(Grade, "after_delete")
+def course_content_changed(mapper, connection, target):
+    bump_version(connection, target.course_id)
+
+
+@event.listens_for(Submission, "after_insert")
+@event.listens_for(Submission, "after_update")
+@event.listens_for(Submission, "after_delete")
+def submission_changed(mapper, connection, target):
+    bump_version(connection, course_of_submission(connection, target))
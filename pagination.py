@@ -0,0 +1,95 @@
+"""Keyset (seek) pagination for long listings.
+
+Pages are ordered by a unique tuple of columns, e.g. ``(User.name, User.id)``,
+and the next page starts strictly after the last row of the previous one. The
+database seeks straight to that position in the matching index, so page 800
+costs the same as page 1, unlike ``OFFSET``. The position is passed between
+requests as an opaque ``after`` cursor.
+"""
+import base64
+import binascii
+import json
+from collections import namedtuple
+from datetime import datetime
+
+from flask import request
+from sqlalchemy import DateTime, String, tuple_, and_, or_, func
+from werkzeug.exceptions import BadRequest
+
+from models import db
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+Page = namedtuple("Page", ["items", "next_cursor"])
+
+
+def encode_cursor(values):
+    values = [value.isoformat() if isinstance(value, datetime) else value for value in values]
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    """The list of sort values in an ``after`` cursor; anything else is a ``BadRequest``."""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (binascii.Error, ValueError):
+        raise BadRequest("Invalid page cursor.")
+
+    if not isinstance(values, list) or not all(isinstance(value, (str, int, float, type(None))) for value in values):
+        raise BadRequest("Invalid page cursor.")
+    return values
+
+
+def _from_cursor(column, value):
+    if isinstance(column.type, DateTime) and value is not None:
+        try:
+            return datetime.fromisoformat(value)
+        except (TypeError, ValueError):
+            raise BadRequest("Invalid page cursor.")
+    return value
+
+
+def page_size():
+    per_page = request.args.get("per_page", DEFAULT_PAGE_SIZE, type=int)
+    return max(1, min(per_page, MAX_PAGE_SIZE))
+
+
+def paginate(statement, sort_columns, after=None, per_page=DEFAULT_PAGE_SIZE, cursor_values=None):
+    """Run ``statement`` for the page after the ``after`` cursor.
+
+    ``cursor_values`` maps a result row to the values of ``sort_columns``; by
+    default they are read from the row's attributes of the same names.
+    """
+    if after:
+        values = decode_cursor(after)
+        if len(values) != len(sort_columns):
+            raise BadRequest("Invalid page cursor.")
+        values = [_from_cursor(column, value) for column, value in zip(sort_columns, values)]
+        statement = statement.where(tuple_(*sort_columns) > tuple_(*values))
+
+    rows = db.session.execute(statement.order_by(*sort_columns).limit(per_page + 1)).scalars().all()
+
+    next_cursor = None
+    if len(rows) > per_page:
+        rows = rows[:per_page]
+        last = rows[-1]
+        values = cursor_values(last) if cursor_values else [getattr(last, column.key) for column in sort_columns]
+        next_cursor = encode_cursor(values)
+
+    return Page(rows, next_cursor)
+
+
+def prefix_match(column, prefix):
+    """Case-insensitive ``LIKE 'prefix%'`` written as a range, so it can use an index on ``lower(column)``.
+
+    Both sides go through the database's ``lower()``, which on SQLite only
+    folds the letters A-Z.
+    """
+    folded = func.lower(column)
+    start = func.lower(prefix, type_=String)
+    return and_(folded >= start, folded < start.concat("\U0010ffff"))
+
+
+def search_filter(columns, query):
+    return or_(*(prefix_match(column, query) for column in columns))
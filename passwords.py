@@ -0,0 +1,72 @@
+"""Password hashing with a configurable cost and a bounded hashing pool.
+
+``LMS_PASSWORD_HASH_METHOD`` is any Werkzeug method string, e.g.
+``scrypt:32768:8:1`` (the default) or ``pbkdf2:sha256:600000``. Hashes made
+with different parameters still verify, and ``verify_password`` reports them
+(and legacy plaintext rows) as needing a rehash so login can upgrade them.
+
+Both hashlib.scrypt and hashlib.pbkdf2_hmac release the GIL, so hashing runs in
+a fixed-size thread pool: a burst of logins uses at most
+``LMS_PASSWORD_HASH_WORKERS`` cores, and once ``LMS_PASSWORD_HASH_QUEUE``
+requests are waiting further ones fail fast with a 503 instead of piling up.
+"""
+import hmac
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+from werkzeug.exceptions import ServiceUnavailable
+from werkzeug.security import generate_password_hash, check_password_hash
+
+HASH_METHODS = ("scrypt", "pbkdf2")
+
+hash_method = os.environ.get("LMS_PASSWORD_HASH_METHOD", "scrypt:32768:8:1")
+pool_size = int(os.environ.get("LMS_PASSWORD_HASH_WORKERS", os.cpu_count() or 1))
+queue_size = int(os.environ.get("LMS_PASSWORD_HASH_QUEUE", pool_size * 16))
+
+_executor = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix="password-hash")
+_slots = threading.BoundedSemaphore(pool_size + queue_size)
+
+
+class HashingBusy(ServiceUnavailable):
+    description = "Too many sign-ins at once, please try again in a moment."
+
+
+def _run(f, *args):
+    if not _slots.acquire(timeout=5):
+        raise HashingBusy()
+
+    try:
+        return _executor.submit(f, *args).result()
+    finally:
+        _slots.release()
+
+
+def is_hashed(stored):
+    method, separator, rest = stored.partition("$")
+    return bool(separator) and "$" in rest and method.split(":")[0] in HASH_METHODS
+
+
+@lru_cache(maxsize=None)
+def full_method(method):
+    """Expand a short method such as ``scrypt`` to the parameters Werkzeug stores, e.g. ``scrypt:32768:8:1``."""
+    return generate_password_hash("", method).partition("$")[0]
+
+
+def hash_password(password, method=None):
+    return _run(generate_password_hash, password, method or hash_method)
+
+
+def hash_passwords(passwords, method=None):
+    """Hash many passwords concurrently, keeping their order."""
+    return list(_executor.map(generate_password_hash, passwords, [method or hash_method] * len(passwords)))
+
+
+def verify_password(stored, password):
+    """Return ``(matches, needs_rehash)`` for a stored hash or legacy plaintext value."""
+    if not is_hashed(stored):
+        return hmac.compare_digest(stored.encode(), password.encode()), True
+
+    matches = _run(check_password_hash, stored, password)
+    return matches, matches and stored.partition("$")[0] != full_method(hash_method)
@@ -0,0 +1,215 @@
+"""Token-bucket rate limits for the routes that anyone can hit, such as login.
+
+A limited route gets a bucket per client IP and, when the form has a
+``username`` field, one per username. Each bucket holds up to ``count``
+tokens and refills at ``count`` per ``seconds``. Every attempt takes one
+token, and an attempt with no token left is answered 429 with a
+``Retry-After`` header. Only attempts are counted: POST, PUT, PATCH and
+DELETE requests. The check is a ``before_request`` hook, so a refused
+request never reaches the view and costs no database work.
+
+``LMS_RATE_LIMITS`` sets the limits per endpoint, for example
+``log_in:ip=20/60,username=10/300;register:ip=5/600``. Set it to ``off`` to
+disable them. ``LMS_RATE_LIMIT_BACKEND`` picks where buckets are kept:
+- ``memory`` (default): a dict in each worker process;
+- ``shared``: a fixed-size table in a memory-mapped file
+  (``LMS_RATE_LIMIT_FILE``, in /dev/shm when it exists), which every worker
+  on the machine uses.
+"""
+import hashlib
+import os
+import struct
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+from flask import request, render_template
+from werkzeug.exceptions import TooManyRequests
+
+import metrics
+
+DEFAULT_LIMITS = "log_in:ip=20/60,username=10/300;register:ip=5/600"
+COUNTED_METHODS = frozenset(("POST", "PUT", "PATCH", "DELETE"))
+KEY_TYPES = ("ip", "username")
+
+buckets = None
+
+
+def parse_limits(text):
+    """``endpoint:key=count/seconds,...;...`` -> {endpoint: [(key, count, seconds)]}."""
+    limits = {}
+    if text.strip().lower() in ("", "off", "none"):
+        return limits
+
+    for rule in text.split(";"):
+        endpoint, _, specs = rule.partition(":")
+        for spec in specs.split(","):
+            key, _, rate = spec.partition("=")
+            count, _, seconds = rate.partition("/")
+            key = key.strip()
+            if key not in KEY_TYPES or not count.strip().isdigit():
+                raise ValueError(f"Invalid rate limit {spec.strip()!r} in LMS_RATE_LIMITS")
+            limits.setdefault(endpoint.strip(), []).append((key, int(count), float(seconds or 1)))
+    return limits
+
+
+class MemoryBuckets:
+    """Buckets of one worker process: key -> (tokens, last update), the least recently used dropped past ``max_keys``."""
+
+    def __init__(self, max_keys=100000):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key, count, seconds):
+        """Take a token from the bucket; returns 0 if there was one, else the seconds until there is."""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (count, now))
+            tokens, wait = _refill_and_take(tokens, updated, now, count, seconds)
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self.max_keys:
+                # A dropped bucket comes back full, which only errs on the side of letting requests through
+                self._buckets.popitem(last=False)
+        return wait
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+class SharedBuckets:
+    """Buckets in a memory-mapped file shared by the workers on one machine.
+
+    The file is an open-addressing hash table of ``slots`` 24-byte slots: a
+    64-bit hash of the key, the tokens and the time of the last update. A key
+    is looked up in the ``PROBES`` slots after its hash; when they are all
+    taken, the one updated longest ago is reused. Updates hold an ``flock``
+    on the file (and a lock for the threads of this process).
+    """
+
+    SLOT = struct.Struct("<Qdd")
+    PROBES = 8
+
+    def __init__(self, path, slots=65536):
+        try:
+            import fcntl
+            import mmap
+        except ImportError:
+            raise RuntimeError("The shared rate limit backend needs fcntl and mmap (Unix)")
+
+        self._fcntl = fcntl
+        self._lock = threading.Lock()
+
+        self.fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        size = slots * self.SLOT.size
+        self._acquire()
+        try:
+            if os.fstat(self.fd).st_size < size:
+                os.ftruncate(self.fd, size)
+        finally:
+            self._release()
+        # Workers configured with fewer slots still use the whole table
+        self.slots = os.fstat(self.fd).st_size // self.SLOT.size
+        self.table = mmap.mmap(self.fd, self.slots * self.SLOT.size)
+
+    def _acquire(self):
+        # flock does not exclude the threads of one process, which share the file descriptor
+        self._lock.acquire()
+        self._fcntl.flock(self.fd, self._fcntl.LOCK_EX)
+
+    def _release(self):
+        self._fcntl.flock(self.fd, self._fcntl.LOCK_UN)
+        self._lock.release()
+
+    def take(self, key, count, seconds):
+        """Take a token from the bucket; returns 0 if there was one, else the seconds until there is."""
+        # 0 marks an empty slot
+        key_hash = int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "little") or 1
+        now = time.time()
+        slot_size = self.SLOT.size
+        start = key_hash % self.slots
+
+        self._acquire()
+        try:
+            oldest = None
+            for probe in range(self.PROBES):
+                offset = (start + probe) % self.slots * slot_size
+                slot_hash, tokens, updated = self.SLOT.unpack_from(self.table, offset)
+                if slot_hash == key_hash:
+                    break
+                if slot_hash == 0:
+                    tokens, updated = count, now
+                    break
+                if oldest is None or updated < oldest[1]:
+                    oldest = (offset, updated)
+            else:
+                offset = oldest[0]
+                tokens, updated = count, now
+
+            tokens, wait = _refill_and_take(tokens, updated, now, count, seconds)
+            self.SLOT.pack_into(self.table, offset, key_hash, tokens, now)
+        finally:
+            self._release()
+        return wait
+
+    def clear(self):
+        self._acquire()
+        try:
+            self.table[:] = bytes(len(self.table))
+        finally:
+            self._release()
+
+
+def _refill_and_take(tokens, updated, now, count, seconds):
+    rate = count / seconds
+    # max(): the wall clock of the shared backend can step back
+    tokens = min(count, tokens + max(now - updated, 0) * rate)
+    if tokens >= 1:
+        return tokens - 1, 0
+    return tokens, (1 - tokens) / rate
+
+
+def init_rate_limits(app):
+    global buckets
+
+    app.config.setdefault("RATE_LIMITS", parse_limits(os.environ.get("LMS_RATE_LIMITS", DEFAULT_LIMITS)))
+
+    backend = os.environ.get("LMS_RATE_LIMIT_BACKEND", "memory")
+    if backend == "memory":
+        buckets = MemoryBuckets(int(os.environ.get("LMS_RATE_LIMIT_KEYS", 100000)))
+    elif backend == "shared":
+        folder = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+        path = os.environ.get("LMS_RATE_LIMIT_FILE", os.path.join(folder, "lms-rate-limits"))
+        buckets = SharedBuckets(path, int(os.environ.get("LMS_RATE_LIMIT_KEYS", 65536)))
+    else:
+        raise ValueError("LMS_RATE_LIMIT_BACKEND must be one of memory, shared")
+
+    @app.before_request
+    def check_rate_limits():
+        limits = app.config["RATE_LIMITS"].get(request.endpoint)
+        if limits and request.method in COUNTED_METHODS:
+            enforce(request.endpoint, limits)
+
+    @app.errorhandler(429)
+    def too_many_requests(error):
+        # A standalone page: the usual layout looks up the current user in the database
+        headers = error.get_headers()
+        return render_template("too_many_requests.html", retry_after=getattr(error, "retry_after", None)), 429, headers
+
+
+def enforce(endpoint, limits):
+    """Take a token from each of the request's buckets for ``endpoint``, or raise ``TooManyRequests``."""
+    for key_type, count, seconds in limits:
+        if key_type == "ip":
+            value = request.remote_addr or "unknown"
+        else:
+            value = request.form.get("username", "").strip().lower()
+            if not value:
+                continue
+
+        wait = buckets.take(f"{endpoint}:{key_type}:{value}", count, seconds)
+        if wait:
+            metrics.record_rate_limited(endpoint, key_type)
+            raise TooManyRequests(retry_after=max(1, round(wait)))
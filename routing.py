@@ -0,0 +1,35 @@
+"""Views and CLI commands declared before the application exists.
+
+``create_app`` builds a new application each time it is called (one per worker
+process, or per test), so the views in app.py cannot be attached to a module
+level ``app``. They are recorded on a ``Routes`` registry instead and added to
+every application it builds. Unlike a blueprint, the registry keeps the plain
+endpoint names, so ``url_for('my_courses')`` keeps working in the views and
+templates.
+"""
+from flask.cli import AppGroup
+
+
+class Routes:
+    def __init__(self):
+        self.rules = []
+        # Commands run inside an application context, like the ones declared with app.cli.command
+        self.commands = AppGroup()
+
+    def route(self, rule, **options):
+        def decorator(f):
+            self.rules.append((rule, options, f))
+            return f
+
+        return decorator
+
+    def command(self, *args, **kwargs):
+        return self.commands.command(*args, **kwargs)
+
+    def init_app(self, app):
+        for rule, options, f in self.rules:
+            options = dict(options)
+            app.add_url_rule(rule, options.pop("endpoint", None), f, **options)
+
+        for command in self.commands.commands.values():
+            app.cli.add_command(command)
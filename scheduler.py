@@ -0,0 +1,134 @@
+"""Periodic tasks, such as the deadline scan of notifications.py.
+
+A task is registered with ``@periodic(name, seconds)`` and gets a row in
+``scheduled_task`` with the time it is next due. A scheduler claims a due task
+with one conditional ``UPDATE`` that moves its next run time forward, the way
+workers claim jobs, so several schedulers (one per machine, or one per web
+process) never run the same period of a task twice. The task is called with
+the start time of its last finished run, or None the first time, and the
+start time of this run, so it only has to look at what happened in between.
+A run that fails is retried when the task is next due, from the same start.
+
+Run a scheduler with ``flask --app app run-scheduler``, or every task once
+from cron with ``--once`` (due or not, since cron and the task interval drift
+apart), or set ``LMS_SCHEDULER=on`` to run one in a thread of each web
+process. Times are naive server-local, like assignment deadlines.
+"""
+import logging
+import os
+import socket
+import threading
+from datetime import datetime, timedelta
+
+from sqlalchemy import select, update, insert
+from sqlalchemy.exc import IntegrityError
+
+from models import db, ScheduledTask
+
+log = logging.getLogger(__name__)
+
+# name -> (function, interval in seconds)
+TASKS = {}
+POLL_INTERVAL = float(os.environ.get("LMS_SCHEDULER_POLL_INTERVAL", 10))
+
+
+def periodic(name, seconds):
+    """Run the decorated ``function(since, now)`` every ``seconds``."""
+    def decorator(f):
+        TASKS[name] = (f, seconds)
+        return f
+
+    return decorator
+
+
+def claim(name, seconds, scheduler_id, now, force=False):
+    """Take the task's current period if it is due (or ``force``); returns a row with its ``last_run_at``, or None."""
+    table = ScheduledTask.__table__
+    if db.session.execute(select(table.c.name).where(table.c.name == name)).first() is None:
+        try:
+            db.session.execute(insert(table).values(name=name, next_run_at=now))
+            db.session.commit()
+        except IntegrityError:
+            # Another scheduler created it first
+            db.session.rollback()
+
+    # The next_run_at check makes the update a no-op if another scheduler took this period first
+    due = table.c.name == name if force else (table.c.name == name) & (table.c.next_run_at <= now)
+    claimed = db.session.execute(
+        update(table)
+        .where(due)
+        .values(next_run_at=now + timedelta(seconds=seconds), locked_by=scheduler_id)
+        .returning(table.c.last_run_at)
+    ).first()
+    db.session.commit()
+    return claimed
+
+
+def run_task(name, scheduler_id, now=None, force=False):
+    """Run the task if it is due, or anyway with ``force``; returns True if it ran and finished."""
+    function, seconds = TASKS[name]
+    now = now or datetime.now()
+    claimed = claim(name, seconds, scheduler_id, now, force)
+    if claimed is None:
+        return False
+
+    try:
+        function(claimed.last_run_at, now)
+    except Exception:
+        db.session.rollback()
+        log.exception("Scheduled task %s failed", name)
+        return False
+
+    db.session.execute(update(ScheduledTask).where(ScheduledTask.name == name).values(last_run_at=now, locked_by=None))
+    db.session.commit()
+    return True
+
+
+def run_due_tasks(scheduler_id, force=False):
+    """Run every task that is due (every task with ``force``); returns the names of those that finished."""
+    return [name for name in sorted(TASKS) if run_task(name, scheduler_id, force=force)]
+
+
+def scheduler_id():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class Scheduler:
+    """Runs the due tasks every ``poll_interval`` seconds in a thread with its own app context."""
+
+    def __init__(self, app, poll_interval=POLL_INTERVAL):
+        self.app = app
+        self.poll_interval = poll_interval
+        self.stop = threading.Event()
+        self.thread = None
+
+    def _run(self):
+        with self.app.app_context():
+            while not self.stop.is_set():
+                try:
+                    run_due_tasks(scheduler_id())
+                except Exception:
+                    # A database hiccup must not end the thread
+                    db.session.rollback()
+                    log.exception("Scheduler pass failed")
+                self.stop.wait(self.poll_interval)
+            db.session.remove()
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, name="scheduler", daemon=True)
+        self.thread.start()
+
+    def join(self):
+        # Short timeouts keep the main thread responsive to Ctrl+C
+        while self.thread.is_alive():
+            self.thread.join(0.5)
+
+    def shutdown(self):
+        self.stop.set()
+        self.join()
+
+
+def init_scheduler(app):
+    if os.environ.get("LMS_SCHEDULER", "off").lower() in ("1", "true", "yes", "on"):
+        app.extensions["scheduler"] = Scheduler(app)
+        app.extensions["scheduler"].start()
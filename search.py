@@ -0,0 +1,279 @@
+"""Full-text search over course materials, assignments and submissions.
+
+The index is an SQLite FTS5 table with one row per searchable object. Its
+rowid encodes the object (``id * 4 + kind``), so mapper events can replace or
+remove a single entry in the same flush that changes the object, without
+ever rebuilding the index. Material entries include the text that the
+process_upload job extracted from the uploaded PDF; they are refreshed when
+that text becomes available.
+
+Every entry carries ``scope`` tokens: ``c<course>`` for materials and
+assignments, and ``s<course> u<student>`` for submissions. A search is
+restricted to what the caller may see by adding those tokens to the MATCH
+expression. FTS5 then intersects the posting lists itself, instead of ranking
+every match in the corpus and filtering afterwards:
+
+- students see their courses' materials and assignments, and their own
+  submissions;
+- instructors see everything in the courses they teach;
+- admins see everything.
+
+``flask --app app reindex-search`` rebuilds the index from scratch. Search
+needs SQLite; on other databases the index is not created and searches
+return nothing.
+"""
+import os
+import re
+from collections import namedtuple
+
+from flask import current_app, has_app_context
+from markupsafe import Markup, escape
+from sqlalchemy import DDL, event, select, text, inspect
+
+from models import db, Course, Enrollment, CourseMaterial, Assignments, Submission, StoredFile
+
+KINDS = {"material": 1, "assignment": 2, "submission": 3}
+KIND_NAMES = {code: name for name, code in KINDS.items()}
+# Extracted text beyond this is not indexed; enough for any lecture handout
+MAX_TEXT_BYTES = 2 * 1024 * 1024
+# A match in the title counts this many times more than one in the body
+TITLE_WEIGHT = 5.0
+TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+# Private-use characters mark the matches in snippets until they are turned into <mark> after escaping
+MATCH_START, MATCH_END = "\ue000", "\ue001"
+
+SearchResult = namedtuple("SearchResult", ["kind", "object_id", "course_id", "course_name", "owner_id", "title", "snippet"])
+
+# The prefix indexes serve the last word of a query, which is matched as a prefix
+create_index = DDL(
+    "CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5("
+    "title, body, scope, kind UNINDEXED, course_id UNINDEXED, owner_id UNINDEXED, "
+    "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+)
+# Runs after every create_all(), so new databases (and test databases) get the index too
+event.listen(db.metadata, "after_create", create_index.execute_if(dialect="sqlite"))
+
+
+def is_supported(connection):
+    return connection.dialect.name == "sqlite"
+
+
+def rowid(kind, object_id):
+    return object_id * 4 + KINDS[kind]
+
+
+def material_text(connection, material):
+    """The description of a material plus the text extracted from its file, if any."""
+    parts = [material.file_name or "", material.description or ""]
+
+    text_path = connection.execute(
+        select(StoredFile.text_path).where(StoredFile.sha256 == os.path.basename(material.file_path or ""))
+    ).scalar()
+    # Outside the app (scripts) the file cannot be located; the next reindex picks the text up
+    if text_path and has_app_context():
+        try:
+            with open(os.path.join(current_app.root_path, text_path), "rb") as f:
+                parts.append(f.read(MAX_TEXT_BYTES).decode("utf-8", errors="ignore"))
+        except FileNotFoundError:
+            pass
+
+    return "\n".join(parts)
+
+
+def entry_for_material(connection, material):
+    return {
+        "rowid": rowid("material", material.id),
+        "title": material.file_name or "",
+        "body": material_text(connection, material),
+        "scope": f"c{material.course_id}",
+        "kind": KINDS["material"],
+        "course_id": material.course_id,
+        "owner_id": None,
+    }
+
+
+def entry_for_assignment(assignment):
+    return {
+        "rowid": rowid("assignment", assignment.id),
+        "title": assignment.title or "",
+        "body": assignment.text or "",
+        "scope": f"c{assignment.course_id}",
+        "kind": KINDS["assignment"],
+        "course_id": assignment.course_id,
+        "owner_id": None,
+    }
+
+
+def entry_for_submission(submission, course_id, assignment_title):
+    return {
+        "rowid": rowid("submission", submission.id),
+        "title": assignment_title or "",
+        "body": submission.content or "",
+        "scope": f"s{course_id} u{submission.student_id}",
+        "kind": KINDS["submission"],
+        "course_id": course_id,
+        "owner_id": submission.student_id,
+    }
+
+
+INSERT_ENTRY = text(
+    "INSERT INTO search_index (rowid, title, body, scope, kind, course_id, owner_id) "
+    "VALUES (:rowid, :title, :body, :scope, :kind, :course_id, :owner_id)"
+)
+DELETE_ENTRY = text("DELETE FROM search_index WHERE rowid = :rowid")
+
+
+def replace_entries(connection, entries):
+    if entries:
+        connection.execute(DELETE_ENTRY, [{"rowid": entry["rowid"]} for entry in entries])
+        connection.execute(INSERT_ENTRY, entries)
+
+
+def _changed(target, *attributes):
+    state = inspect(target)
+    return any(state.attrs[attribute].history.has_changes() for attribute in attributes)
+
+
+@event.listens_for(CourseMaterial, "after_insert")
+@event.listens_for(CourseMaterial, "after_update")
+def material_changed(mapper, connection, target):
+    if is_supported(connection) and _changed(target, "file_name", "file_path", "description", "course_id"):
+        replace_entries(connection, [entry_for_material(connection, target)])
+
+
+@event.listens_for(Assignments, "after_insert")
+@event.listens_for(Assignments, "after_update")
+def assignment_changed(mapper, connection, target):
+    if not is_supported(connection) or not _changed(target, "title", "text", "course_id"):
+        return
+
+    replace_entries(connection, [entry_for_assignment(target)])
+    if inspect(target).attrs.title.history.deleted:
+        # Submission entries are titled after their assignment
+        connection.execute(text(
+            "UPDATE search_index SET title = :title "
+            "WHERE rowid IN (SELECT id * 4 + :kind FROM submission WHERE assignment_id = :assignment_id)"
+        ), {"title": target.title, "kind": KINDS["submission"], "assignment_id": target.id})
+
+
+@event.listens_for(Submission, "after_insert")
+@event.listens_for(Submission, "after_update")
+def submission_changed(mapper, connection, target):
+    # Grading only flips is_graded; the indexed text is unchanged
+    if not is_supported(connection) or not _changed(target, "content", "assignment_id", "student_id"):
+        return
+
+    course_id, title = connection.execute(
+        select(Assignments.course_id, Assignments.title).where(Assignments.id == target.assignment_id)
+    ).one()
+    replace_entries(connection, [entry_for_submission(target, course_id, title)])
+
+
+@event.listens_for(CourseMaterial, "after_delete")
+@event.listens_for(Assignments, "after_delete")
+@event.listens_for(Submission, "after_delete")
+def object_deleted(mapper, connection, target):
+    if is_supported(connection):
+        kind = {CourseMaterial: "material", Assignments: "assignment", Submission: "submission"}[mapper.class_]
+        connection.execute(DELETE_ENTRY, {"rowid": rowid(kind, target.id)})
+
+
+@event.listens_for(StoredFile, "after_update")
+def stored_file_processed(mapper, connection, target):
+    # The process_upload job extracted the text of a file some materials point to
+    if is_supported(connection) and _changed(target, "text_path"):
+        materials = connection.execute(select(CourseMaterial).where(CourseMaterial.file_path == target.path)).all()
+        replace_entries(connection, [entry_for_material(connection, material) for material in materials])
+
+
+def reindex(connection, batch_size=1000):
+    """Rebuild the whole index from the source tables and return the number of entries."""
+    if not is_supported(connection):
+        return 0
+
+    connection.execute(create_index)
+    connection.execute(text("DELETE FROM search_index"))
+
+    # Assignments and submissions are copied with set-based statements
+    connection.execute(text(
+        "INSERT INTO search_index (rowid, title, body, scope, kind, course_id, owner_id) "
+        "SELECT id * 4 + :kind, title, text, 'c' || course_id, :kind, course_id, NULL FROM assignments"
+    ), {"kind": KINDS["assignment"]})
+    connection.execute(text(
+        "INSERT INTO search_index (rowid, title, body, scope, kind, course_id, owner_id) "
+        "SELECT s.id * 4 + :kind, a.title, COALESCE(s.content, ''), 's' || a.course_id || ' u' || s.student_id, "
+        "       :kind, a.course_id, s.student_id "
+        "FROM submission s JOIN assignments a ON a.id = s.assignment_id"
+    ), {"kind": KINDS["submission"]})
+
+    # Materials need their extracted text from disk
+    batch = []
+    for material in connection.execute(select(CourseMaterial)):
+        batch.append(entry_for_material(connection, material))
+        if len(batch) == batch_size:
+            connection.execute(INSERT_ENTRY, batch)
+            batch = []
+    if batch:
+        connection.execute(INSERT_ENTRY, batch)
+
+    connection.execute(text("INSERT INTO search_index (search_index) VALUES ('optimize')"))
+    return connection.execute(text("SELECT COUNT(*) FROM search_index")).scalar()
+
+
+def match_expression(query):
+    """Turn free text into a safe FTS5 expression: every word must match, the last one as a prefix."""
+    words = TOKEN_PATTERN.findall(query)
+    if not words:
+        return None
+
+    terms = [f'"{word}"' for word in words]
+    terms[-1] += "*"
+    return "{title body} : (" + " ".join(terms) + ")"
+
+
+def scope_tokens(user):
+    """The scope tokens a user may search, or None for no restriction."""
+    if user.status == "admin":
+        return None
+
+    if user.status == "instr":
+        course_ids = db.session.execute(select(Course.id).where(Course.instructor_id == user.id)).scalars()
+        return [token for course_id in course_ids for token in (f"c{course_id}", f"s{course_id}")]
+
+    course_ids = db.session.execute(select(Enrollment.course_id).where(Enrollment.student_id == user.id)).scalars()
+    return [f"c{course_id}" for course_id in course_ids] + [f"u{user.id}"]
+
+
+def run_query(connection, expression, scope=None, limit=20):
+    """Run an FTS5 expression limited to ``scope`` tokens and return the best ``limit`` matches."""
+    if scope is not None:
+        if not scope:
+            return []
+        expression = f"({expression}) AND scope : ({' OR '.join(scope)})"
+
+    rows = connection.execute(text(
+        "SELECT s.kind, s.rowid / 4, s.course_id, c.name, s.owner_id, s.title, "
+        "       snippet(search_index, 1, :start, :end, '…', 16) "
+        "FROM search_index s LEFT JOIN course c ON c.id = s.course_id "
+        "WHERE search_index MATCH :expression "
+        "ORDER BY bm25(search_index, :title_weight, 1.0, 0.0) LIMIT :limit"
+    ), {"expression": expression, "start": MATCH_START, "end": MATCH_END, "title_weight": TITLE_WEIGHT, "limit": limit})
+
+    return [
+        SearchResult(KIND_NAMES[kind], object_id, course_id, course_name, owner_id, title, highlight(snippet))
+        for kind, object_id, course_id, course_name, owner_id, title, snippet in rows
+    ]
+
+
+def highlight(snippet):
+    return Markup(str(escape(snippet)).replace(MATCH_START, "<mark>").replace(MATCH_END, "</mark>"))
+
+
+def search(user, query, limit=20):
+    """Search what ``user`` is allowed to see for the words in ``query``."""
+    connection = db.session.connection()
+    expression = match_expression(query)
+    if expression is None or not is_supported(connection):
+        return []
+
+    return run_query(connection, expression, scope_tokens(user), limit)
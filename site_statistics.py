@@ -0,0 +1,228 @@
+"""Incrementally maintained figures for the admin statistics page.
+
+Mapper events adjust ``course_statistics`` inside the same flush that inserts,
+updates or deletes a user, course, enrollment, submission or grade, so the
+dashboard reads a handful of rows instead of counting tables. Every writer
+changes the same few ``site_counter`` rows, so their deltas are added up in
+``session.info`` instead and written just before the transaction commits, one
+``UPDATE`` per counter, in name order; the rows stay locked only for the
+commit itself. Writes that bypass the ORM unit of work (bulk inserts) must
+call ``bump`` themselves, and ``reconcile`` rebuilds everything from the
+source tables.
+"""
+from sqlalchemy import event, select, update, delete, insert, func
+from sqlalchemy.orm import Session, object_session
+
+from model_events import old_value, course_of_submission
+from models import db, User, Course, Enrollment, Assignments, Submission, Grade, SiteCounter, CourseStatistics
+
+site_counter = SiteCounter.__table__
+course_statistics = CourseStatistics.__table__
+
+DELTAS_KEY = "site_counter_deltas"
+
+
+def user_counter(status):
+    return f"users_{status}"
+
+
+def bump(connection, name, delta):
+    """Add ``delta`` to a site counter, creating it if needed."""
+    if not delta:
+        return
+
+    result = connection.execute(
+        update(site_counter).where(site_counter.c.name == name).values(value=site_counter.c.value + delta)
+    )
+    if result.rowcount == 0:
+        connection.execute(insert(site_counter).values(name=name, value=delta))
+
+
+def bump_on_commit(connection, target, name, delta):
+    """Add ``delta`` to a site counter when the session of ``target`` commits."""
+    session = object_session(target)
+    if session is None:
+        bump(connection, name, delta)
+    elif delta:
+        deltas = session.info.setdefault(DELTAS_KEY, {})
+        deltas[name] = deltas.get(name, 0) + delta
+
+
+@event.listens_for(Session, "before_commit")
+def write_counters(session):
+    # Commit flushes after this hook; flush first so its deltas are included
+    session.flush()
+    deltas = session.info.pop(DELTAS_KEY, None)
+    if deltas:
+        connection = session.connection()
+        for name, delta in sorted(deltas.items()):
+            bump(connection, name, delta)
+
+
+@event.listens_for(Session, "after_rollback")
+def drop_counters(session):
+    session.info.pop(DELTAS_KEY, None)
+
+
+def bump_course(connection, course_id, **deltas):
+    """Add the given deltas to a course's statistics row."""
+    values = {column: course_statistics.c[column] + delta for column, delta in deltas.items() if delta}
+    if course_id is None or not values:
+        return
+
+    connection.execute(update(course_statistics).where(course_statistics.c.course_id == course_id).values(**values))
+
+
+@event.listens_for(User, "after_insert")
+def user_inserted(mapper, connection, target):
+    bump_on_commit(connection, target, user_counter(target.status), 1)
+
+
+@event.listens_for(User, "after_delete")
+def user_deleted(mapper, connection, target):
+    bump_on_commit(connection, target, user_counter(old_value(target, "status")), -1)
+
+
+@event.listens_for(User, "after_update")
+def user_updated(mapper, connection, target):
+    old_status = old_value(target, "status")
+    if old_status != target.status:
+        bump_on_commit(connection, target, user_counter(old_status), -1)
+        bump_on_commit(connection, target, user_counter(target.status), 1)
+
+
+@event.listens_for(Course, "after_insert")
+def course_inserted(mapper, connection, target):
+    bump_on_commit(connection, target, "courses", 1)
+    connection.execute(insert(course_statistics).values(course_id=target.id))
+
+
+@event.listens_for(Course, "before_delete")
+def course_deleted(mapper, connection, target):
+    bump_on_commit(connection, target, "courses", -1)
+    connection.execute(delete(course_statistics).where(course_statistics.c.course_id == target.id))
+
+
+@event.listens_for(Enrollment, "after_insert")
+def enrollment_inserted(mapper, connection, target):
+    bump_on_commit(connection, target, "enrollments", 1)
+    bump_course(connection, target.course_id, enrollments=1)
+
+
+@event.listens_for(Enrollment, "after_delete")
+def enrollment_deleted(mapper, connection, target):
+    bump_on_commit(connection, target, "enrollments", -1)
+    bump_course(connection, target.course_id, enrollments=-1)
+
+
+@event.listens_for(Submission, "after_insert")
+def submission_inserted(mapper, connection, target):
+    ungraded = 0 if target.is_graded else 1
+    bump_on_commit(connection, target, "submissions", 1)
+    bump_on_commit(connection, target, "ungraded_submissions", ungraded)
+    bump_course(connection, course_of_submission(connection, target), submissions=1, ungraded_submissions=ungraded)
+
+
+@event.listens_for(Submission, "after_delete")
+def submission_deleted(mapper, connection, target):
+    ungraded = 0 if old_value(target, "is_graded") else -1
+    bump_on_commit(connection, target, "submissions", -1)
+    bump_on_commit(connection, target, "ungraded_submissions", ungraded)
+    bump_course(connection, course_of_submission(connection, target), submissions=-1, ungraded_submissions=ungraded)
+
+
+@event.listens_for(Submission, "after_update")
+def submission_updated(mapper, connection, target):
+    was_graded = bool(old_value(target, "is_graded"))
+    if was_graded == bool(target.is_graded):
+        return
+
+    delta = -1 if target.is_graded else 1
+    bump_on_commit(connection, target, "ungraded_submissions", delta)
+    bump_course(connection, course_of_submission(connection, target), ungraded_submissions=delta)
+
+
+@event.listens_for(Grade, "after_insert")
+def grade_inserted(mapper, connection, target):
+    bump_on_commit(connection, target, "grades", 1)
+    bump_course(connection, target.course_id, grade_count=1, grade_sum=target.grade)
+
+
+@event.listens_for(Grade, "after_delete")
+def grade_deleted(mapper, connection, target):
+    bump_on_commit(connection, target, "grades", -1)
+    bump_course(connection, target.course_id, grade_count=-1, grade_sum=-old_value(target, "grade"))
+
+
+@event.listens_for(Grade, "after_update")
+def grade_updated(mapper, connection, target):
+    bump_course(connection, target.course_id, grade_sum=target.grade - old_value(target, "grade"))
+
+
+def reconcile(connection):
+    """Rebuild every counter and course statistics row from the source tables."""
+    connection.execute(delete(site_counter))
+    connection.execute(delete(course_statistics))
+
+    counters = [
+        (user_counter(status), count)
+        for status, count in connection.execute(select(User.status, func.count()).group_by(User.status))
+    ]
+    for name, model in (("courses", Course), ("enrollments", Enrollment), ("submissions", Submission), ("grades", Grade)):
+        counters.append((name, connection.execute(select(func.count()).select_from(model)).scalar()))
+    counters.append((
+        "ungraded_submissions",
+        connection.execute(select(func.count()).select_from(Submission).where(Submission.is_graded == False)).scalar()
+    ))
+    connection.execute(insert(site_counter), [{"name": name, "value": value} for name, value in counters])
+
+    enrollments = select(func.count()).where(Enrollment.course_id == Course.id)
+    submissions = select(func.count()).select_from(Submission).join(Assignments).where(Assignments.course_id == Course.id)
+    ungraded_submissions = submissions.where(Submission.is_graded == False)
+    grade_count = select(func.count()).where(Grade.course_id == Course.id)
+    grade_sum = select(func.coalesce(func.sum(Grade.grade), 0)).where(Grade.course_id == Course.id)
+
+    connection.execute(insert(course_statistics).from_select(
+        ["course_id", "enrollments", "submissions", "ungraded_submissions", "grade_count", "grade_sum"],
+        select(
+            Course.id,
+            enrollments.scalar_subquery(),
+            submissions.scalar_subquery(),
+            ungraded_submissions.scalar_subquery(),
+            grade_count.scalar_subquery(),
+            grade_sum.scalar_subquery(),
+        )
+    ))
+
+
+def load_dashboard():
+    """Return the site totals and per-course figures shown on statistics.html."""
+    counters = dict(db.session.execute(select(SiteCounter.name, SiteCounter.value)).all())
+
+    per_course = db.session.execute(
+        select(Course.name, CourseStatistics)
+        .join(CourseStatistics, CourseStatistics.course_id == Course.id)
+        .order_by(CourseStatistics.ungraded_submissions.desc(), Course.name)
+    ).all()
+
+    courses = [
+        {
+            "name": name,
+            "enrollments": row.enrollments,
+            "submissions": row.submissions,
+            "ungraded_submissions": row.ungraded_submissions,
+            "average_grade": round(row.grade_sum / row.grade_count, 2) if row.grade_count else None,
+        }
+        for name, row in per_course
+    ]
+
+    return {
+        "students": counters.get(user_counter("student"), 0),
+        "instructors": counters.get(user_counter("instr"), 0),
+        "courses": counters.get("courses", 0),
+        "enrollments": counters.get("enrollments", 0),
+        "submissions": counters.get("submissions", 0),
+        "ungraded_submissions": counters.get("ungraded_submissions", 0),
+        "grades": counters.get("grades", 0),
+        "per_course": courses,
+    }
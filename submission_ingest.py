@@ -0,0 +1,392 @@
+"""Ingestion of assignment submissions, built for the rush before a deadline.
+
+Committing every submission in its own transaction makes hundreds of
+requests queue for SQLite's single write lock in the last minutes before a
+deadline. Instead, ``solve_assignment`` takes the arrival time, stores any
+file, and stages the submission: a small JSON record written and fsynced into
+the staging folder (``<store>/staging``). This is the write-ahead log. Once a
+submission is staged it survives a crash, even if it never reached the
+database. A committer thread in each process writes the submissions its
+process staged in batches, one transaction per batch, and then wakes the
+requests waiting for them. Records left behind by a process that died are
+picked up by any committer once they are ``ORPHAN_AGE`` seconds old. While one batch commits, the next one piles
+up, so the busier it gets the fewer transactions are needed per submission.
+A record that still cannot be committed after ``MAX_ATTEMPTS`` tries is moved
+to ``staging/failed`` and logged, for an administrator to look at.
+
+A student has one current submission per assignment. Submitting again
+replaces an ungraded submission (upsert on the ``(assignment, student)``
+unique index), and a graded one cannot be replaced. ``is_late`` compares the
+arrival time with the deadline, so time spent in the staging folder never
+makes work late.
+
+The committer thread is started by the first request a process serves, so
+CLI commands and scripts that build the application never run one.
+``LMS_SUBMISSION_GROUP_COMMIT=off`` commits each submission in its request.
+"""
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import select, tuple_
+from sqlalchemy.exc import IntegrityError
+
+from models import db, Assignments, Submission
+from uploads import StoredUpload, record_upload
+
+log = logging.getLogger(__name__)
+
+BATCH_SIZE = int(os.environ.get("LMS_SUBMISSION_BATCH_SIZE", 200))
+# How long a request waits for its batch to commit before answering anyway
+COMMIT_WAIT = float(os.environ.get("LMS_SUBMISSION_COMMIT_WAIT", 10))
+POLL_INTERVAL = 1.0
+# Claimed records of a committer that died are staged again after this many seconds
+CLAIM_TIMEOUT = 120
+# Records staged by another process are left to its committer, which is waiting for them, unless they are this old
+ORPHAN_AGE = 30
+# Committed records are moved aside and only deleted, this many per poll, once nothing was committed for
+# QUIET_PERIOD seconds: unlinking while requests fsync the staging folder is slow, renaming is not
+PURGE_LIMIT = 50
+QUIET_PERIOD = 5
+# Failed commits of a record before it is set aside in staging/failed
+MAX_ATTEMPTS = int(os.environ.get("LMS_SUBMISSION_MAX_ATTEMPTS", 5))
+
+
+def now():
+    """Server-side timestamp of a submission, in the same naive local time as the deadlines."""
+    return datetime.now()
+
+
+def new_record(assignment_id, student_id, content, file_name, stored_upload, submitted_at):
+    return {
+        "id": uuid.uuid4().hex,
+        "assignment_id": assignment_id,
+        "student_id": student_id,
+        "content": content,
+        "file_name": file_name,
+        "file": list(stored_upload) if stored_upload else None,
+        "submitted_at": submitted_at.isoformat(),
+    }
+
+
+def staging_folder():
+    return os.path.join(current_app.root_path, current_app.config["UPLOAD_STORE_FOLDER"], "staging")
+
+
+def _fsync_directory(path):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _owner_tag():
+    return f".p{os.getpid()}."
+
+
+def _write_record(path, record):
+    folder, name = os.path.split(path)
+    temp_path = os.path.join(folder, f".{name}.tmp")
+    with open(temp_path, "w") as f:
+        json.dump(record, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, path)
+    _fsync_directory(folder)
+
+
+def stage(record):
+    """Durably write a submission record into the staging folder."""
+    folder = staging_folder()
+    os.makedirs(os.path.join(folder, "claimed"), exist_ok=True)
+    os.makedirs(os.path.join(folder, "committed"), exist_ok=True)
+
+    # Names sort by arrival, so batches are applied in the order submissions came in
+    name = f"{record['submitted_at'].replace(':', '')}{_owner_tag()}{record['id']}.json"
+    _write_record(os.path.join(folder, name), record)
+
+
+def claim_batch(limit):
+    """Move up to ``limit`` staged records into ``claimed/`` and return their paths."""
+    folder = staging_folder()
+    try:
+        names = sorted(name for name in os.listdir(folder) if name.endswith(".json"))
+    except FileNotFoundError:
+        return []
+
+    own = _owner_tag()
+    orphaned_before = time.time() - ORPHAN_AGE
+    claimed = []
+    for name in names:
+        if len(claimed) >= limit:
+            break
+        target = os.path.join(folder, "claimed", name)
+        try:
+            if own not in name and os.stat(os.path.join(folder, name)).st_mtime >= orphaned_before:
+                continue
+            # Atomic, so a record is claimed by one committer even with several processes
+            os.rename(os.path.join(folder, name), target)
+        except FileNotFoundError:
+            continue
+        os.utime(target)
+        claimed.append(target)
+    return claimed
+
+
+def requeue_stale_claims():
+    folder = staging_folder()
+    claimed_folder = os.path.join(folder, "claimed")
+    try:
+        names = os.listdir(claimed_folder)
+    except FileNotFoundError:
+        return
+
+    cutoff = time.time() - CLAIM_TIMEOUT
+    for name in names:
+        if not name.endswith(".json"):
+            continue
+        path = os.path.join(claimed_folder, name)
+        try:
+            if os.stat(path).st_mtime < cutoff:
+                os.rename(path, os.path.join(folder, name))
+        except FileNotFoundError:
+            continue
+
+
+def purge_committed(limit=PURGE_LIMIT):
+    """Delete up to ``limit`` records that are already in the database."""
+    folder = os.path.join(staging_folder(), "committed")
+    try:
+        names = os.listdir(folder)
+    except FileNotFoundError:
+        return
+
+    for name in names[:limit]:
+        try:
+            os.unlink(os.path.join(folder, name))
+        except FileNotFoundError:
+            continue
+
+
+def apply_batch(records):
+    """Upsert a batch of submission records in one transaction and return ``{record id: outcome}``.
+
+    Outcomes are ``created``, ``updated``, ``late`` or ``replaced_late`` for
+    stored submissions, and ``graded``, ``superseded`` or ``missing`` for
+    records that were dropped.
+    """
+    for attempt in range(2):
+        try:
+            results = _upsert(records)
+            db.session.commit()
+            return results
+        except IntegrityError:
+            # A committer in another process inserted one of these pairs first; the retry updates it
+            db.session.rollback()
+            if attempt:
+                raise
+
+
+def _upsert(records):
+    records = sorted(records, key=lambda record: record["submitted_at"])
+    deadlines = dict(db.session.execute(
+        select(Assignments.id, Assignments.deadline)
+        .where(Assignments.id.in_({record["assignment_id"] for record in records}))
+    ).all())
+    pairs = {(record["assignment_id"], record["student_id"]) for record in records}
+    current = {
+        (submission.assignment_id, submission.student_id): submission
+        for submission in db.session.execute(
+            select(Submission).where(tuple_(Submission.assignment_id, Submission.student_id).in_(pairs))
+        ).scalars()
+    }
+
+    results = {}
+    for record in records:
+        pair = (record["assignment_id"], record["student_id"])
+        submitted_at = datetime.fromisoformat(record["submitted_at"])
+        deadline = deadlines.get(record["assignment_id"])
+        submission = current.get(pair)
+
+        if deadline is None:
+            results[record["id"]] = "missing"
+            continue
+        if submission is not None and submission.is_graded:
+            results[record["id"]] = "graded"
+            continue
+        if submission is not None and submission.submitted_at and submission.submitted_at > submitted_at:
+            # A newer submission was already stored; replaying an older record must not undo it
+            results[record["id"]] = "superseded"
+            continue
+
+        if record["file"]:
+            record_upload(StoredUpload(*record["file"]))
+
+        created = submission is None
+        if created:
+            submission = Submission(assignment_id=record["assignment_id"], student_id=record["student_id"])
+            db.session.add(submission)
+            current[pair] = submission
+
+        submission.content = record["content"]
+        submission.file_name = record["file_name"]
+        submission.file_path = record["file"][2] if record["file"] else None
+        submission.submitted_at = submitted_at
+        submission.is_late = submitted_at > deadline
+        if created:
+            results[record["id"]] = "late" if submission.is_late else "created"
+        else:
+            results[record["id"]] = "replaced_late" if submission.is_late else "updated"
+
+    return results
+
+
+class GroupCommitter:
+    """Background thread that commits staged submissions in batches and wakes the requests waiting for them."""
+
+    def __init__(self, app, batch_size=BATCH_SIZE):
+        self.app = app
+        self.batch_size = batch_size
+        self.wake = threading.Event()
+        self.stop = threading.Event()
+        self.thread = None
+        self._waiters = {}
+        self._lock = threading.Lock()
+
+    def start(self):
+        if self.thread is not None:
+            return
+        with self._lock:
+            if self.thread is not None:
+                return
+            self.thread = threading.Thread(target=self._run, name="submission-committer", daemon=True)
+            self.thread.start()
+
+    def shutdown(self):
+        self.stop.set()
+        self.wake.set()
+        if self.thread is not None:
+            self.thread.join()
+
+    def submit(self, record, timeout=COMMIT_WAIT):
+        """Stage a record and wait for its outcome; None if it is not committed within ``timeout`` seconds.
+
+        Ends the session's transaction first, so the request does not hold a
+        pooled connection that the committer may need while it waits.
+        """
+        db.session.commit()
+        done = threading.Event()
+        with self._lock:
+            self._waiters[record["id"]] = [done, None]
+
+        try:
+            stage(record)
+            self.wake.set()
+            done.wait(timeout)
+        finally:
+            with self._lock:
+                _, result = self._waiters.pop(record["id"])
+        return result
+
+    def _run(self):
+        with self.app.app_context():
+            next_requeue = 0.0
+            last_commit = 0.0
+            while not self.stop.is_set():
+                # Polling also picks up records staged by processes whose committer died
+                self.wake.wait(POLL_INTERVAL)
+                self.wake.clear()
+
+                if time.monotonic() >= next_requeue:
+                    requeue_stale_claims()
+                    next_requeue = time.monotonic() + CLAIM_TIMEOUT / 2
+
+                while self.commit_pending():
+                    last_commit = time.monotonic()
+                if time.monotonic() - last_commit >= QUIET_PERIOD:
+                    purge_committed()
+            db.session.remove()
+
+    def commit_pending(self):
+        """Commit one batch of staged records; return whether there was anything to commit."""
+        paths = claim_batch(self.batch_size)
+        if not paths:
+            return False
+
+        records = {}
+        for path in paths:
+            with open(path) as f:
+                records[path] = json.load(f)
+
+        try:
+            results = apply_batch(list(records.values()))
+        except Exception:
+            db.session.rollback()
+            log.exception("Committing %d staged submissions failed, retrying them one by one", len(records))
+            results = self._apply_one_by_one(records)
+
+        with self._lock:
+            for record_id, result in results.items():
+                waiter = self._waiters.get(record_id)
+                if waiter is not None:
+                    waiter[1] = result
+                    waiter[0].set()
+
+        # A record replayed after a crash between the commit and here is applied again unchanged
+        committed_folder = os.path.join(staging_folder(), "committed")
+        for path in paths:
+            if records[path]["id"] in results:
+                os.rename(path, os.path.join(committed_folder, os.path.basename(path)))
+        return True
+
+    def _apply_one_by_one(self, records):
+        results = {}
+        for path, record in records.items():
+            try:
+                results.update(apply_batch([record]))
+            except Exception:
+                db.session.rollback()
+                log.exception("Staged submission %s could not be committed", path)
+                record_failure(path, record)
+        return results
+
+
+def record_failure(path, record):
+    """Count a failed commit of a claimed record; after ``MAX_ATTEMPTS`` move it to ``failed/``.
+
+    The file is the only copy of the submission, so it is never deleted.
+    Below the limit it stays in ``claimed/`` and is staged again after
+    ``CLAIM_TIMEOUT``.
+    """
+    record["attempts"] = record.get("attempts", 0) + 1
+    _write_record(path, record)
+    if record["attempts"] >= MAX_ATTEMPTS:
+        failed_folder = os.path.join(staging_folder(), "failed")
+        os.makedirs(failed_folder, exist_ok=True)
+        failed_path = os.path.join(failed_folder, os.path.basename(path))
+        os.rename(path, failed_path)
+        log.error("Staged submission %s failed %d times and was moved to %s", path, record["attempts"], failed_path)
+
+
+def init_submission_ingest(app):
+    if os.environ.get("LMS_SUBMISSION_GROUP_COMMIT", "on").lower() in ("0", "false", "no", "off"):
+        return
+
+    committer = GroupCommitter(app)
+    app.extensions["submission_committer"] = committer
+    # Only a process that serves requests needs the thread; start() does nothing once it runs
+    app.before_request(committer.start)
+
+
+def submit(record):
+    """Store a submission record and return its outcome (see ``apply_batch``), or None if it is still queued."""
+    committer = current_app.extensions.get("submission_committer")
+    if committer is None:
+        return apply_batch([record])[record["id"]]
+    return committer.submit(record)
@@ -0,0 +1,95 @@
+"""Fixtures shared by the tests: a fresh application and database per test."""
+import itertools
+import os
+import sys
+from datetime import datetime, timedelta
+
+import pytest
+from flask.testing import FlaskClient
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+class Client(FlaskClient):
+    """Runs each request in an application context of its own, as a server does.
+
+    Otherwise requests reuse the test's context, and with it ``g`` (the
+    logged-in user) and the database session.
+    """
+
+    def open(self, *args, **kwargs):
+        with self.application.app_context():
+            return super().open(*args, **kwargs)
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    monkeypatch.setenv("LMS_DATABASE_URL", f"sqlite:///{tmp_path / 'test.db'}")
+    monkeypatch.setenv("LMS_JOB_WORKERS", "0")
+    monkeypatch.setenv("LMS_SUBMISSION_GROUP_COMMIT", "off")
+    monkeypatch.setenv("LMS_RATE_LIMIT_FILE", str(tmp_path / "rate-limits"))
+    monkeypatch.setenv("LMS_ASSET_CACHE_DIR", str(tmp_path / "assets"))
+    monkeypatch.setenv("LMS_TEMPLATE_CACHE_DIR", str(tmp_path / "jinja-cache"))
+    monkeypatch.setenv("LMS_PRECOMPILE_TEMPLATES", "off")
+    from app import create_app
+
+    app = create_app({
+        "TESTING": True,
+        "WTF_CSRF_ENABLED": False,
+        "RATE_LIMITS": {},
+        "UPLOAD_STORE_FOLDER": str(tmp_path / "store"),
+    })
+    app.test_client_class = Client
+    with app.app_context():
+        yield app
+
+
+@pytest.fixture
+def make_user(app):
+    from models import db, User, UserAccount
+    from passwords import hash_password
+
+    numbers = itertools.count(1)
+
+    def make_user(name, status="student", password="secret"):
+        number = next(numbers)
+        user = User(name=name, age=20, phone_number=f"07{number:08d}", email=f"user{number}@example.com", status=status)
+        user.account = UserAccount(username=name.lower().replace(" ", "."), password=hash_password(password))
+        db.session.add(user)
+        db.session.commit()
+        return user
+
+    return make_user
+
+
+@pytest.fixture
+def make_course(app):
+    from models import db, Course, Assignments, CourseMaterial, Enrollment
+
+    def make_course(name, instructor, students=(), assignments=1, deadline=None):
+        course = Course(name=name, instructor_id=instructor.id)
+        db.session.add(course)
+        db.session.flush()
+        for number in range(assignments):
+            db.session.add(Assignments(
+                course_id=course.id, title=f"{name} {number}", text="Solve it", assignment_type=1,
+                deadline=deadline or datetime.now() + timedelta(days=7 + number),
+            ))
+        db.session.add(CourseMaterial(course_id=course.id, file_name="notes.pdf", file_path="notes.pdf"))
+        for student in students:
+            db.session.add(Enrollment(course_id=course.id, student_id=student.id))
+        db.session.commit()
+        return course
+
+    return make_course
+
+
+@pytest.fixture
+def log_in(app):
+    def log_in(user, password="secret"):
+        client = app.test_client()
+        client.post("/login", data={"username": user.account.username, "password": password})
+        return client
+
+    return log_in
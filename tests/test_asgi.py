@@ -0,0 +1,71 @@
+import asyncio
+
+import pytest
+
+
+class RecordingApp:
+    config = {"MAX_CONTENT_LENGTH": None}
+
+    def __init__(self):
+        self.environs = []
+
+    def __call__(self, environ, start_response):
+        self.environs.append(environ)
+        start_response("200 OK", [("Content-Type", "text/plain")])
+        return [environ["wsgi.input"].read()]
+
+
+def scope(query_string=b""):
+    return {
+        "type": "http", "http_version": "1.1", "method": "POST", "scheme": "http", "path": "/grade_submission/1",
+        "query_string": query_string, "headers": [(b"content-type", b"application/x-www-form-urlencoded")],
+    }
+
+
+def call(adapter, scope, messages):
+    sent = []
+    messages = iter(messages)
+
+    async def receive():
+        return next(messages)
+
+    async def send(message):
+        sent.append(message)
+
+    asyncio.run(adapter(scope, receive, send))
+    return sent
+
+
+@pytest.fixture
+def adapter(app):
+    from asgi import WsgiAdapter
+
+    adapter = WsgiAdapter(RecordingApp(), threads=1)
+    yield adapter
+    adapter.executor.shutdown()
+
+
+def test_disconnect_before_the_end_of_the_body_skips_the_view(adapter):
+    sent = call(adapter, scope(), [
+        {"type": "http.request", "body": b"grade=1", "more_body": True},
+        {"type": "http.disconnect"},
+    ])
+
+    assert adapter.wsgi_app.environs == []
+    assert sent == []
+
+
+def test_complete_body_reaches_the_view(adapter):
+    sent = call(adapter, scope(), [
+        {"type": "http.request", "body": b"grade=", "more_body": True},
+        {"type": "http.request", "body": b"10"},
+    ])
+
+    assert sent[0]["status"] == 200
+    assert b"".join(message.get("body", b"") for message in sent[1:]) == b"grade=10"
+
+
+def test_non_ascii_query_string_is_passed_as_latin_1(adapter):
+    call(adapter, scope(b"q=J\xc3\xb6rg"), [{"type": "http.request", "body": b""}])
+
+    assert adapter.wsgi_app.environs[0]["QUERY_STRING"].encode("latin-1") == b"q=J\xc3\xb6rg"
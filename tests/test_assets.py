@@ -0,0 +1,58 @@
+import gzip
+import os
+
+from flask import url_for
+
+import assets
+
+STYLE = os.path.join(os.path.dirname(__file__), os.pardir, "static", "css", "style.css")
+
+
+def style_url(app):
+    with app.test_request_context():
+        return url_for("static", filename="css/style.css")
+
+
+def test_fingerprinted_url_is_immutable(app):
+    url = style_url(app)
+    fingerprint = assets.file_digest(STYLE)[:assets.FINGERPRINT_LENGTH]
+    assert url == f"/static/css/style.{fingerprint}.css"
+
+    response = app.test_client().get(url, headers={"Accept-Encoding": "identity"})
+
+    assert response.status_code == 200
+    assert response.cache_control.max_age == assets.ONE_YEAR
+    assert response.cache_control.immutable
+    with open(STYLE, "rb") as f:
+        assert response.data == f.read()
+
+
+def test_stale_fingerprint_is_revalidated(app):
+    client = app.test_client()
+
+    response = client.get("/static/css/style.000000000000.css", headers={"Accept-Encoding": "gzip"})
+
+    assert response.status_code == 200
+    assert response.cache_control.no_cache
+    assert not response.cache_control.immutable
+    assert response.cache_control.max_age is None
+    assert "Content-Encoding" not in response.headers
+    assert client.get("/static/css/style.000000000000.css", headers={"If-None-Match": response.headers["ETag"]}).status_code == 304
+    assert client.get("/static/css/missing.000000000000.css").status_code == 404
+
+
+def test_compressed_only_when_accepted(app):
+    url = style_url(app)
+    client = app.test_client()
+    with open(STYLE, "rb") as f:
+        original = f.read()
+
+    compressed = client.get(url, headers={"Accept-Encoding": "gzip"})
+    plain = client.get(url, headers={"Accept-Encoding": "identity"})
+
+    assert compressed.headers["Content-Encoding"] == "gzip"
+    assert gzip.decompress(compressed.data) == original
+    assert "Accept-Encoding" in compressed.vary
+    assert "Content-Encoding" not in plain.headers
+    assert plain.data == original
+    assert "Accept-Encoding" in plain.vary
@@ -0,0 +1,51 @@
+import os
+import stat
+
+import pytest
+
+from cache import FileCache, RedisCache
+
+
+def test_file_cache_round_trips_json(tmp_path):
+    cache = FileCache(str(tmp_path / "cache"), ttl=60)
+    cache.set("user:1", {"id": 1, "name": "Sam", "age": None})
+
+    assert cache.get("user:1") == {"id": 1, "name": "Sam", "age": None}
+    assert stat.S_IMODE(os.stat(tmp_path / "cache").st_mode) & 0o077 == 0
+
+
+def test_file_cache_ignores_entries_that_are_not_json(tmp_path):
+    cache = FileCache(str(tmp_path / "cache"), ttl=60)
+    with open(cache._path("user:1"), "wb") as f:
+        f.write(b"\x80\x05K\x01.")
+
+    assert cache.get("user:1") is None
+
+
+def test_file_cache_refuses_a_directory_others_can_write(tmp_path):
+    shared = tmp_path / "shared"
+    shared.mkdir()
+    shared.chmod(0o777)
+
+    with pytest.raises(PermissionError):
+        FileCache(str(shared))
+
+
+class FakeRedis:
+    def __init__(self):
+        self.values = {}
+
+    def get(self, key):
+        return self.values.get(key)
+
+    def set(self, key, value, ex=None):
+        self.values[key] = value.encode() if isinstance(value, str) else value
+
+
+def test_redis_cache_stores_json():
+    client = FakeRedis()
+    cache = RedisCache(ttl=60, prefix="lms:page:", client=client)
+    cache.set("page:my_courses:abc", "<html>")
+
+    assert client.values["lms:page:page:my_courses:abc"] == b'"<html>"'
+    assert cache.get("page:my_courses:abc") == "<html>"
@@ -0,0 +1,43 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import update
+
+from models import db, Assignments, StudentCourseProgress
+
+
+def pass_deadline(assignment):
+    """What the clock does: the deadline and the progress rows pointing at it are now in the past, no row event fires."""
+    passed = datetime.now() - timedelta(minutes=1)
+    db.session.execute(update(StudentCourseProgress.__table__)
+                       .where(StudentCourseProgress.next_deadline == assignment.deadline)
+                       .values(next_deadline=passed))
+    db.session.execute(update(Assignments.__table__).where(Assignments.id == assignment.id).values(deadline=passed))
+    db.session.commit()
+
+
+def test_cached_dashboard_moves_on_when_a_deadline_passes(make_user, make_course, log_in):
+    student = make_user("Sam One")
+    course = make_course("Algebra", make_user("Ina Structor", status="instr"), students=[student], assignments=2)
+    first, second = sorted(course.assignment, key=lambda assignment: assignment.deadline)
+    client = log_in(student)
+
+    page = client.get("/my_courses").get_data(as_text=True)
+    assert f"Next deadline: {first.deadline:%Y-%m-%d %H:%M}" in page
+    assert client.get("/my_courses").get_data(as_text=True) == page
+
+    pass_deadline(first)
+
+    page = client.get("/my_courses").get_data(as_text=True)
+    assert f"Next deadline: {second.deadline:%Y-%m-%d %H:%M}" in page
+
+
+def test_course_summaries_refresh_passed_deadlines(make_user, make_course):
+    from course_progress import load_course_summaries
+
+    students = [make_user("Sam One"), make_user("Sam Two")]
+    course = make_course("Algebra", make_user("Ina Structor", status="instr"), students=students, assignments=2)
+    first, second = sorted(course.assignment, key=lambda assignment: assignment.deadline)
+
+    pass_deadline(first)
+
+    assert load_course_summaries([course.id])[course.id]["next_deadline"] == second.deadline
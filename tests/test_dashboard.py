@@ -0,0 +1,58 @@
+from contextlib import contextmanager
+
+from sqlalchemy import event
+
+from models import db, Submission
+
+
+@contextmanager
+def count_statements():
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(db.engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(db.engine, "before_cursor_execute", before_cursor_execute)
+
+
+def dashboard_statements(student_id):
+    from app import load_student_dashboard
+
+    db.session.expire_all()
+    with count_statements() as statements:
+        courses = load_student_dashboard(student_id)
+    return len(courses), len(statements)
+
+
+def test_dashboard_query_count_does_not_grow_with_courses(make_user, make_course):
+    instructor = make_user("Ina Structor", status="instr")
+    one_course = make_user("Sam One")
+    many_courses = make_user("Sam Many")
+
+    make_course("Single", instructor, students=[one_course, many_courses], assignments=1)
+    for number in range(8):
+        course = make_course(f"Course {number}", instructor, students=[many_courses], assignments=15)
+        for assignment in course.assignment[::2]:
+            db.session.add(Submission(assignment_id=assignment.id, student_id=many_courses.id, content="done"))
+    db.session.commit()
+
+    assert dashboard_statements(one_course.id) == (1, dashboard_statements(many_courses.id)[1])
+    assert dashboard_statements(many_courses.id)[0] == 9
+
+
+def test_dashboard_marks_submitted_assignments(make_user, make_course):
+    from app import load_student_dashboard
+
+    instructor = make_user("Ina Structor", status="instr")
+    student = make_user("Sam One")
+    course = make_course("Single", instructor, students=[student], assignments=2)
+    done, pending = course.assignment
+    db.session.add(Submission(assignment_id=done.id, student_id=student.id, content="done"))
+    db.session.commit()
+
+    [entry] = load_student_dashboard(student.id)
+    assert {assignment.id: assignment.is_done for assignment in entry["assignments"]} == {done.id: True, pending.id: False}
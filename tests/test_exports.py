@@ -0,0 +1,62 @@
+import json
+import os
+from datetime import timedelta
+
+import exports
+import jobs
+from models import db, Job
+
+
+def test_export_no_worker_starts_is_reported_as_failed(app, make_user, log_in):
+    admin = make_user("Ada Min", status="admin")
+    export_job = exports.queue_export("course", 1, admin.id, "Algebra archive.zip")
+    db.session.commit()
+    client = log_in(admin)
+
+    assert b"Status: queued" in client.get(f"/exports/{export_job.id}").data
+
+    export_job.created_at = jobs.utcnow() - timedelta(seconds=app.config["EXPORT_QUEUE_TIMEOUT"] + 1)
+    db.session.commit()
+
+    assert b"could not be created" in client.get(f"/exports/{export_job.id}").data
+    db.session.refresh(export_job)
+    assert export_job.status == "failed"
+
+
+def test_job_workers_start_with_the_first_request(app, monkeypatch):
+    monkeypatch.setenv("LMS_JOB_WORKERS", "1")
+    jobs.init_jobs(app)
+    pool = app.extensions["job_workers"]
+    assert pool.threads == []
+
+    app.test_client().get("/login")
+    try:
+        assert [thread.is_alive() for thread in pool.threads] == [True]
+    finally:
+        pool.shutdown()
+
+
+def test_long_export_keeps_its_lock_while_streaming(app, make_user, make_course, monkeypatch):
+    admin = make_user("Ada Min", status="admin")
+    course = make_course("Algebra", make_user("Ina Structor", status="instr"))
+    export_job = exports.queue_export("course", course.id, admin.id, "Algebra archive.zip")
+    db.session.commit()
+    claimed = jobs.claim("worker-1")
+    # As if the build had been running for longer than the lock timeout
+    claimed.locked_at = jobs.utcnow() - timedelta(seconds=jobs.LOCK_TIMEOUT + 1)
+    db.session.commit()
+
+    monkeypatch.setattr(jobs, "HEARTBEAT_INTERVAL", 0)
+    stream_archive = exports.stream_archive
+
+    def slow_stream(kind, object_id):
+        for chunk in stream_archive(kind, object_id):
+            yield chunk
+            assert jobs.requeue_stale() == 0
+
+    monkeypatch.setattr(exports, "stream_archive", slow_stream)
+
+    assert jobs.run(claimed)
+    assert db.session.get(Job, export_job.id).status == "done"
+    path = exports.export_path(json.loads(export_job.payload)["token"])
+    assert os.listdir(os.path.dirname(path)) == [os.path.basename(path)]
@@ -0,0 +1,28 @@
+import io
+
+
+def upload(client, course, data):
+    return client.post(f"/upload_materials/{course.id}", data={
+        "file": (io.BytesIO(data), "handout.pdf"), "description": "Week 1",
+    }, content_type="multipart/form-data")
+
+
+def test_reuploaded_material_is_served_at_once(make_user, make_course, log_in):
+    instructor = make_user("Ina Structor", status="instr")
+    student = make_user("Sam One")
+    course = make_course("Algebra", instructor, students=[student])
+    teacher = log_in(instructor)
+    reader = log_in(student)
+    url = f"/files/{course.id}/handout.pdf"
+
+    assert upload(teacher, course, b"first version").status_code == 302
+    first = reader.get(url)
+    assert first.data == b"first version"
+    assert "no-cache" in first.headers["Cache-Control"] and "max-age" not in first.headers["Cache-Control"]
+    assert reader.get(url, headers={"If-None-Match": first.headers["ETag"]}).status_code == 304
+
+    assert upload(teacher, course, b"corrected version").status_code == 302
+    second = reader.get(url, headers={"If-None-Match": first.headers["ETag"]})
+
+    assert second.status_code == 200
+    assert second.data == b"corrected version"
@@ -0,0 +1,100 @@
+from contextlib import contextmanager
+
+import pytest
+from sqlalchemy import event
+
+from models import db, Grade, Submission
+
+
+@pytest.fixture
+def submission(make_user, make_course):
+    instructor = make_user("Ina Structor", status="instr")
+    student = make_user("Sam One")
+    course = make_course("Algebra", instructor, students=[student])
+    submission = Submission(assignment_id=course.assignment[0].id, student_id=student.id, content="42")
+    db.session.add(submission)
+    db.session.commit()
+    return submission
+
+
+@contextmanager
+def course_lookups():
+    """Collect the statements that look up an assignment's course while the block runs."""
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if statement.startswith("SELECT assignments.course_id \nFROM"):
+            statements.append(statement)
+
+    event.listen(db.engine, "before_cursor_execute", record)
+    try:
+        yield statements
+    finally:
+        event.remove(db.engine, "before_cursor_execute", record)
+
+
+def grades_of(submission):
+    return db.session.execute(
+        db.select(Grade.grade).where(Grade.assignment_id == submission.assignment_id)
+    ).scalars().all()
+
+
+def test_grading_twice_keeps_the_first_grade(submission, log_in):
+    client = log_in(submission.assignment.course.instructor)
+    url = f"/grade_submission/{submission.id}"
+
+    assert client.post(url, data={"grade": 9}).status_code == 302
+    response = client.post(url, data={"grade": 3})
+
+    assert response.status_code == 302
+    assert grades_of(submission) == [9]
+
+
+def test_grade_row_written_elsewhere_is_reported_not_raised(submission, log_in):
+    db.session.add(Grade(student_id=submission.student_id, course_id=submission.assignment.course_id,
+                         assignment_id=submission.assignment_id, grade=7))
+    db.session.commit()
+    client = log_in(submission.assignment.course.instructor)
+
+    response = client.post(f"/grade_submission/{submission.id}", data={"grade": 3})
+
+    assert response.status_code == 302
+    assert grades_of(submission) == [7]
+
+
+def test_only_the_course_instructor_can_grade(submission, make_user, log_in):
+    client = log_in(make_user("Other Instructor", status="instr"))
+
+    assert client.post(f"/grade_submission/{submission.id}", data={"grade": 3}).status_code == 403
+    assert client.get(f"/grade_submission/{submission.id}").status_code == 403
+    assert grades_of(submission) == []
+
+
+def test_batch_grading_reuses_the_loaded_assignments(make_user, make_course, log_in):
+    instructor = make_user("Ina Structor", status="instr")
+    students = [make_user(f"Sam {n}") for n in range(3)]
+    course = make_course("Algebra", instructor, students=students)
+    submissions = [Submission(assignment_id=course.assignment[0].id, student_id=student.id, content="42") for student in students]
+    db.session.add_all(submissions)
+    db.session.commit()
+    client = log_in(instructor)
+
+    with course_lookups() as lookups:
+        response = client.post("/grade_assignments", data={f"grade-{submission.id}": 8 for submission in submissions})
+
+    assert response.status_code == 302
+    assert lookups == []
+    assert len(grades_of(submissions[0])) == 3
+
+
+def test_submission_listeners_share_one_course_lookup(make_user, make_course):
+    students = [make_user(f"Sam {n}") for n in range(3)]
+    course = make_course("Algebra", make_user("Ina Structor", status="instr"), students=students)
+    submissions = [Submission(assignment_id=course.assignment[0].id, student_id=student.id, content="42") for student in students]
+    db.session.expire_all()
+
+    with course_lookups() as lookups:
+        db.session.add_all(submissions)
+        db.session.commit()
+
+    assert len(lookups) == 1
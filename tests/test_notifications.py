@@ -0,0 +1,24 @@
+from datetime import datetime, timedelta
+
+import notifications
+from models import db, Enrollment, Notification
+
+
+def test_unenrolled_student_loses_the_course_notifications(make_user, make_course):
+    student, classmate = make_user("Sam One"), make_user("Sam Two")
+    instructor = make_user("Ina Structor", status="instr")
+    course = make_course("Algebra", instructor, students=[student, classmate],
+                         deadline=datetime.now() + timedelta(hours=2))
+    other = make_course("Biology", instructor, students=[student], deadline=datetime.now() + timedelta(hours=3))
+
+    assert notifications.scan_deadlines(None, datetime.now())[notifications.REMINDER] == 3
+
+    enrollment = db.session.execute(
+        db.select(Enrollment).where(Enrollment.course_id == course.id, Enrollment.student_id == student.id)
+    ).scalar_one()
+    db.session.delete(enrollment)
+    db.session.commit()
+
+    remaining = db.session.execute(db.select(Notification.user_id, Notification.course_id)).all()
+    assert sorted(remaining) == sorted([(classmate.id, course.id), (student.id, other.id)])
+    assert notifications.scan_deadlines(None, datetime.now())[notifications.REMINDER] == 0
@@ -0,0 +1,51 @@
+import pytest
+from werkzeug.exceptions import BadRequest
+
+from pagination import encode_cursor, decode_cursor
+
+
+def test_cursor_round_trip():
+    assert decode_cursor(encode_cursor(["Sam", 7])) == ["Sam", 7]
+
+
+@pytest.mark.parametrize("cursor", ["MQ", "eyJhIjogMX0", "W1tdXQ", "not base64!", "gA"])
+def test_malformed_cursors_are_bad_requests(cursor):
+    # 1, {"a": 1}, [[]], garbage and bytes that are not UTF-8
+    with pytest.raises(BadRequest):
+        decode_cursor(cursor)
+
+
+def test_listing_with_a_scalar_cursor_is_a_400(make_user, log_in):
+    admin = make_user("Ada Min", status="admin")
+    client = log_in(admin)
+
+    assert client.get("/students?after=MQ").status_code == 400
+    assert client.get("/api/courses?after=MQ").status_code == 400
+
+
+def test_search_ignores_case(make_user, log_in):
+    admin = make_user("Ada Min", status="admin")
+    make_user("John Smith")
+    make_user("Johanna Jones")
+    make_user("Mary Major")
+    client = log_in(admin)
+
+    found = client.get("/api/students?q=jOh").get_json()["items"]
+
+    assert [student["name"] for student in found] == ["Johanna Jones", "John Smith"]
+
+
+def test_search_uses_the_lowercase_indexes(app):
+    from sqlalchemy import select
+
+    from models import db, User
+    from pagination import search_filter
+
+    statement = select(User.id).where(User.status == "student", search_filter([User.name, User.email], "jo"))
+    compiled = statement.compile(db.engine)
+    plan = db.session.connection().exec_driver_sql(
+        f"EXPLAIN QUERY PLAN {compiled}", tuple(compiled.params[name] for name in compiled.positiontup)
+    ).all()
+    details = " ".join(row[-1] for row in plan)
+
+    assert "ix_user_status_lower_name" in details and "ix_user_status_lower_email" in details
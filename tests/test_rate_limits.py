@@ -0,0 +1,56 @@
+import pytest
+from sqlalchemy import event
+
+import rate_limits
+from models import db
+
+
+@pytest.fixture
+def limited(app):
+    app.config["RATE_LIMITS"] = rate_limits.parse_limits("log_in:ip=100/60,username=2/300;register:ip=2/600")
+    rate_limits.buckets.clear()
+    yield app.test_client()
+    rate_limits.buckets.clear()
+
+
+@pytest.fixture
+def account_lookups(app):
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if "FROM user_account" in statement:
+            statements.append(statement)
+
+    event.listen(db.engine, "before_cursor_execute", record)
+    yield statements
+    event.remove(db.engine, "before_cursor_execute", record)
+
+
+def test_login_attempts_per_username_are_limited(limited, make_user, account_lookups):
+    make_user("Sam One")
+    attempt = {"username": "sam.one", "password": "wrong"}
+
+    for _ in range(2):
+        assert limited.post("/login", data=attempt).status_code != 429
+    assert account_lookups
+
+    account_lookups.clear()
+    response = limited.post("/login", data=attempt)
+
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) > 0
+    assert account_lookups == []
+    # Another username from the same address still gets through
+    assert limited.post("/login", data={"username": "someone.else", "password": "wrong"}).status_code != 429
+
+
+def test_registrations_per_ip_are_limited(limited):
+    for _ in range(2):
+        assert limited.post("/register", data={}).status_code != 429
+
+    response = limited.post("/register", data={})
+
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) > 0
+    # Only attempts are counted
+    assert limited.get("/register").status_code == 200
@@ -0,0 +1,48 @@
+from sqlalchemy import event, select
+
+from models import db, Submission, SiteCounter
+
+
+def counters():
+    return dict(db.session.execute(select(SiteCounter.name, SiteCounter.value)).all())
+
+
+def submissions_for(make_user, make_course, students=3):
+    students = [make_user(f"Sam {n}") for n in range(students)]
+    course = make_course("Algebra", make_user("Ina Structor", status="instr"), students=students)
+    return [Submission(assignment_id=course.assignment[0].id, student_id=student.id, content="42") for student in students]
+
+
+def test_one_counter_update_per_counter_and_commit(make_user, make_course):
+    submissions = submissions_for(make_user, make_course)
+    before = counters()
+    updates = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if statement.startswith("UPDATE site_counter"):
+            updates.append(parameters)
+
+    event.listen(db.engine, "before_cursor_execute", record)
+    try:
+        db.session.add_all(submissions)
+        db.session.flush()
+        db.session.commit()
+    finally:
+        event.remove(db.engine, "before_cursor_execute", record)
+
+    assert len(updates) == 2
+    after = counters()
+    assert after["submissions"] == before.get("submissions", 0) + 3
+    assert after["ungraded_submissions"] == before.get("ungraded_submissions", 0) + 3
+
+
+def test_rolled_back_changes_are_not_counted(make_user, make_course):
+    submissions = submissions_for(make_user, make_course)
+    before = counters()
+
+    db.session.add_all(submissions)
+    db.session.flush()
+    db.session.rollback()
+    db.session.commit()
+
+    assert counters() == before
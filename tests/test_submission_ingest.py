@@ -0,0 +1,38 @@
+import os
+from datetime import datetime
+
+import submission_ingest
+from submission_ingest import GroupCommitter
+
+
+def test_committer_starts_with_the_first_request(app, monkeypatch):
+    monkeypatch.setenv("LMS_SUBMISSION_GROUP_COMMIT", "on")
+    submission_ingest.init_submission_ingest(app)
+    committer = app.extensions["submission_committer"]
+    assert committer.thread is None
+
+    app.test_client().get("/login")
+    try:
+        assert committer.thread.is_alive()
+    finally:
+        committer.shutdown()
+
+
+def test_record_that_keeps_failing_is_set_aside(app, monkeypatch):
+    def broken_apply_batch(records):
+        raise RuntimeError("cannot store this one")
+
+    monkeypatch.setattr(submission_ingest, "apply_batch", broken_apply_batch)
+    monkeypatch.setattr(submission_ingest, "CLAIM_TIMEOUT", -1)
+    record = submission_ingest.new_record(1, 1, "text", None, None, datetime.now())
+    submission_ingest.stage(record)
+    committer = GroupCommitter(app)
+
+    for attempt in range(submission_ingest.MAX_ATTEMPTS):
+        assert committer.commit_pending()
+        submission_ingest.requeue_stale_claims()
+
+    folder = submission_ingest.staging_folder()
+    assert not committer.commit_pending()
+    [failed] = os.listdir(os.path.join(folder, "failed"))
+    assert record["id"] in failed
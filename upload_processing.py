@@ -0,0 +1,152 @@
+"""Post-processing of stored uploads, run by the background workers.
+
+``save_upload`` queues a ``process_upload`` job the first time a file's
+content is stored. The job scans the file for viruses, extracts the text of
+PDFs and renders a thumbnail of PDFs and images, and records the results on
+the ``StoredFile`` row. Each step uses a tool only if it is installed, and is
+skipped otherwise:
+
+- scanning runs ``LMS_VIRUS_SCANNER`` (default: ``clamdscan`` or ``clamscan``
+  if found on the PATH), where exit status 0 means clean and 1 infected;
+- text extraction needs the ``pypdf`` package;
+- thumbnails need ``Pillow``, plus the ``pdftoppm`` tool for PDFs.
+
+Downloads of a file whose scan found a virus are refused.
+"""
+import os
+import shlex
+import shutil
+import subprocess
+import tempfile
+
+from flask import current_app
+
+from jobs import job
+from models import db, StoredFile
+
+THUMBNAIL_SIZE = (320, 320)
+SCAN_TIMEOUT = 300
+IMAGE_SIGNATURES = (b"\x89PNG", b"\xff\xd8\xff", b"GIF8")
+
+
+def scanner_command():
+    configured = os.environ.get("LMS_VIRUS_SCANNER")
+    if configured:
+        return shlex.split(configured)
+
+    for name in ("clamdscan", "clamscan"):
+        if shutil.which(name):
+            return [name, "--no-summary"]
+    return None
+
+
+def derived_path(stored, suffix):
+    """Relative path for a file derived from ``stored``, next to the store's content files."""
+    return os.path.join(current_app.config["UPLOAD_STORE_FOLDER"], "derived", stored.sha256[:2], stored.sha256 + suffix)
+
+
+def absolute(relative_path):
+    return os.path.join(current_app.root_path, relative_path)
+
+
+def write_atomically(relative_path, data):
+    target = absolute(relative_path)
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(target), prefix=".tmp-")
+    with os.fdopen(fd, "wb") as f:
+        f.write(data)
+    os.replace(temp_path, target)
+
+
+def file_kind(path):
+    with open(path, "rb") as f:
+        head = f.read(8)
+
+    if head.startswith(b"%PDF"):
+        return "pdf"
+    if head.startswith(IMAGE_SIGNATURES):
+        return "image"
+    return None
+
+
+def scan(path):
+    command = scanner_command()
+    if command is None:
+        return "unscanned"
+
+    result = subprocess.run(command + [path], capture_output=True, timeout=SCAN_TIMEOUT)
+    if result.returncode == 0:
+        return "clean"
+    if result.returncode == 1:
+        return "infected"
+    # Scanner errors are raised so the job is retried
+    raise RuntimeError(f"Virus scanner exited with {result.returncode}: {result.stderr.decode(errors='replace')[:500]}")
+
+
+def extract_pdf_text(path):
+    try:
+        from pypdf import PdfReader
+    except ImportError:
+        return None
+
+    reader = PdfReader(path)
+    return "\n".join(page.extract_text() or "" for page in reader.pages)
+
+
+def render_thumbnail(path, kind):
+    try:
+        from PIL import Image
+    except ImportError:
+        return None
+
+    with tempfile.TemporaryDirectory() as directory:
+        if kind == "pdf":
+            if not shutil.which("pdftoppm"):
+                return None
+            prefix = os.path.join(directory, "page")
+            subprocess.run(["pdftoppm", "-png", "-singlefile", "-f", "1", "-l", "1", "-r", "50", path, prefix],
+                           check=True, capture_output=True, timeout=SCAN_TIMEOUT)
+            path = prefix + ".png"
+
+        with Image.open(path) as image:
+            image.thumbnail(THUMBNAIL_SIZE)
+            output = os.path.join(directory, "thumbnail.png")
+            image.convert("RGB").save(output, "PNG")
+
+        with open(output, "rb") as f:
+            return f.read()
+
+
+@job("process_upload")
+def process_upload(sha256):
+    stored = db.session.get(StoredFile, sha256)
+    if stored is None:
+        return
+
+    path = absolute(stored.path)
+    stored.scan_status = scan(path)
+    if stored.scan_status == "infected":
+        db.session.commit()
+        return
+
+    kind = file_kind(path)
+    if kind == "pdf" and stored.text_path is None:
+        text = extract_pdf_text(path)
+        if text is not None:
+            stored.text_path = derived_path(stored, ".txt")
+            write_atomically(stored.text_path, text.encode("utf-8"))
+
+    if kind is not None and stored.thumbnail_path is None:
+        thumbnail = render_thumbnail(path, kind)
+        if thumbnail is not None:
+            stored.thumbnail_path = derived_path(stored, ".thumb.png")
+            write_atomically(stored.thumbnail_path, thumbnail)
+
+    db.session.commit()
+
+
+def is_quarantined(relative_path):
+    """Whether the stored file at ``relative_path`` was found to contain a virus."""
+    # Files in the store are named after their SHA-256, so this is a primary key lookup
+    stored = db.session.get(StoredFile, os.path.basename(relative_path))
+    return stored is not None and stored.path == relative_path and stored.scan_status == "infected"
@@ -0,0 +1,164 @@
+"""Streaming, content-addressed storage for uploaded files.
+
+Werkzeug asks the request for a file object to write each multipart upload
+into. ``UploadRequest`` hands it a ``HashingFile`` in the store's temp folder,
+which hashes the bytes and enforces the route's size limit as the chunks are
+parsed, so an oversized upload is rejected without being spooled in full and
+an accepted one is never copied a second time. ``save_upload`` then renames
+the temp file to ``<store>/<aa>/<sha256>``; uploading the same bytes again (the
+same PDF in several courses, two students' identical ``report.pdf``) reuses
+the stored copy. New content also queues a ``process_upload`` background job
+(see upload_processing).
+"""
+import hashlib
+import os
+import shutil
+import tempfile
+from collections import namedtuple
+
+from flask import current_app, request
+from flask.wrappers import Request
+from sqlalchemy.exc import IntegrityError
+from werkzeug.exceptions import RequestEntityTooLarge
+
+from jobs import enqueue
+from models import db, StoredFile
+
+CHUNK_SIZE = 64 * 1024
+MB = 1024 * 1024
+
+StoredUpload = namedtuple("StoredUpload", ["sha256", "size", "path"])
+
+
+class UploadTooLarge(RequestEntityTooLarge):
+    description = "The uploaded file is larger than this page allows."
+
+
+def init_uploads(app):
+    app.request_class = UploadRequest
+    app.config.setdefault("UPLOAD_STORE_FOLDER", os.path.join("uploads", "store"))
+    # Per-endpoint limits in bytes, checked against Content-Length before the body is parsed
+    app.config.setdefault("UPLOAD_LIMITS", {
+        "upload_course_material": 100 * MB,
+        "add_assignment": 25 * MB,
+        "solve_assignment": 25 * MB,
+        "bulk_import_view": 100 * MB,
+    })
+    # Hard ceiling for every other endpoint, enforced by Werkzeug itself (Flask's default is None, not missing)
+    if app.config.get("MAX_CONTENT_LENGTH") is None:
+        app.config["MAX_CONTENT_LENGTH"] = max(app.config["UPLOAD_LIMITS"].values()) + MB
+
+    @app.before_request
+    def reject_oversized_uploads():
+        limit = upload_limit()
+        if limit is not None and request.content_length is not None and request.content_length > limit:
+            raise UploadTooLarge()
+
+    @app.teardown_request
+    def remove_unsaved_uploads(exception=None):
+        # Temp files that save_upload() did not move into the store
+        for stream in request.__dict__.get("upload_streams", ()):
+            stream.discard()
+
+
+def upload_limit():
+    return current_app.config["UPLOAD_LIMITS"].get(request.endpoint)
+
+
+def store_root():
+    return os.path.join(current_app.root_path, current_app.config["UPLOAD_STORE_FOLDER"])
+
+
+class HashingFile:
+    """Temp file that hashes and counts what is written to it."""
+
+    def __init__(self, directory, limit=None):
+        os.makedirs(directory, exist_ok=True)
+        self.file = tempfile.NamedTemporaryFile(dir=directory, prefix="upload-", delete=False)
+        self.limit = limit
+        self.size = 0
+        self.sha256 = hashlib.sha256()
+
+    def write(self, data):
+        self.size += len(data)
+        if self.limit is not None and self.size > self.limit:
+            self.discard()
+            raise UploadTooLarge()
+
+        self.sha256.update(data)
+        return self.file.write(data)
+
+    def discard(self):
+        self.file.close()
+        if os.path.exists(self.file.name):
+            os.unlink(self.file.name)
+
+    def __getattr__(self, name):
+        return getattr(self.file, name)
+
+    def __iter__(self):
+        return iter(self.file)
+
+
+class UploadRequest(Request):
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        stream = HashingFile(os.path.join(store_root(), "tmp"), upload_limit())
+        self.__dict__.setdefault("upload_streams", []).append(stream)
+        return stream
+
+
+def save_upload(file, record=True):
+    """Move an uploaded ``FileStorage`` into the content-addressed store and return its ``StoredUpload``.
+
+    With ``record=False`` the file is only moved; the caller passes the result
+    to ``record_upload`` later, in the transaction that references it.
+    """
+    root = store_root()
+    stream = file.stream
+
+    if not isinstance(stream, HashingFile):
+        # Small uploads Werkzeug kept in memory, or files not coming from a request
+        stream.seek(0)
+        hashing_file = HashingFile(os.path.join(root, "tmp"), None)
+        shutil.copyfileobj(stream, hashing_file, CHUNK_SIZE)
+        stream = hashing_file
+
+    stream.flush()
+    os.fsync(stream.fileno())
+    stream.close()
+
+    digest = stream.sha256.hexdigest()
+    relative_path = os.path.join(current_app.config["UPLOAD_STORE_FOLDER"], digest[:2], digest)
+    target = os.path.join(current_app.root_path, relative_path)
+
+    if os.path.exists(target):
+        os.unlink(stream.name)
+    else:
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        os.replace(stream.name, target)
+
+    stored = StoredUpload(digest, stream.size, relative_path)
+    if record:
+        record_upload(stored)
+    return stored
+
+
+def record_upload(stored):
+    """Add the ``StoredFile`` row of a saved upload to the session, and queue its processing if it is new."""
+    if _record_stored_file(stored.sha256, stored.size, stored.path):
+        # Committed together with the caller's own changes; processed by the job workers
+        enqueue("process_upload", {"sha256": stored.sha256})
+
+
+def _record_stored_file(digest, size, path):
+    """Add the ``StoredFile`` row unless it exists; return whether this call added it."""
+    if db.session.get(StoredFile, digest) is not None:
+        return False
+
+    try:
+        with db.session.begin_nested():
+            db.session.add(StoredFile(sha256=digest, size=size, path=path))
+    except IntegrityError:
+        # Another request stored the same content first
+        return False
+    return True
@@ -0,0 +1,12 @@
+"""WSGI entry point for production servers, which create one application per worker process:
+
+    gunicorn --workers 4 --threads 8 wsgi:app
+
+Do not use ``--preload`` with ``LMS_SCHEDULER=on``: the scheduler is a thread
+started by ``create_app``, and threads do not survive the fork into the
+workers. The job workers and the submission committer start with the first
+request each worker serves.
+"""
+from app import create_app
+
+app = create_app()